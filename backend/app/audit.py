@@ -0,0 +1,207 @@
+import asyncio
+import time
+from datetime import UTC, datetime
+
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import settings
+from .database import AsyncSessionLocal, await_after_commit
+
+
+class AuditWriter:
+    """Background writer that batches audit log rows into multi-row inserts.
+
+    Entries are queued once the request's transaction commits and written by
+    a single task on the application's event loop, either when a batch is
+    full or when the flush interval elapses.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        batch_size: int = settings.AUDIT_BATCH_SIZE,
+        flush_interval: float = settings.AUDIT_FLUSH_INTERVAL,
+        max_queue_size: int = settings.AUDIT_QUEUE_SIZE,
+        enqueue_timeout: float = settings.AUDIT_ENQUEUE_TIMEOUT,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = None
+        self._stop_event = None
+        self._task = None
+        self.written = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Start the background flusher on the running event loop"""
+        if self.running:
+            return
+        # Queues and events belong to a loop, so they are created here
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._stop_event = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="audit-writer")
+
+    async def stop(self, timeout: float = 10.0):
+        """Stop the flusher and write everything still queued"""
+        if self._task is None:
+            return
+        self._stop_event.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except TimeoutError:
+            print("Audit writer did not stop in time")
+        self._task = None
+        # Anything submitted while we were shutting down
+        await self._drain()
+
+    async def submit(self, entry: dict) -> bool:
+        """Queue an entry, waiting briefly when the queue is full.
+
+        Returns False if the queue stayed full for the whole timeout, in which
+        case the caller is expected to write the entry itself.
+        """
+        try:
+            await asyncio.wait_for(self._queue.put(entry), self.enqueue_timeout)
+            return True
+        except TimeoutError:
+            return False
+
+    async def submit_committed(self, entries: list[dict]):
+        """Queue the entries of a committed transaction.
+
+        Waits for room like ``submit``; entries that still do not fit, or
+        arrive while the writer is stopped, are written directly.
+        """
+        rejected = [
+            entry
+            for entry in entries
+            if not (self.running and await self.submit(entry))
+        ]
+        if rejected:
+            await self._write(rejected)
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _run(self):
+        stopping = asyncio.ensure_future(self._stop_event.wait())
+        try:
+            while not self._stop_event.is_set():
+                batch = await self._collect_batch(stopping)
+                if batch:
+                    await self._write(batch)
+        finally:
+            stopping.cancel()
+        await self._drain()
+
+    async def _collect_batch(self, stopping) -> list[dict]:
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (self._stop_event.is_set() and not batch):
+                break
+            entry = await self._next_entry(stopping, remaining)
+            if entry is None:
+                break
+            batch.append(entry)
+        return batch
+
+    async def _next_entry(self, stopping, timeout: float):
+        """Wait for the next entry, giving up on timeout or shutdown"""
+        get = asyncio.ensure_future(self._queue.get())
+        await asyncio.wait(
+            {get, stopping}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+        )
+        # A get that already completed must not lose its entry
+        if get.cancel():
+            return None
+        return get.result()
+
+    async def _drain(self):
+        while self._queue is not None:
+            batch = []
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            if not batch:
+                return
+            await self._write(batch)
+
+    async def _write(self, batch: list[dict]):
+        try:
+            async with self.session_factory() as db:
+                await db.execute(insert(models.AuditLog), batch)
+                await db.commit()
+            self.written += len(batch)
+            return
+        except Exception as e:
+            if len(batch) == 1:
+                self.failed += 1
+                print(f"Audit log write error: {e}")
+                return
+            print(f"Audit log batch write error, retrying rows one by one: {e}")
+        # One bad row must not take the rest of the batch down with it
+        for entry in batch:
+            await self._write([entry])
+
+
+def build_audit_entry(
+    user_id: int,
+    action: str,
+    resource_type: str,
+    resource_id: int = None,
+    details: str = None,
+) -> dict:
+    """Build the column values for an audit row, stamped with the event time"""
+    return {
+        "user_id": user_id,
+        "action": action,
+        "resource_type": resource_type,
+        "resource_id": resource_id,
+        "details": details,
+        "created_at": datetime.now(UTC),
+    }
+
+
+# Global audit writer - started from the application lifespan
+audit_writer = AuditWriter()
+
+# Session.info key holding entries that wait for their transaction to commit
+PENDING_ENTRIES = "audit_entries"
+
+
+def submit_on_commit(db, entry: dict):
+    """Hand an entry to the audit writer once ``db`` commits.
+
+    Audit rows reference the users they describe, so they must not reach the
+    writer before the rows they point at are committed. Entries of a
+    transaction that rolls back are discarded with it.
+    """
+    if not db.in_transaction():
+        # A rollback without a transaction is silent, so make sure one exists
+        db.sync_session.begin()
+    db.info.setdefault(PENDING_ENTRIES, []).append(entry)
+
+
+@event.listens_for(Session, "after_commit")
+def _submit_committed_entries(session):
+    entries = session.info.pop(PENDING_ENTRIES, None)
+    if entries:
+        # Commit hooks cannot await, so get_db submits them once it has
+        await_after_commit(session, lambda: audit_writer.submit_committed(entries))
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_uncommitted_entries(session, transaction):
+    # Savepoints ending do not decide the fate of the outer transaction
+    if transaction.parent is None:
+        session.info.pop(PENDING_ENTRIES, None)
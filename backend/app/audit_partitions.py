@@ -0,0 +1,284 @@
+import gzip
+import os
+import re
+from datetime import UTC, datetime
+
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.exc import DBAPIError
+
+from . import models
+from .config import settings
+from .ndjson import dumps_line
+
+PARTITION_NAME = re.compile(r"audit_logs_p(\d{4})(\d{2})")
+DEFAULT_PARTITION = "audit_logs_default"
+
+
+def month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1, tzinfo=UTC)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=UTC)
+
+
+def partition_name(month: datetime) -> str:
+    return f"audit_logs_p{month:%Y%m}"
+
+
+def create_partition_sql(month: datetime) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF audit_logs "
+        f"FOR VALUES FROM ('{month.isoformat()}') "
+        f"TO ('{add_months(month, 1).isoformat()}')"
+    )
+
+
+def split_default_partition_sql(month: datetime) -> list[str]:
+    """Statements that move one month out of the default partition.
+
+    A month's partition cannot be created while the default partition holds
+    rows for it, so the default is detached while they are moved over.
+    """
+    in_month = (
+        f"created_at >= '{month.isoformat()}' "
+        f"AND created_at < '{add_months(month, 1).isoformat()}'"
+    )
+    name = partition_name(month)
+    return [
+        f"ALTER TABLE audit_logs DETACH PARTITION {DEFAULT_PARTITION}",
+        create_partition_sql(month),
+        f"INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} WHERE {in_month}",
+        f"DELETE FROM {DEFAULT_PARTITION} WHERE {in_month}",
+        f"ALTER TABLE audit_logs ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT",
+    ]
+
+
+def is_partitioned(conn) -> bool:
+    """Whether audit_logs is a partitioned PostgreSQL table"""
+    if conn.dialect.name != "postgresql":
+        return False
+    return bool(
+        conn.execute(
+            text(
+                "SELECT 1 FROM pg_partitioned_table p "
+                "JOIN pg_class c ON c.oid = p.partrelid "
+                "WHERE c.relname = 'audit_logs' "
+                "AND c.relnamespace = to_regnamespace(current_schema())"
+            )
+        ).first()
+    )
+
+
+def ensure_audit_partitions(
+    conn, months_ahead: int = None, start: datetime = None
+) -> list[str]:
+    """Create the monthly partitions from ``start`` through ``months_ahead``.
+
+    Returns the names of the partitions created. Does nothing unless
+    audit_logs is partitioned. A month whose rows already went to the default
+    partition is skipped with a warning; ``split_default_partition`` fixes it.
+    """
+    months_ahead = (
+        settings.AUDIT_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    )
+    if not is_partitioned(conn):
+        return []
+    current = month_start(datetime.now(UTC))
+    month = month_start(start) if start else current
+    existing = {name for name, _ in audit_partitions(conn)}
+    created = []
+    while month <= add_months(current, months_ahead):
+        name = partition_name(month)
+        if name not in existing:
+            try:
+                # A savepoint, so one month failing leaves the others possible
+                with conn.begin_nested():
+                    conn.execute(text(create_partition_sql(month)))
+                created.append(name)
+            except DBAPIError as e:
+                print(
+                    f"⚠️ Could not create audit partition {name}; if its rows are "
+                    f"in {DEFAULT_PARTITION}, run "
+                    f"`python -m app.manage split-audit-default-partition`: {e}"
+                )
+        month = add_months(month, 1)
+    return created
+
+
+def split_default_partition(bind) -> list[str]:
+    """Give every month with rows in the default partition its own partition.
+
+    Needed when the monthly create-audit-partitions run was missed. Each
+    month is moved in its own transaction, which locks audit_logs while it
+    runs. Returns the names of the partitions created.
+    """
+    if bind.dialect.name != "postgresql":
+        return []
+    with bind.connect() as conn:
+        if not is_partitioned(conn):
+            return []
+        months = conn.execute(
+            text(
+                "SELECT DISTINCT date_trunc('month', created_at AT TIME ZONE 'UTC') "
+                f"FROM {DEFAULT_PARTITION}"
+            )
+        ).scalars()
+        months = sorted(month_start(month) for month in months)
+    created = []
+    for month in months:
+        with bind.begin() as conn:
+            for statement in split_default_partition_sql(month):
+                conn.execute(text(statement))
+        created.append(partition_name(month))
+    return created
+
+
+def audit_partitions(conn) -> list[tuple[str, datetime]]:
+    """(name, month) of each monthly partition, oldest first"""
+    names = conn.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = 'audit_logs' "
+            "AND p.relnamespace = to_regnamespace(current_schema())"
+        )
+    ).scalars()
+    partitions = []
+    for name in names:
+        match = PARTITION_NAME.fullmatch(name)
+        if match:
+            month = datetime(int(match[1]), int(match[2]), 1, tzinfo=UTC)
+            partitions.append((name, month))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def partition_audit_log(bind) -> bool:
+    """Convert an existing unpartitioned audit_logs table on PostgreSQL.
+
+    Copies every row into a new partitioned table in one transaction, so run
+    it in a quiet period. Safe to run more than once.
+    """
+    if bind.dialect.name != "postgresql":
+        return False
+    with bind.begin() as conn:
+        if is_partitioned(conn):
+            return False
+        conn.execute(text("ALTER TABLE audit_logs RENAME TO audit_logs_unpartitioned"))
+        conn.execute(
+            text(
+                "ALTER SEQUENCE IF EXISTS audit_logs_id_seq "
+                "RENAME TO audit_logs_unpartitioned_id_seq"
+            )
+        )
+        for index in models.AuditLog.__table__.indexes:
+            conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+        models.AuditLog.__table__.create(conn)
+
+        oldest = conn.execute(
+            text("SELECT min(created_at) FROM audit_logs_unpartitioned")
+        ).scalar()
+        ensure_audit_partitions(conn, start=oldest)
+        names = [c.name for c in models.AuditLog.__table__.columns]
+        # created_at used to be nullable
+        values = [
+            "COALESCE(created_at, now())" if name == "created_at" else name
+            for name in names
+        ]
+        conn.execute(
+            text(
+                f"INSERT INTO audit_logs ({', '.join(names)}) "
+                f"SELECT {', '.join(values)} FROM audit_logs_unpartitioned"
+            )
+        )
+        conn.execute(
+            text(
+                "SELECT setval(pg_get_serial_sequence('audit_logs', 'id'), "
+                "COALESCE((SELECT max(id) FROM audit_logs), 0) + 1, false)"
+            )
+        )
+        conn.execute(text("DROP TABLE audit_logs_unpartitioned"))
+    return True
+
+
+def write_archive(rows, path: str) -> int:
+    """Write rows to a gzipped NDJSON file, atomically. Returns the row count."""
+    count = 0
+    partial = f"{path}.partial"
+    with gzip.open(partial, "wb") as f:
+        for row in rows:
+            f.write(dumps_line(dict(row)))
+            count += 1
+    os.replace(partial, path)
+    return count
+
+
+def archive_path(output_dir: str, month: datetime) -> str:
+    return os.path.join(output_dir, f"audit_logs_{month:%Y-%m}.ndjson.gz")
+
+
+def archive_audit_log(
+    bind,
+    output_dir: str,
+    retain_months: int = None,
+    batch_size: int = 5000,
+    now: datetime = None,
+) -> list[tuple[str, int]]:
+    """Archive whole months of audit rows older than the retention period.
+
+    Each month is written to its own gzipped NDJSON file before it is removed
+    from the database: on PostgreSQL by dropping its partition, elsewhere by
+    deleting the rows. Returns (path, rows) for each archived month.
+    """
+    retain_months = (
+        settings.AUDIT_RETENTION_MONTHS if retain_months is None else retain_months
+    )
+    cutoff = add_months(month_start(now or datetime.now(UTC)), -retain_months)
+    os.makedirs(output_dir, exist_ok=True)
+    # Stream rows with a server-side cursor rather than loading a month at once
+    streaming = {"stream_results": True, "yield_per": batch_size}
+
+    archived = []
+    if bind.dialect.name == "postgresql":
+        with bind.connect() as conn:
+            if not is_partitioned(conn):
+                raise ValueError("audit_logs is not partitioned")
+            partitions = [p for p in audit_partitions(conn) if p[1] < cutoff]
+        for name, month in partitions:
+            path = archive_path(output_dir, month)
+            with bind.connect() as conn:
+                rows = conn.execution_options(**streaming).execute(
+                    text(f"SELECT * FROM {name} ORDER BY created_at, id")
+                )
+                count = write_archive(rows.mappings(), path)
+            with bind.begin() as conn:
+                conn.execute(text(f"ALTER TABLE audit_logs DETACH PARTITION {name}"))
+                conn.execute(text(f"DROP TABLE {name}"))
+            archived.append((path, count))
+        return archived
+
+    table = models.AuditLog.__table__
+    with bind.connect() as conn:
+        oldest = conn.execute(select(func.min(table.c.created_at))).scalar()
+    if oldest is None:
+        return archived
+    month = month_start(oldest)
+    while month < cutoff:
+        end = add_months(month, 1)
+        in_month = (table.c.created_at >= month) & (table.c.created_at < end)
+        with bind.connect() as conn:
+            rows = conn.execution_options(**streaming).execute(
+                select(table).where(in_month).order_by(table.c.created_at, table.c.id)
+            )
+            path = archive_path(output_dir, month)
+            count = write_archive(rows.mappings(), path)
+        if count:
+            with bind.begin() as conn:
+                conn.execute(delete(table).where(in_month))
+            archived.append((path, count))
+        else:
+            os.remove(path)
+        month = end
+    return archived
@@ -1,3 +1,6 @@
+import asyncio
+import hashlib
+from dataclasses import dataclass
 from datetime import UTC, datetime, timedelta
 
 import bcrypt
@@ -5,11 +8,14 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from . import models
+from . import metrics, models
+from .cache import AsyncRedisCache, RedisCache, TTLCache, get_async_redis, get_redis
 from .config import settings
 from .database import get_db
+from .password_pool import PoolSaturatedError, password_pool
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -18,6 +24,31 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
 
+@dataclass(frozen=True)
+class AuthenticatedUser:
+    """The resolved principal for a request, safe to cache across sessions"""
+
+    id: int
+    email: str
+    created_at: datetime
+
+
+# Verified tokens (keyed by token hash) and resolved principals
+token_cache = TTLCache(
+    max_entries=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL
+)
+user_cache = TTLCache(max_entries=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL)
+redis_user_cache = None
+if settings.USER_CACHE_REDIS:
+    redis_client = get_async_redis()
+    if redis_client is not None:
+        redis_user_cache = AsyncRedisCache(
+            redis_client, "auth:user", settings.USER_CACHE_TTL
+        )
+# Redis deletes scheduled from synchronous ORM events, kept until they finish
+_pending_invalidations = set()
+
+
 def validate_password(password: str) -> str:
     """Validate password requirements"""
     if not password or len(password.strip()) == 0:
@@ -29,13 +60,67 @@ def validate_password(password: str) -> str:
     return password
 
 
+def _checkpw(password: bytes, hashed: bytes) -> bool:
+    # Timed on the pool thread, so time spent queued for it is not counted
+    with metrics.PASSWORD_DURATION.labels("verify").time():
+        return bcrypt.checkpw(password, hashed)
+
+
+def _hashpw(password: bytes, salt: bytes) -> bytes:
+    with metrics.PASSWORD_DURATION.labels("hash").time():
+        return bcrypt.hashpw(password, salt)
+
+
+def _pool_busy_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server is busy, please retry shortly",
+        headers={"Retry-After": str(settings.PASSWORD_POOL_RETRY_AFTER)},
+    )
+
+
+def run_password_work(fn, *args):
+    """Run bcrypt work on the password pool, failing fast when it is saturated"""
+    try:
+        return password_pool.run(fn, *args)
+    except PoolSaturatedError:
+        raise _pool_busy_exception() from None
+
+
+async def run_password_work_async(fn, *args):
+    """Async variant of run_password_work that leaves the event loop free"""
+    try:
+        return await password_pool.run_async(fn, *args)
+    except PoolSaturatedError:
+        raise _pool_busy_exception() from None
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
     try:
         # bcrypt handles password up to 72 bytes
-        return bcrypt.checkpw(
-            plain_password.encode("utf-8"), hashed_password.encode("utf-8")
+        return run_password_work(
+            _checkpw,
+            plain_password.encode("utf-8"),
+            hashed_password.encode("utf-8"),
         )
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Password verification error: {e}")
+        return False
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password against its hash without blocking the event loop"""
+    try:
+        return await run_password_work_async(
+            _checkpw,
+            plain_password.encode("utf-8"),
+            hashed_password.encode("utf-8"),
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Password verification error: {e}")
         return False
@@ -46,8 +131,34 @@ def get_password_hash(password: str) -> str:
     try:
         validated_password = validate_password(password)
         # bcrypt handles 72 byte limit
-        hashed = bcrypt.hashpw(validated_password.encode("utf-8"), bcrypt.gensalt())
+        hashed = run_password_work(
+            _hashpw, validated_password.encode("utf-8"), bcrypt.gensalt()
+        )
+        return hashed.decode("utf-8")
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)
+        ) from None
+    except Exception as e:
+        print(f"Password hasing error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error processing password",
+        ) from None
+
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password using bcrypt without blocking the event loop"""
+    try:
+        validated_password = validate_password(password)
+        hashed = await run_password_work_async(
+            _hashpw, validated_password.encode("utf-8"), bcrypt.gensalt()
+        )
         return hashed.decode("utf-8")
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)
@@ -74,39 +185,152 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     return encoded_jwt
 
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = db.query(models.User).filter(models.User.email == email).first()
+async def authenticate_user(db: AsyncSession, email: str, password: str):
+    result = await db.execute(select(models.User).where(models.User.email == email))
+    user = result.scalars().first()
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password_async(password, user.hashed_password):
         return False
     return user
 
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db),
-):
+async def get_cached_user(user_id: int) -> AuthenticatedUser | None:
+    principal = user_cache.get(user_id)
+    if principal is None and redis_user_cache is not None:
+        data = await redis_user_cache.get(user_id)
+        if data is not None:
+            principal = AuthenticatedUser(
+                id=data["id"],
+                email=data["email"],
+                created_at=datetime.fromisoformat(data["created_at"]),
+            )
+            user_cache.set(user_id, principal)
+    return principal
+
+
+async def cache_user(principal: AuthenticatedUser):
+    user_cache.set(principal.id, principal)
+    if redis_user_cache is not None:
+        await redis_user_cache.set(
+            principal.id,
+            {
+                "id": principal.id,
+                "email": principal.email,
+                "created_at": principal.created_at.isoformat(),
+            },
+        )
+
+
+def invalidate_user(user_id: int):
+    """Drop a user from every cache tier after it changed or was deleted"""
+    user_cache.delete(user_id)
+    if redis_user_cache is None:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # Maintenance scripts change users outside the event loop
+        client = get_redis()
+        if client is not None:
+            RedisCache(client, redis_user_cache.prefix, redis_user_cache.ttl).delete(
+                user_id
+            )
+        return
+    # Called from ORM events, which cannot await the delete
+    task = loop.create_task(redis_user_cache.delete(user_id))
+    _pending_invalidations.add(task)
+    task.add_done_callback(_pending_invalidations.discard)
+
+
+def clear_auth_caches():
+    token_cache.clear()
+    user_cache.clear()
+
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target):
+    invalidate_user(target.id)
+
+
+def decode_token_subject(token: str) -> int | None:
+    """Return the user id for a valid token, skipping verification when cached"""
+    token_key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    user_id = token_cache.get(token_key)
+    if user_id is not None:
+        return user_id
+
+    try:
+        payload = jwt.decode(
+            token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM]
+        )
+        user_id = int(payload.get("sub"))
+    except (JWTError, TypeError, ValueError):
+        return None
+
+    # Never keep a token around longer than it is valid
+    ttl = settings.USER_CACHE_TTL
+    if payload.get("exp"):
+        ttl = min(ttl, payload["exp"] - datetime.now(UTC).timestamp())
+    token_cache.set(token_key, user_id, ttl=ttl)
+    return user_id
+
+
+async def resolve_user(token: str, db: AsyncSession) -> AuthenticatedUser:
+    """Return the user a bearer token belongs to, or raise a 401"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    try:
-        payload = jwt.decode(
-            credentials.credentials,
-            settings.JWT_SECRET_KEY,
-            algorithms=[settings.JWT_ALGORITHM],
-        )
-        user_id: int = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception from None
+    user_id = decode_token_subject(token)
+    if user_id is None:
+        raise credentials_exception
+
+    principal = await get_cached_user(user_id)
+    if principal is not None:
+        return principal
 
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    user = await db.get(models.User, user_id)
 
     if user is None:
         raise credentials_exception
-    return user
+
+    principal = AuthenticatedUser(
+        id=user.id, email=user.email, created_at=user.created_at
+    )
+    await cache_user(principal)
+    return principal
+
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_db, scope="function"),
+) -> AuthenticatedUser:
+    return await resolve_user(credentials.credentials, db)
+
+
+async def get_streaming_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_db),
+) -> AuthenticatedUser:
+    """get_current_user on the request-scoped session a streamed response reads"""
+    return await resolve_user(credentials.credentials, db)
+
+
+def is_admin(principal: AuthenticatedUser) -> bool:
+    admins = {e.strip().lower() for e in settings.ADMIN_EMAILS.split(",") if e.strip()}
+    return principal.email.lower() in admins
+
+
+async def get_current_admin(
+    current_user: AuthenticatedUser = Depends(get_current_user),
+) -> AuthenticatedUser:
+    """Require a user listed in ADMIN_EMAILS"""
+    if not is_admin(current_user):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required"
+        )
+    return current_user
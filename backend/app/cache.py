@@ -0,0 +1,230 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from .config import settings
+
+
+class TTLCache:
+    """Thread-safe in-process LRU cache with per-entry expiry.
+
+    Entries are evicted least recently used first once ``max_entries`` is
+    reached, or once ``max_bytes`` is exceeded when a ``sizeof`` function is
+    given to weigh the values.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 60.0,
+        max_bytes: int = None,
+        sizeof=None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            value, expires_at, size = item
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        size = self.sizeof(value) if self.sizeof else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, time.monotonic() + ttl, size)
+            self._bytes += size
+            while len(self._data) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._data)))
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def delete_where(self, predicate) -> int:
+        """Delete every entry whose value matches predicate(value)"""
+        with self._lock:
+            keys = [key for key, item in self._data.items() if predicate(item[0])]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _remove(self, key):
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+
+class RedisCache:
+    """JSON cache tier shared between workers through Redis.
+
+    Redis errors are logged and treated as cache misses so an unavailable
+    Redis never fails a request.
+    """
+
+    def __init__(self, client, prefix: str, ttl: int):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key):
+        try:
+            raw = self.client.get(f"{self.prefix}:{key}")
+        except Exception as e:
+            print(f"Redis cache error: {e}")
+            return None
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl: int = None):
+        try:
+            self.client.set(
+                f"{self.prefix}:{key}", json.dumps(value), ex=ttl or self.ttl
+            )
+        except Exception as e:
+            print(f"Redis cache error: {e}")
+
+    def delete(self, key):
+        try:
+            self.client.delete(f"{self.prefix}:{key}")
+        except Exception as e:
+            print(f"Redis cache error: {e}")
+
+
+class AsyncRedisCache:
+    """RedisCache for the asyncio client, so lookups never block the loop"""
+
+    def __init__(self, client, prefix: str, ttl: int):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    async def get(self, key):
+        try:
+            raw = await self.client.get(f"{self.prefix}:{key}")
+        except Exception as e:
+            print(f"Redis cache error: {e}")
+            return None
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key, value, ttl: int = None):
+        try:
+            await self.client.set(
+                f"{self.prefix}:{key}", json.dumps(value), ex=ttl or self.ttl
+            )
+        except Exception as e:
+            print(f"Redis cache error: {e}")
+
+    async def delete(self, key):
+        try:
+            await self.client.delete(f"{self.prefix}:{key}")
+        except Exception as e:
+            print(f"Redis cache error: {e}")
+
+
+class RedisGenerations:
+    """Per-key generation counters shared between workers through Redis.
+
+    A cached value remembers the generation it was loaded at and is only used
+    while that is still current, so bumping a key invalidates the copies held
+    by every worker. Errors return None so callers go to the source of truth.
+    """
+
+    def __init__(self, client, prefix: str):
+        self.client = client
+        self.prefix = prefix
+
+    async def get(self, key) -> int | None:
+        try:
+            raw = await self.client.get(f"{self.prefix}:{key}")
+        except Exception as e:
+            print(f"Redis cache error: {e}")
+            return None
+        return int(raw or 0)
+
+    async def bump(self, key):
+        try:
+            await self.client.incr(f"{self.prefix}:{key}")
+        except Exception as e:
+            print(f"Redis cache error: {e}")
+
+
+_redis_client = None
+
+
+def get_redis():
+    """Return a shared Redis client for REDIS_URL, or None if unavailable"""
+    global _redis_client
+    if _redis_client is None:
+        try:
+            import redis
+
+            _redis_client = redis.Redis.from_url(
+                settings.REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5
+            )
+        except Exception as e:
+            print(f"⚠️ Redis is not available: {e}")
+            return None
+    return _redis_client
+
+
+_async_redis_client = None
+
+
+def get_async_redis():
+    """Return a shared asyncio Redis client for REDIS_URL, or None if unavailable"""
+    global _async_redis_client
+    if _async_redis_client is None:
+        try:
+            import redis.asyncio
+
+            _async_redis_client = redis.asyncio.Redis.from_url(
+                settings.REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5
+            )
+        except Exception as e:
+            print(f"⚠️ Redis is not available: {e}")
+            return None
+    return _async_redis_client
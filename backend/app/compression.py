@@ -0,0 +1,66 @@
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, IdentityResponder
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always available
+    brotli = None
+
+
+def accepts_encoding(accept_encoding: str, coding: str) -> bool:
+    """Whether an Accept-Encoding header allows coding (q=0 means refused)"""
+    for item in accept_encoding.split(","):
+        name, *params = item.split(";")
+        if name.strip().lower() != coding:
+            continue
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    return float(value.strip()) > 0
+                except ValueError:
+                    # The header is client input; an unreadable q is a refusal
+                    return False
+        return True
+    return False
+
+
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app, minimum_size: int, quality: int = 4, **kwargs):
+        super().__init__(app, minimum_size, **kwargs)
+        self.quality = quality
+        self._compressor = None
+
+    async def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        if self._compressor is None:
+            self._compressor = brotli.Compressor(quality=self.quality)
+        if more_body:
+            return self._compressor.process(body) + self._compressor.flush()
+        return self._compressor.process(body) + self._compressor.finish()
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """GZip middleware that prefers Brotli when the client and server support it.
+
+    Responses smaller than ``minimum_size`` are sent uncompressed.
+    """
+
+    def __init__(self, app, minimum_size: int = 500, brotli_quality: int = 4, **kw):
+        super().__init__(app, minimum_size=minimum_size, **kw)
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and brotli is not None:
+            accept_encoding = Headers(scope=scope).get("Accept-Encoding", "")
+            if accepts_encoding(accept_encoding, "br"):
+                responder = BrotliResponder(
+                    self.app,
+                    self.minimum_size,
+                    quality=self.brotli_quality,
+                    exclude_content_types=self.exclude_content_types,
+                )
+                await responder(scope, receive, send)
+                return
+        await super().__call__(scope, receive, send)
@@ -10,6 +10,14 @@ class Settings:
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///:memory:")
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://redis:6379")
 
+    # Connection pool, per engine and worker process: each worker can hold up
+    # to DB_POOL_SIZE + DB_MAX_OVERFLOW connections
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
     # Security
     SECRET_KEY: str = os.getenv("SECRET_KEY", "SECRET_KEY")
     JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY", "JWT_SECRET_KEY")
@@ -18,6 +26,131 @@ class Settings:
 
     # Encryption
     ENCRYPTION_KEY: str = os.getenv("ENCRYPTION_KEY", "ENCRYPTION_KEY")
+    # Key-encryption keyring "id1:secret1,id2:secret2"; the first is active
+    # unless ENCRYPTION_ACTIVE_KEY_ID says otherwise
+    ENCRYPTION_KEYS: str = os.getenv("ENCRYPTION_KEYS", "")
+    ENCRYPTION_ACTIVE_KEY_ID: str = os.getenv("ENCRYPTION_ACTIVE_KEY_ID", "")
+    # Keep a plaintext copy of snippet code next to the ciphertext (legacy)
+    SNIPPET_STORE_PLAINTEXT: bool = (
+        os.getenv("SNIPPET_STORE_PLAINTEXT", "false").lower() == "true"
+    )
+
+    # Blind index of identifiers in snippet code for code_token search
+    SNIPPET_BLIND_INDEX: bool = (
+        os.getenv("SNIPPET_BLIND_INDEX", "false").lower() == "true"
+    )
+    BLIND_INDEX_MIN_LENGTH: int = int(os.getenv("BLIND_INDEX_MIN_LENGTH", "3"))
+    BLIND_INDEX_MAX_TOKENS: int = int(os.getenv("BLIND_INDEX_MAX_TOKENS", "1000"))
+
+    # Response compression: Brotli when installed and accepted, else gzip
+    COMPRESSION_MIN_SIZE: int = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+    COMPRESSION_BROTLI_QUALITY: int = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+    COMPRESSION_GZIP_LEVEL: int = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+
+    # Bulk import and export
+    BULK_BATCH_SIZE: int = int(os.getenv("BULK_BATCH_SIZE", "500"))
+    BULK_ENCRYPT_WORKERS: int = int(
+        os.getenv("BULK_ENCRYPT_WORKERS", str(os.cpu_count() or 1))
+    )
+    BULK_MAX_LINE_BYTES: int = int(os.getenv("BULK_MAX_LINE_BYTES", str(1024 * 1024)))
+    EXPORT_BATCH_SIZE: int = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+
+    # Prometheus metrics at /metrics; scrapers must send METRICS_TOKEN as a
+    # bearer token when it is set
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    METRICS_TOKEN: str = os.getenv("METRICS_TOKEN", "")
+
+    # Request profiling: samples PROFILING_SAMPLE_RATE of requests, plus any
+    # carrying an X-Debug-Profile header signed with PROFILING_SECRET
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+    PROFILING_SAMPLE_RATE: float = float(os.getenv("PROFILING_SAMPLE_RATE", "0.0"))
+    PROFILING_SECRET: str = os.getenv("PROFILING_SECRET", "")
+    PROFILING_DIR: str = os.getenv("PROFILING_DIR", "/tmp/securevault-profiles")
+    PROFILING_MAX_PROFILES: int = int(os.getenv("PROFILING_MAX_PROFILES", "100"))
+
+    # Comma-separated emails allowed on the /admin endpoints
+    ADMIN_EMAILS: str = os.getenv("ADMIN_EMAILS", "")
+
+    # Authenticated user cache
+    USER_CACHE_TTL: int = int(os.getenv("USER_CACHE_TTL", "60"))
+    USER_CACHE_SIZE: int = int(os.getenv("USER_CACHE_SIZE", "10000"))
+    USER_CACHE_REDIS: bool = os.getenv("USER_CACHE_REDIS", "false").lower() == "true"
+
+    # Shared snippet cache - plaintext caching is opt-in
+    SHARE_CACHE_TTL: int = int(os.getenv("SHARE_CACHE_TTL", "60"))
+    SHARE_CACHE_SIZE: int = int(os.getenv("SHARE_CACHE_SIZE", "10000"))
+    SHARE_CACHE_MAX_BYTES: int = int(
+        os.getenv("SHARE_CACHE_MAX_BYTES", str(32 * 1024 * 1024))
+    )
+    # Invalidate share entries in every worker through Redis; on by default
+    # when REDIS_URL is set explicitly
+    SHARE_CACHE_REDIS: bool = (
+        os.getenv(
+            "SHARE_CACHE_REDIS", "true" if os.getenv("REDIS_URL") else "false"
+        ).lower()
+        == "true"
+    )
+    SHARE_CACHE_PLAINTEXT: bool = (
+        os.getenv("SHARE_CACHE_PLAINTEXT", "false").lower() == "true"
+    )
+
+    # Expired share links are deactivated by a background sweep, and deleted
+    # SHARE_LINK_RETENTION_DAYS after they expired
+    SHARE_SWEEP_ENABLED: bool = (
+        os.getenv("SHARE_SWEEP_ENABLED", "true").lower() == "true"
+    )
+    SHARE_SWEEP_INTERVAL: float = float(os.getenv("SHARE_SWEEP_INTERVAL", "300"))
+    SHARE_SWEEP_BATCH_SIZE: int = int(os.getenv("SHARE_SWEEP_BATCH_SIZE", "500"))
+    SHARE_LINK_RETENTION_DAYS: float = float(
+        os.getenv("SHARE_LINK_RETENTION_DAYS", "30")
+    )
+
+    # Share link view counters, aggregated in memory and flushed on an interval
+    SHARE_STATS_ASYNC: bool = os.getenv("SHARE_STATS_ASYNC", "true").lower() == "true"
+    SHARE_STATS_FLUSH_INTERVAL: float = float(
+        os.getenv("SHARE_STATS_FLUSH_INTERVAL", "10")
+    )
+    SHARE_STATS_MAX_PENDING: int = int(os.getenv("SHARE_STATS_MAX_PENDING", "2000"))
+
+    # Password hashing pool
+    PASSWORD_POOL_WORKERS: int = int(os.getenv("PASSWORD_POOL_WORKERS", "4"))
+    PASSWORD_POOL_MAX_PENDING: int = int(os.getenv("PASSWORD_POOL_MAX_PENDING", "32"))
+    PASSWORD_POOL_RETRY_AFTER: int = int(os.getenv("PASSWORD_POOL_RETRY_AFTER", "1"))
+
+    # Rate limits on password checks: attempts per RATE_LIMIT_WINDOW seconds,
+    # per client IP and per account or share token. With RATE_LIMIT_REDIS the
+    # buckets are shared by all workers, and it is on by default when REDIS_URL
+    # is set explicitly; otherwise each process keeps its own
+    RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+    RATE_LIMIT_REDIS: bool = (
+        os.getenv(
+            "RATE_LIMIT_REDIS", "true" if os.getenv("REDIS_URL") else "false"
+        ).lower()
+        == "true"
+    )
+    RATE_LIMIT_WINDOW: float = float(os.getenv("RATE_LIMIT_WINDOW", "60"))
+    RATE_LIMIT_LOGIN_PER_IP: int = int(os.getenv("RATE_LIMIT_LOGIN_PER_IP", "20"))
+    RATE_LIMIT_LOGIN_PER_ACCOUNT: int = int(
+        os.getenv("RATE_LIMIT_LOGIN_PER_ACCOUNT", "5")
+    )
+    RATE_LIMIT_SHARED_PER_IP: int = int(os.getenv("RATE_LIMIT_SHARED_PER_IP", "20"))
+    RATE_LIMIT_SHARED_PER_TOKEN: int = int(
+        os.getenv("RATE_LIMIT_SHARED_PER_TOKEN", "10")
+    )
+
+    # Audit logging
+    AUDIT_ASYNC: bool = os.getenv("AUDIT_ASYNC", "true").lower() == "true"
+    AUDIT_BATCH_SIZE: int = int(os.getenv("AUDIT_BATCH_SIZE", "200"))
+    AUDIT_FLUSH_INTERVAL: float = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1.0"))
+    AUDIT_QUEUE_SIZE: int = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+    AUDIT_ENQUEUE_TIMEOUT: float = float(os.getenv("AUDIT_ENQUEUE_TIMEOUT", "0.05"))
+    # Monthly partitions (PostgreSQL) are created this far ahead, and whole
+    # months older than AUDIT_RETENTION_MONTHS are archived to files
+    AUDIT_PARTITION_MONTHS_AHEAD: int = int(
+        os.getenv("AUDIT_PARTITION_MONTHS_AHEAD", "2")
+    )
+    AUDIT_RETENTION_MONTHS: int = int(os.getenv("AUDIT_RETENTION_MONTHS", "12"))
+    AUDIT_ARCHIVE_DIR: str = os.getenv("AUDIT_ARCHIVE_DIR", "audit-archive")
 
     def validate(self):
         """Validate that all required environment variables are set"""
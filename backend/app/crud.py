@@ -1,66 +1,243 @@
+import asyncio
+import base64
 import secrets
 import string
+from dataclasses import dataclass, replace
 from datetime import UTC, datetime, timedelta
 
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, delete, insert, or_, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
 
-from . import auth, models, schemas
+from . import audit, auth, metrics, models, schemas, search
+from .cache import RedisGenerations, TTLCache, get_async_redis
+from .config import settings
+from .database import await_after_commit
+from .encryption import EncryptedData
+from .share_stats import ShareViews, apply_share_views, share_stats
 
 
-def create_user(db: Session, user: schemas.UserCreate):
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
     # The password validation now happens in the schema and auth layers
-    hashed_password = auth.get_password_hash(user.password)
+    hashed_password = await auth.get_password_hash_async(user.password)
     db_user = models.User(email=user.email, hashed_password=hashed_password)
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)  # This is important to get the ID
+    # Flush to get the ID; server defaults come back via RETURNING
+    await db.flush()
     return db_user
 
 
-def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email).first()
+async def get_user_by_email(db: AsyncSession, email: str):
+    result = await db.execute(
+        select(models.User).where(models.User.email == email).limit(1)
+    )
+    return result.scalars().first()
 
 
-def get_user_by_id(db: Session, user_id: int):
-    return db.query(models.User).filter(models.User.id == user_id).first()
+async def get_user_by_id(db: AsyncSession, user_id: int):
+    return await db.get(models.User, user_id)
 
 
-def create_snippet(
-    db: Session, snippet: schemas.SnippetCreate, user_id: int, encryption_service
+async def create_snippet(
+    db: AsyncSession, snippet: schemas.SnippetCreate, user_id: int, encryption_service
 ):
     """Create a snippet with encryption if available"""
     if encryption_service is None:
         raise ValueError("Encryption service is not available")
-    # Encrypt the code before storing
-    encrypted_code = encryption_service.encrypt(snippet.code)
+    # Encrypt the code before storing, under its own data key
+    with metrics.CRYPTO_DURATION.labels("encrypt").time():
+        encrypted = encryption_service.encrypt_envelope(snippet.code)
 
     db_snippet = models.Snippet(
         title=snippet.title,
         language=snippet.language,
-        code=snippet.code,
-        encrypted_code=encrypted_code,
+        code=snippet.code if settings.SNIPPET_STORE_PLAINTEXT else None,
+        encrypted_code=encrypted.encrypted_code,
+        data_key=encrypted.data_key,
+        key_id=encrypted.key_id,
         user_id=user_id,
     )
     db.add(db_snippet)
-    db.commit()
-    db.refresh(db_snippet)
+    await db.flush()
+    if settings.SNIPPET_BLIND_INDEX:
+        await add_snippet_tokens(
+            db, snippet_token_rows(encryption_service, [(db_snippet.id, snippet.code)])
+        )
     return db_snippet
 
 
-def get_user_snippets(db: Session, user_id: int):
-    return db.query(models.Snippet).filter(models.Snippet.user_id == user_id).all()
+def snippet_token_rows(encryption_service, snippets: list[tuple[int, str]]):
+    """Blind index rows for (snippet_id, code) pairs"""
+    rows = []
+    for snippet_id, code in snippets:
+        identifiers = search.extract_identifiers(
+            code, settings.BLIND_INDEX_MIN_LENGTH, settings.BLIND_INDEX_MAX_TOKENS
+        )
+        rows.extend(
+            {"token": token, "snippet_id": snippet_id}
+            for token in encryption_service.blind_tokens(identifiers)
+        )
+    return rows
 
 
-def get_snippet_by_id(db: Session, snippet_id: int, user_id: int):
-    return (
-        db.query(models.Snippet)
-        .filter(models.Snippet.id == snippet_id, models.Snippet.user_id == user_id)
-        .first()
+async def add_snippet_tokens(db: AsyncSession, rows: list[dict]):
+    if rows:
+        await db.execute(insert(models.SnippetToken), rows)
+
+
+async def delete_snippet_tokens(db: AsyncSession, snippet_id: int):
+    await db.execute(
+        delete(models.SnippetToken).where(models.SnippetToken.snippet_id == snippet_id)
     )
 
 
-def get_snippet_by_id_any_owner(db: Session, snippet_id: int):
-    return db.query(models.Snippet).filter(models.Snippet.id == snippet_id).first()
+async def encrypt_codes(encryption_service, codes: list[str]) -> list[EncryptedData]:
+    """Encrypt a batch of code in worker threads, keeping the event loop free"""
+    workers = max(1, min(settings.BULK_ENCRYPT_WORKERS, len(codes)))
+    size = -(-len(codes) // workers)
+    chunks = [codes[i : i + size] for i in range(0, len(codes), size)]
+    with metrics.CRYPTO_DURATION.labels("encrypt").time():
+        results = await asyncio.gather(
+            *(
+                asyncio.to_thread(encryption_service.encrypt_many, chunk)
+                for chunk in chunks
+            )
+        )
+    return [item for chunk in results for item in chunk]
+
+
+async def bulk_create_snippets(
+    db: AsyncSession,
+    snippets: list[schemas.SnippetCreate],
+    user_id: int,
+    encryption_service,
+) -> list[int]:
+    """Insert a batch of snippets with one multi-row INSERT, returning their ids"""
+    if encryption_service is None:
+        raise ValueError("Encryption service is not available")
+    if not snippets:
+        return []
+    encrypted = await encrypt_codes(encryption_service, [s.code for s in snippets])
+    rows = [
+        {
+            "title": snippet.title,
+            "language": snippet.language,
+            "code": snippet.code if settings.SNIPPET_STORE_PLAINTEXT else None,
+            **item._asdict(),
+            "user_id": user_id,
+        }
+        for snippet, item in zip(snippets, encrypted, strict=True)
+    ]
+    # Without sort_by_parameter_order a batched INSERT may return ids in any order
+    result = await db.execute(
+        insert(models.Snippet).returning(
+            models.Snippet.id, sort_by_parameter_order=True
+        ),
+        rows,
+    )
+    ids = result.scalars().all()
+    if settings.SNIPPET_BLIND_INDEX:
+        token_rows = await asyncio.to_thread(
+            snippet_token_rows,
+            encryption_service,
+            [(snippet_id, s.code) for snippet_id, s in zip(ids, snippets, strict=True)],
+        )
+        await add_snippet_tokens(db, token_rows)
+    return ids
+
+
+async def stream_user_snippets(db: AsyncSession, user_id: int, batch_size: int):
+    """Yield a user's snippets in id order, batch_size rows at a time.
+
+    Rows come from a server-side cursor as plain tuples, so exporting does not
+    hold every snippet in memory or in the session.
+    """
+    result = await db.stream(
+        select(
+            models.Snippet.id,
+            models.Snippet.title,
+            models.Snippet.language,
+            models.Snippet.encrypted_code,
+            models.Snippet.data_key,
+            models.Snippet.key_id,
+            models.Snippet.created_at,
+        )
+        .where(models.Snippet.user_id == user_id)
+        .order_by(models.Snippet.id)
+        .execution_options(yield_per=batch_size)
+    )
+    async for rows in result.partitions():
+        yield rows
+
+
+def encode_cursor(row) -> str:
+    """Encode the (created_at, id) keyset position of a row as an opaque cursor"""
+    raw = f"{row.created_at.isoformat()}|{row.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, snippet_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(snippet_id)
+    except Exception:
+        raise ValueError("Invalid cursor") from None
+
+
+async def get_user_snippets(
+    db: AsyncSession,
+    user_id: int,
+    limit: int = None,
+    cursor: str = None,
+    fields: list[str] = None,
+):
+    """Get a user's snippets newest first using keyset pagination.
+
+    Returns the page and the cursor for the next one (None on the last page).
+    When ``fields`` is given only those columns are loaded.
+    """
+    query = select(models.Snippet).where(models.Snippet.user_id == user_id)
+
+    if fields:
+        # id and created_at are always needed to build the next cursor,
+        # updated_at for the ETag, and code is served from the ciphertext
+        columns = {"id", "created_at", "updated_at", *fields}
+        if "code" in columns:
+            columns.remove("code")
+            columns.update(("encrypted_code", "data_key", "key_id"))
+        query = query.options(
+            load_only(*(getattr(models.Snippet, name) for name in columns))
+        )
+
+    if cursor:
+        created_at, snippet_id = decode_cursor(cursor)
+        query = query.where(
+            tuple_(models.Snippet.created_at, models.Snippet.id)
+            < tuple_(created_at, snippet_id)
+        )
+
+    query = query.order_by(models.Snippet.created_at.desc(), models.Snippet.id.desc())
+
+    if limit is None:
+        return (await db.execute(query)).scalars().all(), None
+
+    # Fetch one extra row to know whether there is another page
+    snippets = (await db.execute(query.limit(limit + 1))).scalars().all()
+    if len(snippets) > limit:
+        snippets = snippets[:limit]
+        return snippets, encode_cursor(snippets[-1])
+    return snippets, None
+
+
+async def get_snippet_by_id(db: AsyncSession, snippet_id: int, user_id: int):
+    result = await db.execute(
+        select(models.Snippet).where(
+            models.Snippet.id == snippet_id, models.Snippet.user_id == user_id
+        )
+    )
+    return result.scalars().first()
 
 
 def generate_share_token():
@@ -69,8 +246,8 @@ def generate_share_token():
     return "".join(secrets.choice(alphabet) for _ in range(32))
 
 
-def create_share_link(
-    db: Session,
+async def create_share_link(
+    db: AsyncSession,
     snippet_id: int,
     user_id: int,
     expires_hours: int = 24,
@@ -78,7 +255,7 @@ def create_share_link(
 ):
     """Create a shareable link for a snippet"""
     # Verify the user owns the snippet
-    snippet = get_snippet_by_id(db, snippet_id, user_id)
+    snippet = await get_snippet_by_id(db, snippet_id, user_id)
     if not snippet:
         return None
 
@@ -91,66 +268,271 @@ def create_share_link(
         snippet_id=snippet_id,
         token=token,
         expires_at=expires_at,
-        password_hash=auth.get_password_hash(password) if password else None,
+        password_hash=(
+            await auth.get_password_hash_async(password) if password else None
+        ),
         is_active=True,
     )
     db.add(share_link)
-    db.commit()
-    db.refresh(share_link)
+    await db.flush()
     return share_link
 
 
-def get_share_link_by_token(db: Session, token: str):
-    """Get a share link by token, checking if it's valid"""
-    share_link = (
-        db.query(models.ShareLink)
-        .filter(models.ShareLink.token == token, models.ShareLink.is_active)
-        .first()
+def share_link_is_live(now: datetime):
+    """SQL condition for a share link that is active and not yet expired"""
+    return and_(
+        models.ShareLink.is_active,
+        or_(models.ShareLink.expires_at.is_(None), models.ShareLink.expires_at > now),
     )
 
-    if not share_link:
-        return None
 
-    # Check if expired
-    if share_link.expires_at:
-        expires_at_aware = share_link.expires_at.replace(tzinfo=UTC)
-        current_time_aware = datetime.now(UTC)
+@dataclass(frozen=True)
+class SharedSnippet:
+    """What /shared/{token} needs, resolved from a share link and its snippet.
 
-        if expires_at_aware < current_time_aware:
-            share_link.is_active = False
-            db.commit()
-            return None
+    Holds the ciphertext unless SHARE_CACHE_PLAINTEXT is enabled, in which
+    case ``code`` holds the decrypted code instead.
+    """
 
-    return share_link
+    snippet_id: int
+    title: str
+    language: str
+    password_hash: str | None
+    shared_at: datetime
+    expires_at: datetime | None
+    updated_at: datetime | None = None
+    encrypted_code: bytes | None = None
+    data_key: bytes | None = None
+    key_id: str | None = None
+    code: str | None = None
+    share_link_id: int | None = None
+    # The snippet's generation in Redis when this was loaded
+    generation: int | None = None
+
+    @property
+    def encrypted(self) -> EncryptedData:
+        return EncryptedData(self.encrypted_code, self.data_key, self.key_id)
 
 
-def verify_share_password(db: Session, share_link_id: int, password: str):
-    """Verify password for a share link"""
-    share_link = (
-        db.query(models.ShareLink).filter(models.ShareLink.id == share_link_id).first()
+def _shared_snippet_size(shared: SharedSnippet) -> int:
+    return (
+        len(shared.title)
+        + len(shared.language)
+        + len(shared.password_hash or "")
+        + len(shared.encrypted_code or b"")
+        + len(shared.data_key or b"")
+        + len(shared.code or "")
     )
-    if not share_link or not share_link.password_hash:
-        return False
 
-    return auth.verify_password(password, share_link.password_hash)
 
+# Per-process cache of share token -> SharedSnippet. Entries never outlive the
+# link itself. Deleting a snippet drops its entries in this process and, with
+# SHARE_CACHE_REDIS, bumps its generation so other workers stop serving them.
+shared_snippet_cache = TTLCache(
+    max_entries=settings.SHARE_CACHE_SIZE,
+    ttl=settings.SHARE_CACHE_TTL,
+    max_bytes=settings.SHARE_CACHE_MAX_BYTES,
+    sizeof=_shared_snippet_size,
+)
+share_generations = None
+if settings.SHARE_CACHE_REDIS:
+    redis_client = get_async_redis()
+    if redis_client is not None:
+        share_generations = RedisGenerations(redis_client, "share:generation")
+
+
+async def get_shared_snippet(db: AsyncSession, token: str, decrypt=None):
+    """Resolve a share token through the shared snippet cache.
+
+    ``decrypt`` turns an EncryptedData into code and is only used when
+    plaintext caching is enabled.
+    """
+    shared = shared_snippet_cache.get(token)
+    if shared is not None:
+        if share_generations is None:
+            return shared
+        # One Redis read per hit instead of the query and the decryption
+        if await share_generations.get(shared.snippet_id) == shared.generation:
+            return shared
+        shared_snippet_cache.delete(token)
+
+    # One round trip for the link and its snippet, loading only what the
+    # endpoint serves; the password hash comes along for verification
+    link, snippet = models.ShareLink, models.Snippet
+    result = await db.execute(
+        select(
+            link.id.label("share_link_id"),
+            link.password_hash,
+            link.created_at.label("shared_at"),
+            link.expires_at,
+            snippet.id.label("snippet_id"),
+            snippet.title,
+            snippet.language,
+            snippet.updated_at,
+            snippet.encrypted_code,
+            snippet.data_key,
+            snippet.key_id,
+        )
+        .join(snippet, snippet.id == link.snippet_id)
+        .where(link.token == token, share_link_is_live(datetime.now(UTC)))
+    )
+    row = result.mappings().first()
+    if row is None:
+        return None
 
-def create_audit_log(
-    db: Session,
+    generation = None
+    if share_generations is not None:
+        generation = await share_generations.get(row["snippet_id"])
+    shared = SharedSnippet(**row, generation=generation)
+    if settings.SHARE_CACHE_PLAINTEXT and decrypt is not None:
+        shared = replace(
+            shared,
+            encrypted_code=None,
+            data_key=None,
+            key_id=None,
+            code=decrypt(shared.encrypted),
+        )
+
+    ttl = settings.SHARE_CACHE_TTL
+    if shared.expires_at:
+        remaining = shared.expires_at.replace(tzinfo=UTC) - datetime.now(UTC)
+        ttl = min(ttl, remaining.total_seconds())
+    # Without a generation the entry could not be invalidated in other workers
+    if share_generations is None or generation is not None:
+        shared_snippet_cache.set(token, shared, ttl=ttl)
+    return shared
+
+
+def invalidate_shared_snippet(db: AsyncSession, snippet_id: int):
+    """Drop cached share entries for a snippet once ``db`` commits.
+
+    Entries in this worker are deleted; other workers find the snippet's
+    generation changed on their next hit and reload from the database.
+    """
+
+    async def invalidate():
+        shared_snippet_cache.delete_where(
+            lambda shared: shared.snippet_id == snippet_id
+        )
+        if share_generations is not None:
+            await share_generations.bump(snippet_id)
+
+    await_after_commit(db, invalidate)
+
+
+async def create_audit_log(
+    db: AsyncSession,
     user_id: int,
     action: str,
     resource_type: str,
     resource_id: int = None,
     details: str = None,
 ):
-    """Create an audit log entry"""
-    audit_log = models.AuditLog(
-        user_id=user_id,
-        action=action,
-        resource_type=resource_type,
-        resource_id=resource_id,
-        details=details,
+    """Create an audit log entry.
+
+    Entries go to the background audit writer after the request commits when
+    the writer is running, and are only written inline when it is disabled.
+    """
+    entry = audit.build_audit_entry(
+        user_id, action, resource_type, resource_id, details
     )
+    audit_log = models.AuditLog(**entry)
+    if audit.audit_writer.running:
+        audit.submit_on_commit(db, entry)
+        return audit_log
+
     db.add(audit_log)
-    db.commit()
     return audit_log
+
+
+async def record_share_view(db: AsyncSession, share_link_id: int, visitor: str):
+    """Count a view of a share link.
+
+    Views are aggregated in memory when the share stats flusher is running and
+    only written inline when it is disabled.
+    """
+    if share_stats.running:
+        share_stats.record(share_link_id, visitor)
+        return
+    views = ShareViews()
+    views.add(visitor, datetime.now(UTC))
+    await apply_share_views(db, {share_link_id: views}, check_links=False)
+
+
+async def get_share_stats(db: AsyncSession, snippet_id: int):
+    """Every share link of a snippet with its view counters, newest first"""
+    result = await db.execute(
+        select(models.ShareLink, models.ShareLinkStats)
+        .outerjoin(models.ShareLinkStats)
+        .where(models.ShareLink.snippet_id == snippet_id)
+        .order_by(models.ShareLink.created_at.desc(), models.ShareLink.id.desc())
+    )
+    return result.all()
+
+
+def audit_log_filters(
+    user_id: int = None,
+    action: str = None,
+    resource_type: str = None,
+    resource_id: int = None,
+    since: datetime = None,
+    until: datetime = None,
+) -> list:
+    """WHERE clauses for an audit log query; None leaves a field unfiltered.
+
+    Every filter combination is served by the (user_id, created_at) or
+    (resource_type, resource_id, created_at) index, and on PostgreSQL the
+    time range also prunes the monthly partitions.
+    """
+    log = models.AuditLog
+    clauses = []
+    if user_id is not None:
+        clauses.append(log.user_id == user_id)
+    if action is not None:
+        clauses.append(log.action == action)
+    if resource_type is not None:
+        clauses.append(log.resource_type == resource_type)
+    if resource_id is not None:
+        clauses.append(log.resource_id == resource_id)
+    if since is not None:
+        clauses.append(log.created_at >= since)
+    if until is not None:
+        clauses.append(log.created_at < until)
+    return clauses
+
+
+async def get_audit_logs(
+    db: AsyncSession, filters: list, limit: int, cursor: str = None
+) -> tuple[list[models.AuditLog], str | None]:
+    """A page of audit entries newest first, and the cursor for the next page"""
+    log = models.AuditLog
+    query = select(log).where(*filters)
+    if cursor:
+        created_at, entry_id = decode_cursor(cursor)
+        query = query.where(
+            tuple_(log.created_at, log.id) < tuple_(created_at, entry_id)
+        )
+    query = query.order_by(log.created_at.desc(), log.id.desc()).limit(limit + 1)
+
+    entries = (await db.execute(query)).scalars().all()
+    if len(entries) > limit:
+        entries = entries[:limit]
+        return entries, encode_cursor(entries[-1])
+    return entries, None
+
+
+async def stream_audit_logs(db: AsyncSession, filters: list, batch_size: int):
+    """Yield matching audit entries oldest first, batch_size rows at a time.
+
+    Like stream_user_snippets, rows come from a server-side cursor as plain
+    tuples, so memory stays flat however many rows are exported.
+    """
+    log = models.AuditLog
+    result = await db.stream(
+        select(*log.__table__.columns)
+        .where(*filters)
+        .order_by(log.created_at, log.id)
+        .execution_options(yield_per=batch_size)
+    )
+    async for rows in result.partitions():
+        yield rows
@@ -1,15 +1,65 @@
 import base64
+import hashlib
+import hmac
+import os
 import sys
+from typing import NamedTuple
 
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
 from .config import settings
 
+# Binary envelopes: version byte | 12-byte nonce | AES-GCM ciphertext and tag.
+# FORMAT_AES_GCM uses the service key directly, FORMAT_DATA_KEY a per-record
+# data key that is stored wrapped by one of the key-encryption keys.
+FORMAT_AES_GCM = 0x01
+FORMAT_DATA_KEY = 0x02
+NONCE_SIZE = 12
+DEFAULT_KEY_ID = "default"
+KEK_PURPOSE = b"securecode_vault_kek_v1"
+BLIND_INDEX_PURPOSE = b"securecode_vault_blind_index_v1"
+BLIND_TOKEN_SIZE = 16
+
+
+class EncryptedData(NamedTuple):
+    encrypted_code: bytes
+    data_key: bytes | None = None
+    key_id: str | None = None
+
+
+def derive_master_key(secret: str) -> bytes:
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=b"securecode_vault_salt",
+        iterations=100000,
+    )
+    return kdf.derive(secret.encode())
+
+
+def derive_subkey(master_key: bytes, purpose: bytes) -> bytes:
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=purpose).derive(
+        master_key
+    )
+
+
+def parse_keyring(value: str) -> dict[str, str]:
+    """Parse ENCRYPTION_KEYS ("id1:secret1,id2:secret2") preserving order"""
+    keyring = {}
+    for entry in filter(None, (part.strip() for part in value.split(","))):
+        key_id, sep, secret = entry.partition(":")
+        if not sep or not key_id or not secret:
+            raise ValueError("ENCRYPTION_KEYS entries must look like key_id:secret")
+        keyring[key_id] = secret
+    return keyring
+
 
 class EncryptionService:
-    def __init__(self):
+    def __init__(self, keyring: dict[str, str] = None, active_key_id: str = None):
         # Check if encryption key is available
         if not settings.ENCRYPTION_KEY:
             raise ValueError("ENCRYPTION_KEY environment variable is not set")
@@ -21,22 +71,122 @@ class EncryptionService:
             )
 
         # Derive a Fernet key from our encryption key
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=b"securecode_vault_salt",
-            iterations=100000,
+        master_key = derive_master_key(settings.ENCRYPTION_KEY)
+        # Legacy rows: Fernet tokens that were base64 encoded a second time
+        self.fernet = Fernet(base64.urlsafe_b64encode(master_key))
+        # Current format gets its own subkey rather than reusing the Fernet key
+        self.aesgcm = AESGCM(derive_subkey(master_key, b"securecode_vault_aes_gcm_v1"))
+
+        # Keyed hashes for the blind index. Tied to ENCRYPTION_KEY rather than
+        # the rotating keyring so existing tokens stay searchable.
+        self.blind_index_key = derive_subkey(master_key, BLIND_INDEX_PURPOSE)
+
+        # Key-encryption keys. ENCRYPTION_KEY stays in the keyring as "default"
+        # so data keys wrapped before a rotation remain readable.
+        if keyring is None:
+            keyring = parse_keyring(settings.ENCRYPTION_KEYS)
+        self.active_key_id = (
+            active_key_id
+            or settings.ENCRYPTION_ACTIVE_KEY_ID
+            or next(iter(keyring), DEFAULT_KEY_ID)
         )
-        key = base64.urlsafe_b64encode(kdf.derive(settings.ENCRYPTION_KEY.encode()))
-        self.fernet = Fernet(key)
+        self.key_encryption_keys = {
+            DEFAULT_KEY_ID: AESGCM(derive_subkey(master_key, KEK_PURPOSE))
+        }
+        for key_id, secret in keyring.items():
+            self.key_encryption_keys[key_id] = AESGCM(
+                derive_subkey(derive_master_key(secret), KEK_PURPOSE)
+            )
+        if self.active_key_id not in self.key_encryption_keys:
+            raise ValueError(f"Unknown active encryption key id {self.active_key_id}")
+
+    def encrypt(self, data: str) -> bytes:
+        """Encrypt string data into the versioned binary envelope"""
+        header = bytes([FORMAT_AES_GCM])
+        nonce = os.urandom(NONCE_SIZE)
+        return header + nonce + self.aesgcm.encrypt(nonce, data.encode(), header)
 
-    def encrypt(self, data: str) -> str:
-        """Encrypt string data"""
-        encrypted_data = self.fernet.encrypt(data.encode())
-        return base64.urlsafe_b64encode(encrypted_data).decode()
+    def decrypt(self, encrypted_data: bytes | str) -> str:
+        """Decrypt data in either the binary envelope or the legacy format"""
+        if self.is_legacy(encrypted_data):
+            return self._decrypt_legacy(encrypted_data)
+        header = encrypted_data[:1]
+        nonce = encrypted_data[1 : 1 + NONCE_SIZE]
+        ciphertext = encrypted_data[1 + NONCE_SIZE :]
+        return self.aesgcm.decrypt(nonce, ciphertext, header).decode()
 
-    def decrypt(self, encrypted_data: str) -> str:
-        """Decrypt string data"""
+    def encrypt_envelope(self, data: str) -> EncryptedData:
+        """Encrypt with a fresh data key wrapped by the active key"""
+        data_key = AESGCM.generate_key(bit_length=256)
+        header = bytes([FORMAT_DATA_KEY])
+        nonce = os.urandom(NONCE_SIZE)
+        encrypted = (
+            header + nonce + AESGCM(data_key).encrypt(nonce, data.encode(), header)
+        )
+        return EncryptedData(
+            encrypted, self._wrap(data_key, self.active_key_id), self.active_key_id
+        )
+
+    def decrypt_envelope(
+        self, encrypted_data: bytes | str, data_key: bytes = None, key_id: str = None
+    ) -> str:
+        """Decrypt a record, falling back to the service key for older rows"""
+        if data_key is None:
+            return self.decrypt(encrypted_data)
+        header = encrypted_data[:1]
+        nonce = encrypted_data[1 : 1 + NONCE_SIZE]
+        ciphertext = encrypted_data[1 + NONCE_SIZE :]
+        aesgcm = AESGCM(self._unwrap(data_key, key_id))
+        return aesgcm.decrypt(nonce, ciphertext, header).decode()
+
+    def encrypt_many(self, values: list[str]) -> list[EncryptedData]:
+        """Encrypt a batch of values, each under its own data key"""
+        encrypt = self.encrypt_envelope
+        return [encrypt(value) for value in values]
+
+    def decrypt_many(self, items: list[EncryptedData]) -> list[str]:
+        """Decrypt a batch of records, e.g. for a page of snippets"""
+        decrypt = self.decrypt_envelope
+        return [decrypt(*item) for item in items]
+
+    def blind_tokens(self, values: list[str]) -> list[bytes]:
+        """Keyed hashes of values that can be matched without revealing them"""
+        key = self.blind_index_key
+        return [
+            hmac.new(key, value.encode(), hashlib.sha256).digest()[:BLIND_TOKEN_SIZE]
+            for value in values
+        ]
+
+    def rewrap_data_key(self, data_key: bytes, key_id: str) -> tuple[bytes, str]:
+        """Re-wrap a data key under the active key without touching the data"""
+        wrapped = self._wrap(self._unwrap(data_key, key_id), self.active_key_id)
+        return wrapped, self.active_key_id
+
+    @staticmethod
+    def is_legacy(encrypted_data: bytes | str) -> bool:
+        """Legacy values are ASCII base64, so never start with a version byte"""
+        if isinstance(encrypted_data, str):
+            return True
+        return not encrypted_data or encrypted_data[0] not in (
+            FORMAT_AES_GCM,
+            FORMAT_DATA_KEY,
+        )
+
+    def _wrap(self, data_key: bytes, key_id: str) -> bytes:
+        nonce = os.urandom(NONCE_SIZE)
+        kek = self.key_encryption_keys[key_id]
+        return nonce + kek.encrypt(nonce, data_key, key_id.encode())
+
+    def _unwrap(self, wrapped_key: bytes, key_id: str) -> bytes:
+        kek = self.key_encryption_keys.get(key_id)
+        if kek is None:
+            raise ValueError(f"Unknown encryption key id {key_id}")
+        nonce, wrapped = wrapped_key[:NONCE_SIZE], wrapped_key[NONCE_SIZE:]
+        return kek.decrypt(nonce, wrapped, key_id.encode())
+
+    def _decrypt_legacy(self, encrypted_data: bytes | str) -> str:
+        if isinstance(encrypted_data, bytes):
+            encrypted_data = encrypted_data.decode()
         encrypted_bytes = base64.urlsafe_b64decode(encrypted_data.encode())
         decrypted_data = self.fernet.decrypt(encrypted_bytes)
         return decrypted_data.decode()
@@ -54,3 +204,8 @@ except ValueError as e:
         encryption_service = None
     else:
         encryption_service = None
+
+
+def get_encryption_service():
+    """Dependency returning the global encryption service (None if unavailable)"""
+    return encryption_service
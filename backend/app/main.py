@@ -1,15 +1,40 @@
+import base64
+import csv
+import hmac
+import io
+from contextlib import asynccontextmanager
 from datetime import UTC, datetime
+from typing import Literal
 
-from fastapi import Depends, FastAPI, HTTPException, Request, status
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import ValidationError
 from sqlalchemy import text
-from sqlalchemy.orm import Session
-
-from . import auth, crud, models, schemas
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import (
+    auth,
+    crud,
+    metrics,
+    models,
+    ndjson,
+    profiling,
+    rate_limit,
+    schemas,
+    search,
+)
+from .audit import audit_writer
+from .audit_partitions import ensure_audit_partitions
+from .compression import CompressionMiddleware
 from .config import settings
-from .database import SessionLocal, engine, get_db
-from .encryption import encryption_service
+from .database import async_engine, get_db, pool_status
+from .encryption import EncryptedData, encryption_service, get_encryption_service
+from .http_cache import etag_matches, make_etag, not_modified, set_etag
 from .middleware import audit_middleware
+from .password_pool import password_pool
+from .share_expiry import share_link_sweeper
+from .share_stats import share_stats
 
 try:
     settings.validate()
@@ -44,11 +69,44 @@ tags_metadata = [
         "name": "health",
         "description": "Health checks and service status",
     },
+    {
+        "name": "audit",
+        "description": "Read and export the audit trail",
+    },
+    {
+        "name": "admin",
+        "description": "Operational tools for administrators",
+    },
 ]
 
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create database tables
+    async with async_engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+    # Monthly audit partitions for the coming months (PostgreSQL only). Rows
+    # land in the default partition until they exist, so never fail startup.
+    try:
+        async with async_engine.begin() as conn:
+            await conn.run_sync(ensure_audit_partitions)
+    except Exception as e:
+        print(f"⚠️ Could not create audit log partitions: {e}")
+    # Audit rows are written in batches by a background task
+    if settings.AUDIT_ASYNC:
+        audit_writer.start()
+    # Share link views are counted in memory and flushed on an interval
+    if settings.SHARE_STATS_ASYNC:
+        share_stats.start()
+    # Expired share links are cleaned up here rather than on read
+    if settings.SHARE_SWEEP_ENABLED:
+        share_link_sweeper.start()
+    yield
+    await share_link_sweeper.stop()
+    # Flush whatever is still queued before the process exits
+    await share_stats.stop()
+    await audit_writer.stop()
+
 
 app = FastAPI(
     title="SecureCode Vault API",
@@ -75,6 +133,17 @@ app = FastAPI(
         "url": "https://opensource.org/licenses/MIT",
     },
     openapi_tags=tags_metadata,
+    lifespan=lifespan,
+)
+
+
+# Compress larger responses; code bodies compress very well. Added first so
+# it sits inside the audit middleware and sees whole response bodies.
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MIN_SIZE,
+    compresslevel=settings.COMPRESSION_GZIP_LEVEL,
+    brotli_quality=settings.COMPRESSION_BROTLI_QUALITY,
 )
 
 
@@ -83,7 +152,8 @@ app = FastAPI(
 
 @app.middleware("http")
 async def add_audit_middleware(request: Request, call_next):
-    return await audit_middleware(request, call_next)
+    # Opt-in profiling of sampled or explicitly requested requests
+    return await audit_middleware(request, profiling.wrap(call_next))
 
 
 # CORS middleware
@@ -109,10 +179,9 @@ async def root():
 async def health_check():
     """Enhanced health check that verifies all services"""
     try:
-        # Test database connection
-        db = SessionLocal()
-        db.execute(text("SELECT 1"))
-        db.close()
+        # Test database connection on a pooled connection, without a session
+        async with async_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
 
         # Test encryption service
         encryption_status = "unavailable"
@@ -129,6 +198,8 @@ async def health_check():
                 "status": "healthy",
                 "database": "connected",
                 "encryption": encryption_status,
+                "database_pool": pool_status(),
+                "password_pool": password_pool.stats(),
                 "timestamp": datetime.now(UTC).isoformat(),
             }
     except Exception as e:
@@ -137,6 +208,30 @@ async def health_check():
         ) from None
 
 
+# Caches and the connection pool are read when /metrics is scraped
+metrics.register_collector(
+    lambda: {
+        "token": auth.token_cache,
+        "user": auth.user_cache,
+        "shared_snippet": crud.shared_snippet_cache,
+    },
+    pool_status,
+)
+
+
+@app.get("/metrics", tags=["health"], include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    """Prometheus metrics for this worker process"""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if settings.METRICS_TOKEN and not hmac.compare_digest(
+        request.headers.get("authorization", ""), f"Bearer {settings.METRICS_TOKEN}"
+    ):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
 @app.get("/test/encryption")
 async def test_encryption():
     """Test endpoint to verify encryption is working"""
@@ -147,7 +242,7 @@ async def test_encryption():
 
         return {
             "original": test_data,
-            "encrypted": encrypted,
+            "encrypted": base64.b64encode(encrypted).decode(),
             "decrypted": decrypted,
             "success": decrypted == test_data,
         }
@@ -157,35 +252,62 @@ async def test_encryption():
         ) from None
 
 
+def decrypt_codes(encryption, items: list[EncryptedData]) -> list[str]:
+    """Decrypt snippet code, turning failures into a 500 response"""
+    if encryption is None:
+        raise HTTPException(
+            status_code=500, detail="Encryption service is not available"
+        )
+    try:
+        with metrics.CRYPTO_DURATION.labels("decrypt").time():
+            return encryption.decrypt_many(items)
+    except Exception as e:
+        print(f"Decryption error: {e}")
+        raise HTTPException(
+            status_code=500, detail="Error decrypting snippet"
+        ) from None
+
+
+def json_list_response(adapter, items: list, response: Response) -> Response:
+    """Serialise a list of dicts through a prebuilt TypeAdapter.
+
+    Fields missing from an item are left out, like response_model_exclude_unset.
+    Headers already set on the injected response are carried over.
+    """
+    content = adapter.dump_json(adapter.validate_python(items), exclude_unset=True)
+    return Response(
+        content, media_type="application/json", headers=dict(response.headers)
+    )
+
+
 # Authenticate endpoints
 
 
 @app.post(
     "/auth/register", response_model=schemas.UserResponse, tags=["authentication"]
 )
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_email(db, email=user.email)
+async def register(
+    user: schemas.UserCreate, db: AsyncSession = Depends(get_db, scope="function")
+):
+    db_user = await crud.get_user_by_email(db, email=user.email)
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered"
         )
 
     try:
-        new_user = crud.create_user(db=db, user=user)
+        new_user = await crud.create_user(db=db, user=user)
         # Log the registration
-        crud.create_audit_log(
+        await crud.create_audit_log(
             db, new_user.id, "REGISTER", "USER", new_user.id, "User registered"
         )
-
-        # Commit the transaction explicitly
-        db.commit()
-
-        # Refresh to get the complete user object
-        db.refresh(new_user)
         return new_user
 
+    except HTTPException:
+        # Invalid password or a saturated password pool
+        raise
     except Exception:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error creating user",
@@ -193,8 +315,14 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
 
 
 @app.post("/auth/login", response_model=schemas.Token, tags=["authentication"])
-def login(user_data: schemas.UserLogin, db: Session = Depends(get_db)):
-    user = auth.authenticate_user(db, user_data.email, user_data.password)
+async def login(
+    user_data: schemas.UserLogin,
+    request: Request,
+    db: AsyncSession = Depends(get_db, scope="function"),
+):
+    # Throttle before any bcrypt work is queued
+    await rate_limit.limit_login(request, user_data.email)
+    user = await auth.authenticate_user(db, user_data.email, user_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -203,25 +331,26 @@ def login(user_data: schemas.UserLogin, db: Session = Depends(get_db)):
         )
     access_token = auth.create_access_token(data={"sub": str(user.id)})
     # Log the login
-    crud.create_audit_log(db, user.id, "LOGIN", "USER", user.id, "User logged in")
+    await crud.create_audit_log(db, user.id, "LOGIN", "USER", user.id, "User logged in")
     return {"access_token": access_token, "token_type": "bearer"}
 
 
 # Protected endpoints
 @app.post("/snippets", response_model=schemas.SnippetResponse, tags=["snippets"])
-def create_snippet(
+async def create_snippet(
     snippet: schemas.SnippetCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_db, scope="function"),
+    current_user: auth.AuthenticatedUser = Depends(auth.get_current_user),
+    encryption=Depends(get_encryption_service),
 ):
-    new_snippet = crud.create_snippet(
+    new_snippet = await crud.create_snippet(
         db=db,
         snippet=snippet,
         user_id=current_user.id,
-        encryption_service=encryption_service,
+        encryption_service=encryption,
     )
     # Log snippet creation
-    crud.create_audit_log(
+    await crud.create_audit_log(
         db,
         current_user.id,
         "CREATE",
@@ -229,52 +358,288 @@ def create_snippet(
         new_snippet.id,
         f"Snippet created: {snippet.title}",
     )
-    return new_snippet
+    return schemas.SnippetResponse.from_snippet(new_snippet, snippet.code)
 
 
-@app.get("/snippets", response_model=list[schemas.SnippetResponse], tags=["snippets"])
-def get_my_snippets(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user),
+@app.get(
+    "/snippets",
+    response_model=list[schemas.SnippetListItem],
+    response_model_exclude_unset=True,
+    tags=["snippets"],
+)
+async def get_my_snippets(
+    request: Request,
+    response: Response,
+    limit: int | None = Query(
+        None,
+        ge=1,
+        le=200,
+        description="Page size; 50 when a cursor is given, all snippets if neither",
+    ),
+    cursor: str | None = Query(None, description="Cursor from X-Next-Cursor"),
+    fields: str | None = Query(
+        None, description="Comma-separated fields to return, e.g. id,title"
+    ),
+    db: AsyncSession = Depends(get_db, scope="function"),
+    current_user: auth.AuthenticatedUser = Depends(auth.get_current_user),
+    encryption=Depends(get_encryption_service),
 ):
-    # Get user's snippets
-    snippets = crud.get_user_snippets(db, user_id=current_user.id)
+    selected = list(schemas.SNIPPET_LIST_FIELDS)
+    if fields:
+        selected = [name.strip() for name in fields.split(",") if name.strip()]
+        if "id" not in selected:
+            selected.insert(0, "id")
+        unknown = set(selected) - set(schemas.SNIPPET_LIST_FIELDS)
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown fields: {', '.join(sorted(unknown))}",
+            )
+
+    # Clients that do not page still get every snippet in one response
+    if limit is None and cursor:
+        limit = 50
+
+    # Get a page of the user's snippets
+    try:
+        snippets, next_cursor = await crud.get_user_snippets(
+            db,
+            user_id=current_user.id,
+            limit=limit,
+            cursor=cursor,
+            fields=selected if fields else None,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from None
+
     # Log snippet access
-    crud.create_audit_log(
+    await crud.create_audit_log(
         db, current_user.id, "READ", "SNIPPET", None, "Accessed snippets list"
     )
-    return snippets
+
+    # The page is unchanged if the same rows at the same versions come back
+    etag = make_etag(
+        "snippets",
+        current_user.id,
+        ",".join(selected),
+        next_cursor,
+        *((s.id, s.created_at, s.updated_at) for s in snippets),
+    )
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        # Answer before decrypting anything
+        response = not_modified(etag)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return response
+    set_etag(response, etag)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    items = [
+        {name: getattr(snippet, name) for name in selected if name != "code"}
+        for snippet in snippets
+    ]
+    if "code" in selected:
+        codes = decrypt_codes(
+            encryption,
+            [EncryptedData(s.encrypted_code, s.data_key, s.key_id) for s in snippets],
+        )
+        for item, code in zip(items, codes, strict=True):
+            item["code"] = code
+    return json_list_response(schemas.snippet_list_adapter, items, response)
+
+
+@app.get(
+    "/snippets/search",
+    response_model=list[schemas.SnippetSearchResult],
+    tags=["snippets"],
+)
+async def search_snippets(
+    response: Response,
+    q: str | None = Query(None, max_length=200, description="Words in the title"),
+    language: str | None = Query(None, max_length=50),
+    code_token: str | None = Query(
+        None, max_length=100, description="An identifier used in the code"
+    ),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=10000),
+    db: AsyncSession = Depends(get_db, scope="function"),
+    current_user: auth.AuthenticatedUser = Depends(auth.get_current_user),
+    encryption=Depends(get_encryption_service),
+):
+    """Search the current user's snippets by title, best matches first"""
+    if not (q and q.strip()) and not language and not code_token:
+        raise HTTPException(status_code=400, detail="Provide q, language or code_token")
+
+    token = None
+    if code_token:
+        if not settings.SNIPPET_BLIND_INDEX:
+            raise HTTPException(status_code=400, detail="Code search is not enabled")
+        if encryption is None:
+            raise HTTPException(
+                status_code=500, detail="Encryption service is not available"
+            )
+        token = encryption.blind_tokens([code_token.strip().lower()])[0]
+
+    rows, has_more = await search.search_snippets(
+        db,
+        current_user.id,
+        q=q,
+        language=language,
+        code_token=token,
+        limit=limit,
+        offset=offset,
+    )
+    if has_more:
+        response.headers["X-Next-Offset"] = str(offset + limit)
+
+    await crud.create_audit_log(
+        db, current_user.id, "READ", "SNIPPET", None, "Searched snippets"
+    )
+    return json_list_response(
+        schemas.snippet_search_adapter, [row._mapping for row in rows], response
+    )
+
+
+@app.post(
+    "/snippets/bulk", response_model=schemas.BulkImportResponse, tags=["snippets"]
+)
+async def bulk_import_snippets(
+    request: Request,
+    db: AsyncSession = Depends(get_db, scope="function"),
+    current_user: auth.AuthenticatedUser = Depends(auth.get_current_user),
+    encryption=Depends(get_encryption_service),
+):
+    """Import snippets from an NDJSON body, one {title, language, code} per line.
+
+    The import is all or nothing: any invalid line rolls back the whole request.
+    """
+    if encryption is None:
+        raise HTTPException(
+            status_code=500, detail="Encryption service is not available"
+        )
+
+    imported = 0
+    batch = []
+    try:
+        async for line_number, value in ndjson.iter_ndjson(
+            request.stream(), settings.BULK_MAX_LINE_BYTES
+        ):
+            try:
+                batch.append(schemas.SnippetCreate.model_validate(value))
+            except ValidationError as e:
+                errors = "; ".join(
+                    f"{'.'.join(map(str, error['loc'])) or 'line'}: {error['msg']}"
+                    for error in e.errors()
+                )
+                raise ValueError(f"Line {line_number}: {errors}") from None
+            if len(batch) >= settings.BULK_BATCH_SIZE:
+                imported += len(
+                    await crud.bulk_create_snippets(
+                        db, batch, current_user.id, encryption
+                    )
+                )
+                batch = []
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from None
+    imported += len(
+        await crud.bulk_create_snippets(db, batch, current_user.id, encryption)
+    )
+
+    # One audit record for the whole import
+    await crud.create_audit_log(
+        db,
+        current_user.id,
+        "BULK_CREATE",
+        "SNIPPET",
+        None,
+        f"Imported {imported} snippets",
+    )
+    return {"imported": imported}
+
+
+@app.get("/snippets/export", tags=["snippets"])
+async def export_snippets(
+    # Request scoped: the session stays open while the response streams
+    db: AsyncSession = Depends(get_db),
+    current_user: auth.AuthenticatedUser = Depends(auth.get_streaming_user),
+    encryption=Depends(get_encryption_service),
+):
+    """Stream every snippet of the current user as NDJSON, oldest first"""
+    if encryption is None:
+        raise HTTPException(
+            status_code=500, detail="Encryption service is not available"
+        )
+    await crud.create_audit_log(
+        db, current_user.id, "EXPORT", "SNIPPET", None, "Exported snippets"
+    )
+
+    async def lines():
+        async for rows in crud.stream_user_snippets(
+            db, current_user.id, settings.EXPORT_BATCH_SIZE
+        ):
+            codes = decrypt_codes(
+                encryption,
+                [EncryptedData(r.encrypted_code, r.data_key, r.key_id) for r in rows],
+            )
+            yield b"".join(
+                ndjson.dumps_line(
+                    {
+                        "id": row.id,
+                        "title": row.title,
+                        "language": row.language,
+                        "code": code,
+                        "created_at": row.created_at.isoformat(),
+                    }
+                )
+                for row, code in zip(rows, codes, strict=True)
+            )
+
+    return StreamingResponse(lines(), media_type=ndjson.MEDIA_TYPE)
 
 
 @app.get("/snippets/{snippet_id}", response_model=schemas.SnippetResponse)
-def get_snippet(
+async def get_snippet(
     snippet_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db, scope="function"),
+    current_user: auth.AuthenticatedUser = Depends(auth.get_current_user),
+    encryption=Depends(get_encryption_service),
 ):
-    snippet = crud.get_snippet_by_id(db, snippet_id, current_user.id)
+    snippet = await crud.get_snippet_by_id(db, snippet_id, current_user.id)
     if not snippet:
         raise HTTPException(status_code=404, detail="Snippet not found")
     # Log specific snippet access
-    crud.create_audit_log(
+    await crud.create_audit_log(
         db, current_user.id, "READ", "SNIPPET", snippet_id, f"Accessed: {snippet.title}"
     )
-    return snippet
+    etag = make_etag("snippet", snippet.id, snippet.created_at, snippet.updated_at)
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+    code = decrypt_codes(
+        encryption,
+        [EncryptedData(snippet.encrypted_code, snippet.data_key, snippet.key_id)],
+    )[0]
+    return schemas.SnippetResponse.from_snippet(snippet, code)
 
 
 @app.delete("/snippets/{snippet_id}")
-def delete_snippet(
+async def delete_snippet(
     snippet_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_db, scope="function"),
+    current_user: auth.AuthenticatedUser = Depends(auth.get_current_user),
 ):
-    snippet = crud.get_snippet_by_id(db, snippet_id, current_user.id)
+    snippet = await crud.get_snippet_by_id(db, snippet_id, current_user.id)
     if not snippet:
         raise HTTPException(status_code=404, detail="Snippet not found")
-    db.delete(snippet)
-    db.commit()
+    await crud.delete_snippet_tokens(db, snippet_id)
+    await db.delete(snippet)
+    await db.flush()
+    crud.invalidate_shared_snippet(db, snippet_id)
     # Log snippet deletion
-    crud.create_audit_log(
+    await crud.create_audit_log(
         db,
         current_user.id,
         "DELETE",
@@ -293,13 +658,13 @@ def delete_snippet(
     response_model=schemas.ShareLinkResponse,
     tags=["sharing"],
 )
-def create_share_link(
+async def create_share_link(
     snippet_id: int,
     share_data: schemas.ShareLinkCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_db, scope="function"),
+    current_user: auth.AuthenticatedUser = Depends(auth.get_current_user),
 ):
-    share_link = crud.create_share_link(
+    share_link = await crud.create_share_link(
         db=db,
         snippet_id=snippet_id,
         user_id=current_user.id,
@@ -313,7 +678,7 @@ def create_share_link(
         )
 
     # Log share creation
-    crud.create_audit_log(
+    await crud.create_audit_log(
         db,
         current_user.id,
         "SHARE",
@@ -325,68 +690,276 @@ def create_share_link(
     return share_link
 
 
+@app.get(
+    "/snippets/{snippet_id}/share/stats",
+    response_model=list[schemas.ShareLinkStatsResponse],
+    tags=["sharing"],
+)
+async def get_share_stats(
+    snippet_id: int,
+    db: AsyncSession = Depends(get_db, scope="function"),
+    current_user: auth.AuthenticatedUser = Depends(auth.get_current_user),
+):
+    """View counters of each share link of a snippet.
+
+    Views are flushed every SHARE_STATS_FLUSH_INTERVAL seconds, so the most
+    recent ones may not be counted yet.
+    """
+    snippet = await crud.get_snippet_by_id(db, snippet_id, current_user.id)
+    if not snippet:
+        raise HTTPException(status_code=404, detail="Snippet not found")
+    return [
+        schemas.ShareLinkStatsResponse(
+            id=link.id,
+            token=link.token,
+            expires_at=link.expires_at,
+            is_active=link.is_active,
+            created_at=link.created_at,
+            views=stats.views if stats else 0,
+            unique_visitors=stats.unique_visitors if stats else 0,
+            last_viewed_at=stats.last_viewed_at if stats else None,
+        )
+        for link, stats in await crud.get_share_stats(db, snippet_id)
+    ]
+
+
 @app.get(
     "/shared/{token}", response_model=schemas.SharedSnippetResponse, tags=["sharing"]
 )
-def access_shared_snippet(
+async def access_shared_snippet(
     token: str,
+    request: Request,
+    response: Response,
     access_data: schemas.ShareAccessRequest | None = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db, scope="function"),
+    encryption=Depends(get_encryption_service),
 ):
-    share_link = crud.get_share_link_by_token(db, token)
-    if not share_link:
+    shared = await crud.get_shared_snippet(
+        db, token, decrypt=lambda item: decrypt_codes(encryption, [item])[0]
+    )
+    if not shared:
         raise HTTPException(status_code=404, detail="Shared link not found or expired")
 
     # Check password is required
-    if share_link.password_hash:
+    if shared.password_hash:
         if not access_data or not access_data.password:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Password required to access this shared snippet",
             )
 
-        if not crud.verify_share_password(db, share_link.id, access_data.password):
+        await rate_limit.limit_share_password(request, token)
+        if not await auth.verify_password_async(
+            access_data.password, shared.password_hash
+        ):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password"
             )
 
-    snippet = crud.get_snippet_by_id_any_owner(db, share_link.snippet_id)
-    if not snippet:
-        raise HTTPException(status_code=404, detail="Snippet not found")
+    # Count the view; a hot link must not turn into one audit row per hit
+    await crud.record_share_view(
+        db, shared.share_link_id, rate_limit.client_ip(request)
+    )
+
+    # Only checked after the password, so a 304 reveals nothing
+    etag = make_etag(
+        "shared", token, shared.snippet_id, shared.shared_at, shared.updated_at
+    )
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
+    # Decrypt the code unless the cache already holds plaintext
+    decrypted_code = shared.code
+    if decrypted_code is None:
+        decrypted_code = decrypt_codes(encryption, [shared.encrypted])[0]
+
+    return schemas.SharedSnippetResponse(
+        title=shared.title,
+        language=shared.language,
+        code=decrypted_code,
+        shared_at=shared.shared_at,
+    )
+
+
+def audit_query(
+    action: str | None = None,
+    resource_type: str | None = None,
+    resource_id: int | None = None,
+    since: datetime | None = Query(None, description="Inclusive start time"),
+    until: datetime | None = Query(None, description="Exclusive end time"),
+    user_id: int | None = Query(None, description="Admins only, unless your own"),
+    all_users: bool = Query(False, description="Admins only: every user's entries"),
+) -> dict:
+    """Audit query parameters shared by the listing and the export"""
+    return {
+        "action": action,
+        "resource_type": resource_type,
+        "resource_id": resource_id,
+        "since": since,
+        "until": until,
+        "user_id": user_id,
+        "all_users": all_users,
+    }
+
+
+def audit_filters(
+    current_user: auth.AuthenticatedUser,
+    action: str | None,
+    resource_type: str | None,
+    resource_id: int | None,
+    since: datetime | None,
+    until: datetime | None,
+    user_id: int | None,
+    all_users: bool,
+) -> list:
+    """Audit query filters, scoped to the current user unless they are an admin"""
+    if all_users or (user_id is not None and user_id != current_user.id):
+        if not auth.is_admin(current_user):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required"
+            )
+    if not all_users and user_id is None:
+        user_id = current_user.id
+    return crud.audit_log_filters(
+        user_id=user_id,
+        action=action,
+        resource_type=resource_type,
+        resource_id=resource_id,
+        since=since,
+        until=until,
+    )
+
 
-    # Decrypt the code
+@app.get("/audit", response_model=list[schemas.AuditLogEntry], tags=["audit"])
+async def list_audit_logs(
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: str | None = Query(None, description="Cursor from X-Next-Cursor"),
+    query: dict = Depends(audit_query),
+    current_user: auth.AuthenticatedUser = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_db, scope="function"),
+):
+    """Audit entries newest first, one keyset page at a time"""
+    filters = audit_filters(current_user, **query)
     try:
-        if encryption_service:
-            decrypted_code = encryption_service.decrypt(snippet.encrypted_code)
-        else:
-            # For testing, handle mock encryption
-            if snippet.encrypted_code.startswith("mock_encrypted:"):
-                decrypted_code = snippet.encrypted_code[15:]
-            else:
-                decrypted_code = snippet.code
-    except Exception as e:
-        print(f"Decryption error: {e}")
-        # Fallback
-        decrypted_code = snippet.code
+        entries, next_cursor = await crud.get_audit_logs(db, filters, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from None
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return entries
+
+
+AUDIT_EXPORT_COLUMNS = (
+    "id",
+    "user_id",
+    "action",
+    "resource_type",
+    "resource_id",
+    "details",
+    "ip_address",
+    "user_agent",
+    "created_at",
+)
+
 
-    # Log shared access (anonymous)
-    crud.create_audit_log(
+def csv_cell(value):
+    """Render a CSV value, defusing text a spreadsheet would run as a formula"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, str) and value[:1] in ("=", "+", "-", "@", "\t", "\r"):
+        return "'" + value
+    return value
+
+
+@app.get("/audit/export", tags=["audit"])
+async def export_audit_logs(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    query: dict = Depends(audit_query),
+    # Request scoped: the session stays open while the response streams
+    db: AsyncSession = Depends(get_db),
+    current_user: auth.AuthenticatedUser = Depends(auth.get_streaming_user),
+):
+    """Stream every matching audit entry oldest first, as NDJSON or CSV"""
+    filters = audit_filters(current_user, **query)
+    await crud.create_audit_log(
         db,
+        current_user.id,
+        "EXPORT",
+        "AUDIT_LOG",
         None,
-        "SHARED_ACCESS",
-        "SNIPPET",
-        snippet.id,
-        f"Anonymous access via token: {token}",
+        f"Exported audit log as {format}",
     )
 
-    return schemas.SharedSnippetResponse(
-        title=snippet.title,
-        language=snippet.language,
-        code=decrypted_code,
-        shared_at=share_link.created_at,
+    async def ndjson_lines():
+        async for rows in crud.stream_audit_logs(
+            db, filters, settings.EXPORT_BATCH_SIZE
+        ):
+            yield b"".join(ndjson.dumps_line(row._asdict()) for row in rows)
+
+    async def csv_lines():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(AUDIT_EXPORT_COLUMNS)
+        async for rows in crud.stream_audit_logs(
+            db, filters, settings.EXPORT_BATCH_SIZE
+        ):
+            writer.writerows([csv_cell(value) for value in row] for row in rows)
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+        # Header only, when nothing matched
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+
+    if format == "csv":
+        body, media_type = csv_lines(), "text/csv; charset=utf-8"
+    else:
+        body, media_type = ndjson_lines(), ndjson.MEDIA_TYPE
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="audit-log.{format}"'},
     )
 
 
 @app.get("/users/me", response_model=schemas.UserResponse, tags=["users"])
-def read_users_me(current_user: models.User = Depends(auth.get_current_user)):
+def read_users_me(
+    current_user: auth.AuthenticatedUser = Depends(auth.get_current_user),
+):
     return current_user
+
+
+@app.get("/admin/profiles", tags=["admin"])
+async def list_profiles(
+    current_user: auth.AuthenticatedUser = Depends(auth.get_current_admin),
+):
+    """Summaries of the stored request profiles, newest first"""
+    return profiling.profile_store().summaries()
+
+
+@app.get("/admin/profiles/{profile_id}", tags=["admin"])
+async def get_profile(
+    profile_id: str,
+    current_user: auth.AuthenticatedUser = Depends(auth.get_current_admin),
+):
+    """A stored request profile with its SQL statements and cProfile report"""
+    profile = profiling.profile_store().load(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+
+@app.get("/admin/profiles/{profile_id}/pstats", tags=["admin"])
+async def download_profile_stats(
+    profile_id: str,
+    current_user: auth.AuthenticatedUser = Depends(auth.get_current_admin),
+):
+    """Raw cProfile dump, for pstats, snakeviz or a flame graph tool"""
+    path = profiling.profile_store().stats_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(
+        path, media_type="application/octet-stream", filename=f"{profile_id}.prof"
+    )
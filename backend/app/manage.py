@@ -0,0 +1,521 @@
+"""
+Maintenance commands for SecureCode Vault
+
+Usage:
+    python -m app.manage migrate-ciphertext [--batch-size N] [--pause SECONDS]
+    python -m app.manage purge-plaintext [--batch-size N] [--pause SECONDS]
+    python -m app.manage rotate-keys [--batch-size N] [--max-rate ROWS_PER_SECOND]
+    python -m app.manage create-search-index
+    python -m app.manage build-blind-index [--batch-size N] [--pause SECONDS]
+    python -m app.manage partition-audit-log
+    python -m app.manage create-audit-partitions [--months-ahead N]
+    python -m app.manage split-audit-default-partition
+    python -m app.manage archive-audit-log [--output-dir DIR] [--retain-months N]
+    python -m app.manage sweep-share-links [--batch-size N] [--retention-days N]
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+from sqlalchemy import LargeBinary, delete, insert, inspect, or_, text, update
+
+from . import models
+from .audit_partitions import (
+    archive_audit_log,
+    ensure_audit_partitions,
+    partition_audit_log,
+    split_default_partition,
+)
+from .config import settings
+from .crud import snippet_token_rows
+from .database import SessionLocal, engine
+from .encryption import encryption_service
+from .share_expiry import ShareLinkSweeper
+
+
+def convert_ciphertext_column(bind) -> bool:
+    """Convert a legacy text encrypted_code column to bytea on PostgreSQL.
+
+    Legacy values are ASCII, so they convert byte for byte and stay readable
+    through the legacy decrypt path until they are re-encrypted.
+    """
+    if bind.dialect.name != "postgresql":
+        return False
+    columns = {c["name"]: c for c in inspect(bind).get_columns("snippets")}
+    if isinstance(columns["encrypted_code"]["type"], LargeBinary):
+        return False
+    with bind.begin() as conn:
+        conn.execute(
+            text(
+                "ALTER TABLE snippets ALTER COLUMN encrypted_code TYPE bytea "
+                "USING convert_to(encrypted_code, 'UTF8')"
+            )
+        )
+    return True
+
+
+def add_envelope_key_columns(bind) -> list[str]:
+    """Add the data_key and key_id columns to a snippets table that lacks them.
+
+    create_all does not alter existing tables, so databases created before
+    envelope encryption need this before any snippet can be read. Returns the
+    names of the columns added; safe to run more than once.
+    """
+    table = models.Snippet.__table__
+    existing = {c["name"] for c in inspect(bind).get_columns("snippets")}
+    added = [name for name in ("data_key", "key_id") if name not in existing]
+    with bind.begin() as conn:
+        for name in added:
+            column_type = table.c[name].type.compile(dialect=bind.dialect)
+            conn.execute(text(f"ALTER TABLE snippets ADD COLUMN {name} {column_type}"))
+        for index in table.indexes:
+            if set(index.columns.keys()) <= {"key_id"}:
+                index.create(conn, checkfirst=True)
+    return added
+
+
+def migrate_legacy_ciphertext(
+    session_factory=SessionLocal,
+    service=None,
+    batch_size: int = 500,
+    pause: float = 0.0,
+    start_id: int = 0,
+) -> int:
+    """Re-encrypt legacy double-base64 snippets under per-snippet data keys.
+
+    Works through snippets in id order one batch per transaction, so it can be
+    stopped at any time and resumed with ``start_id``. ``pause`` sleeps between
+    batches to limit the load on a live database.
+    """
+    service = service or encryption_service
+    if service is None:
+        raise ValueError("Encryption service is not available")
+
+    migrated = 0
+    last_id = start_id
+    while True:
+        db = session_factory()
+        try:
+            rows = (
+                db.query(models.Snippet.id, models.Snippet.encrypted_code)
+                .filter(models.Snippet.id > last_id)
+                .order_by(models.Snippet.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                return migrated
+
+            changes = []
+            for row in rows:
+                if not service.is_legacy(row.encrypted_code):
+                    continue
+                encrypted = service.encrypt_envelope(
+                    service.decrypt(row.encrypted_code)
+                )
+                changes.append({"id": row.id, **encrypted._asdict()})
+            if changes:
+                db.execute(update(models.Snippet), changes)
+                db.commit()
+            migrated += len(changes)
+            last_id = rows[-1].id
+        finally:
+            db.close()
+
+        print(f"Migrated {migrated} snippets (up to id {last_id})")
+        if pause:
+            time.sleep(pause)
+
+
+def allow_null_plaintext_column(bind) -> bool:
+    """Drop the NOT NULL constraint on snippets.code on PostgreSQL"""
+    if bind.dialect.name != "postgresql":
+        return False
+    columns = {c["name"]: c for c in inspect(bind).get_columns("snippets")}
+    if columns["code"]["nullable"]:
+        return False
+    with bind.begin() as conn:
+        conn.execute(text("ALTER TABLE snippets ALTER COLUMN code DROP NOT NULL"))
+    return True
+
+
+def purge_plaintext(
+    session_factory=SessionLocal,
+    service=None,
+    batch_size: int = 500,
+    pause: float = 0.0,
+    start_id: int = 0,
+) -> tuple[int, list[int]]:
+    """Null out stored plaintext once the ciphertext is known to match it.
+
+    Rows whose ciphertext does not decrypt to the stored code are left alone
+    and returned so they can be investigated. Returns (purged, skipped_ids).
+    """
+    service = service or encryption_service
+    if service is None:
+        raise ValueError("Encryption service is not available")
+
+    purged = 0
+    skipped = []
+    last_id = start_id
+    while True:
+        db = session_factory()
+        try:
+            rows = (
+                db.query(
+                    models.Snippet.id,
+                    models.Snippet.code,
+                    models.Snippet.encrypted_code,
+                    models.Snippet.data_key,
+                    models.Snippet.key_id,
+                )
+                .filter(models.Snippet.id > last_id, models.Snippet.code.isnot(None))
+                .order_by(models.Snippet.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                return purged, skipped
+
+            changes = []
+            for row in rows:
+                try:
+                    matches = (
+                        service.decrypt_envelope(
+                            row.encrypted_code, row.data_key, row.key_id
+                        )
+                        == row.code
+                    )
+                except Exception:
+                    matches = False
+                if matches:
+                    changes.append({"id": row.id, "code": None})
+                else:
+                    skipped.append(row.id)
+            if changes:
+                db.execute(update(models.Snippet), changes)
+                db.commit()
+            purged += len(changes)
+            last_id = rows[-1].id
+        finally:
+            db.close()
+
+        print(f"Purged plaintext from {purged} snippets (up to id {last_id})")
+        if pause:
+            time.sleep(pause)
+
+
+def rotate_data_keys(
+    session_factory=SessionLocal,
+    service=None,
+    batch_size: int = 500,
+    max_rate: float = 0.0,
+    start_id: int = 0,
+) -> int:
+    """Move every snippet onto the active key-encryption key.
+
+    Only the small wrapped data keys are rewritten; the code ciphertext is
+    left untouched. Snippets written before envelope encryption have no data
+    key yet and are re-encrypted once. Rows already on the active key are
+    skipped, so the job can be interrupted and re-run or resumed with
+    ``start_id``. ``max_rate`` caps rows per second (0 means unlimited).
+    """
+    service = service or encryption_service
+    if service is None:
+        raise ValueError("Encryption service is not available")
+
+    active_key_id = service.active_key_id
+    rotated = 0
+    last_id = start_id
+    while True:
+        started = time.monotonic()
+        db = session_factory()
+        try:
+            rows = (
+                db.query(
+                    models.Snippet.id,
+                    models.Snippet.encrypted_code,
+                    models.Snippet.data_key,
+                    models.Snippet.key_id,
+                )
+                .filter(
+                    models.Snippet.id > last_id,
+                    or_(
+                        models.Snippet.key_id.is_(None),
+                        models.Snippet.key_id != active_key_id,
+                    ),
+                )
+                .order_by(models.Snippet.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                return rotated
+
+            changes = []
+            for row in rows:
+                if row.data_key is None:
+                    encrypted = service.encrypt_envelope(
+                        service.decrypt(row.encrypted_code)
+                    )
+                    changes.append({"id": row.id, **encrypted._asdict()})
+                else:
+                    data_key, key_id = service.rewrap_data_key(row.data_key, row.key_id)
+                    changes.append(
+                        {"id": row.id, "data_key": data_key, "key_id": key_id}
+                    )
+            db.execute(update(models.Snippet), changes)
+            db.commit()
+            rotated += len(changes)
+            last_id = rows[-1].id
+        finally:
+            db.close()
+
+        print(f"Rotated {rotated} snippets to key {active_key_id} (up to id {last_id})")
+        if max_rate:
+            # Sleep off whatever is left of this batch's time budget
+            remaining = len(rows) / max_rate - (time.monotonic() - started)
+            if remaining > 0:
+                time.sleep(remaining)
+
+
+def create_search_index(bind) -> bool:
+    """Add the title search indexes to a snippets table created before search.
+
+    New databases get them from create_all. Safe to run more than once.
+    """
+    if bind.dialect.name == "postgresql":
+        with bind.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            for index in models.Snippet.__table__.indexes:
+                index.create(conn, checkfirst=True)
+        return True
+    if bind.dialect.name == "sqlite":
+        with bind.begin() as conn:
+            for statement in models.SNIPPET_FTS_DDL:
+                conn.execute(text(statement))
+            # Index the rows that existed before the triggers
+            conn.execute(
+                text("INSERT INTO snippets_fts(snippets_fts) VALUES ('rebuild')")
+            )
+        return True
+    return False
+
+
+def build_blind_index(
+    session_factory=SessionLocal,
+    service=None,
+    batch_size: int = 500,
+    pause: float = 0.0,
+    start_id: int = 0,
+) -> int:
+    """(Re)build the code_token blind index for every snippet.
+
+    Each batch decrypts its snippets, replaces their tokens and commits, so
+    the job can be stopped and resumed with ``start_id``.
+    """
+    service = service or encryption_service
+    if service is None:
+        raise ValueError("Encryption service is not available")
+
+    indexed = 0
+    last_id = start_id
+    while True:
+        db = session_factory()
+        try:
+            rows = (
+                db.query(
+                    models.Snippet.id,
+                    models.Snippet.encrypted_code,
+                    models.Snippet.data_key,
+                    models.Snippet.key_id,
+                )
+                .filter(models.Snippet.id > last_id)
+                .order_by(models.Snippet.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                return indexed
+
+            ids = [row.id for row in rows]
+            token_rows = snippet_token_rows(
+                service,
+                [(row.id, service.decrypt_envelope(*row[1:])) for row in rows],
+            )
+            db.execute(
+                delete(models.SnippetToken).where(
+                    models.SnippetToken.snippet_id.in_(ids)
+                )
+            )
+            if token_rows:
+                db.execute(insert(models.SnippetToken), token_rows)
+            db.commit()
+            indexed += len(rows)
+            last_id = ids[-1]
+        finally:
+            db.close()
+
+        print(f"Indexed {indexed} snippets (up to id {last_id})")
+        if pause:
+            time.sleep(pause)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SecureCode Vault maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate = commands.add_parser(
+        "migrate-ciphertext",
+        help="Re-encrypt legacy snippets into the binary envelope format",
+    )
+    migrate.add_argument("--batch-size", type=int, default=500)
+    migrate.add_argument("--pause", type=float, default=0.1)
+    migrate.add_argument("--start-id", type=int, default=0)
+
+    purge = commands.add_parser(
+        "purge-plaintext",
+        help="Remove stored plaintext code once it matches the ciphertext",
+    )
+    purge.add_argument("--batch-size", type=int, default=500)
+    purge.add_argument("--pause", type=float, default=0.1)
+    purge.add_argument("--start-id", type=int, default=0)
+
+    rotate = commands.add_parser(
+        "rotate-keys",
+        help="Re-wrap snippet data keys under the active encryption key",
+    )
+    rotate.add_argument("--batch-size", type=int, default=500)
+    rotate.add_argument("--max-rate", type=float, default=0.0)
+    rotate.add_argument("--start-id", type=int, default=0)
+
+    commands.add_parser(
+        "create-search-index",
+        help="Create the snippet title search indexes on an existing database",
+    )
+
+    blind = commands.add_parser(
+        "build-blind-index",
+        help="Index identifiers in existing snippet code for code_token search",
+    )
+    blind.add_argument("--batch-size", type=int, default=500)
+    blind.add_argument("--pause", type=float, default=0.1)
+    blind.add_argument("--start-id", type=int, default=0)
+
+    commands.add_parser(
+        "partition-audit-log",
+        help="Convert an existing audit_logs table to monthly partitions",
+    )
+
+    partitions = commands.add_parser(
+        "create-audit-partitions",
+        help="Create the upcoming monthly audit log partitions",
+    )
+    partitions.add_argument(
+        "--months-ahead", type=int, default=settings.AUDIT_PARTITION_MONTHS_AHEAD
+    )
+
+    commands.add_parser(
+        "split-audit-default-partition",
+        help="Move rows out of audit_logs_default into their monthly partitions",
+    )
+
+    archive = commands.add_parser(
+        "archive-audit-log",
+        help="Move audit log months past retention into compressed NDJSON files",
+    )
+    archive.add_argument("--output-dir", default=settings.AUDIT_ARCHIVE_DIR)
+    archive.add_argument(
+        "--retain-months", type=int, default=settings.AUDIT_RETENTION_MONTHS
+    )
+    archive.add_argument("--batch-size", type=int, default=5000)
+
+    sweep = commands.add_parser(
+        "sweep-share-links",
+        help="Deactivate expired share links and delete long expired ones",
+    )
+    sweep.add_argument(
+        "--batch-size", type=int, default=settings.SHARE_SWEEP_BATCH_SIZE
+    )
+    sweep.add_argument(
+        "--retention-days", type=float, default=settings.SHARE_LINK_RETENTION_DAYS
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.command in ("migrate-ciphertext", "purge-plaintext", "rotate-keys"):
+        for name in add_envelope_key_columns(engine):
+            print(f"✅ Added snippets.{name}")
+
+    if args.command == "migrate-ciphertext":
+        if convert_ciphertext_column(engine):
+            print("✅ Converted snippets.encrypted_code to bytea")
+        migrated = migrate_legacy_ciphertext(
+            batch_size=args.batch_size, pause=args.pause, start_id=args.start_id
+        )
+        print(f"✅ Migrated {migrated} legacy snippets")
+    elif args.command == "purge-plaintext":
+        if allow_null_plaintext_column(engine):
+            print("✅ Made snippets.code nullable")
+        purged, skipped = purge_plaintext(
+            batch_size=args.batch_size, pause=args.pause, start_id=args.start_id
+        )
+        print(f"✅ Purged plaintext from {purged} snippets")
+        if skipped:
+            print(f"⚠️ Ciphertext did not match plaintext for ids: {skipped}")
+            return 1
+    elif args.command == "rotate-keys":
+        rotated = rotate_data_keys(
+            batch_size=args.batch_size, max_rate=args.max_rate, start_id=args.start_id
+        )
+        print(f"✅ Rotated {rotated} snippets to the active key")
+    elif args.command == "create-search-index":
+        if not create_search_index(engine):
+            print(f"⚠️ Search indexes are not supported on {engine.dialect.name}")
+            return 1
+        print("✅ Created the snippet search indexes")
+    elif args.command == "build-blind-index":
+        indexed = build_blind_index(
+            batch_size=args.batch_size, pause=args.pause, start_id=args.start_id
+        )
+        print(f"✅ Indexed code tokens for {indexed} snippets")
+    elif args.command == "partition-audit-log":
+        if not partition_audit_log(engine):
+            print("⚠️ audit_logs is already partitioned or not on PostgreSQL")
+            return 1
+        print("✅ Converted audit_logs to monthly partitions")
+    elif args.command == "create-audit-partitions":
+        with engine.begin() as conn:
+            created = ensure_audit_partitions(conn, months_ahead=args.months_ahead)
+        print(f"✅ Created {len(created)} audit log partitions")
+    elif args.command == "split-audit-default-partition":
+        created = split_default_partition(engine)
+        for name in created:
+            print(f"Moved default partition rows into {name}")
+        print(f"✅ Created {len(created)} audit log partitions")
+    elif args.command == "archive-audit-log":
+        archived = archive_audit_log(
+            engine,
+            args.output_dir,
+            retain_months=args.retain_months,
+            batch_size=args.batch_size,
+        )
+        for path, count in archived:
+            print(f"Archived {count} audit rows to {path}")
+        print(f"✅ Archived {len(archived)} months of audit logs")
+    elif args.command == "sweep-share-links":
+        # Tables created before the sweeper lack its index
+        for index in models.ShareLink.__table__.indexes:
+            index.create(engine, checkfirst=True)
+        sweeper = ShareLinkSweeper(
+            batch_size=args.batch_size, retention_days=args.retention_days
+        )
+        deactivated, deleted = asyncio.run(sweeper.sweep())
+        print(f"✅ Deactivated {deactivated} and deleted {deleted} share links")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
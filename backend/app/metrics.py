@@ -0,0 +1,163 @@
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time to the response headers, by route template",
+    ["method", "route", "status"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requests currently being handled"
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request",
+    "SQL statements executed while handling a request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 4, 5, 8, 13, 21, 34, 55, 100),
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "db_time_per_request_seconds",
+    "Time spent executing SQL while handling a request",
+    ["route"],
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "SQL statement execution time", ["operation"]
+)
+DB_QUERIES = Counter("db_queries_total", "SQL statements executed", ["operation"])
+PASSWORD_DURATION = Histogram(
+    "password_hash_duration_seconds",
+    "bcrypt time per operation, excluding time queued for the pool",
+    ["operation"],
+    buckets=(0.01, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0, 5.0),
+)
+CRYPTO_DURATION = Histogram(
+    "crypto_duration_seconds",
+    "Snippet encryption and decryption time per call",
+    ["operation"],
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5),
+)
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    db_seconds: float = 0.0
+    # (statement, seconds) pairs, collected only while a request is profiled
+    statements: list | None = None
+
+
+# Set per request by the middleware; mutated by the SQLAlchemy hooks, which
+# run in the request's context (async sessions carry it into their greenlet)
+request_stats: ContextVar[RequestStats | None] = ContextVar(
+    "request_stats", default=None
+)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement else ""
+    DB_QUERY_DURATION.labels(operation).observe(elapsed)
+    DB_QUERIES.labels(operation).inc()
+    stats = request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+        if stats.statements is not None:
+            stats.statements.append((statement, elapsed))
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    # after_cursor_execute does not run for a failed statement
+    conn = context.connection
+    if conn is not None and conn.info.get("query_started"):
+        conn.info["query_started"].pop()
+
+
+def route_label(scope) -> str:
+    """The matched route template, so ids do not explode label cardinality"""
+    route = scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+
+class CacheCollector:
+    """Exports the in-process caches and the database pool at scrape time"""
+
+    def __init__(self, caches, pool_status):
+        self.caches = caches
+        self.pool_status = pool_status
+
+    def collect(self):
+        hits = CounterMetricFamily("cache_hits", "Cache hits", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "Cache misses", labels=["cache"])
+        ratio = GaugeMetricFamily(
+            "cache_hit_ratio", "Hits over lookups since start", labels=["cache"]
+        )
+        entries = GaugeMetricFamily("cache_entries", "Cached entries", labels=["cache"])
+        for name, cache in self.caches().items():
+            stats = cache.stats()
+            hits.add_metric([name], stats["hits"])
+            misses.add_metric([name], stats["misses"])
+            ratio.add_metric([name], stats["hit_ratio"])
+            entries.add_metric([name], stats["entries"])
+        yield from (hits, misses, ratio, entries)
+
+        pool = self.pool_status()
+        for key in ("checked_out", "overflow", "size"):
+            if key in pool:
+                yield GaugeMetricFamily(
+                    f"db_pool_{key}", f"Connection pool {key}", value=pool[key]
+                )
+        yield CounterMetricFamily(
+            "db_pool_timeouts", "Connection checkout timeouts", value=pool["timeouts"]
+        )
+        yield GaugeMetricFamily(
+            "db_pool_wait_max_seconds",
+            "Longest connection checkout wait",
+            value=pool["wait_max_ms"] / 1000,
+        )
+
+
+# Collectors read at scrape time, also added to the multiprocess registry
+_collectors = []
+
+
+def register_collector(caches, pool_status):
+    collector = CacheCollector(caches, pool_status)
+    _collectors.append(collector)
+    REGISTRY.register(collector)
+
+
+def render() -> tuple[bytes, str]:
+    """The exposition body and content type for /metrics"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        # Several worker processes: aggregate what each wrote to the directory.
+        # Caches and pools are per process, so those come from this worker.
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        for collector in _collectors:
+            registry.register(collector)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -1,40 +1,38 @@
-from fastapi import HTTPException, Request
+import time
 
-from .database import SessionLocal
+from fastapi import Request
 
+from . import metrics
 
-async def audit_middleware(request: Request, call_next):
-    """Middleware to log all API requests"""
-    # start_time = time.time()
 
-    # Skip health checks and docs
-    if request.url.path in ["/health", "/docs", "/redoc", "/openapi.json"]:
-        response = await call_next(request)
-        return response
-
-    db = SessionLocal()
+async def timed_call(request: Request, call_next):
+    """Call the app, recording latency and per-request database work"""
+    stats = metrics.RequestStats()
+    token = metrics.request_stats.set(stats)
+    metrics.REQUESTS_IN_FLIGHT.inc()
+    start_time = time.perf_counter()
+    status_code = 500
     try:
         response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - start_time
+        metrics.REQUESTS_IN_FLIGHT.dec()
+        metrics.request_stats.reset(token)
+        # The route is only known once routing has run
+        route = metrics.route_label(request.scope)
+        metrics.REQUEST_LATENCY.labels(request.method, route, status_code).observe(
+            elapsed
+        )
+        metrics.DB_QUERIES_PER_REQUEST.labels(route).observe(stats.queries)
+        metrics.DB_TIME_PER_REQUEST.labels(route).observe(stats.db_seconds)
 
-        # Extract user ID from token if available
-        # user_id = None
-        # auth_header = request.headers.get("authorization")
-        # if auth_header and auth_header.startswith("Bearer "):
-        #     try:
-        #         # For now, I will log with user context for public endpoints
-        #         pass
-        #     except:
-        #         pass
-
-        # Log the request
-        # processing_time = time.time() - start_time
 
-        # I will create audit log in the endpoint handlers themselvses.
-        return response
+async def audit_middleware(request: Request, call_next):
+    """Middleware wrapping every API request.
 
-    except HTTPException:
-        raise
-    except Exception:
-        raise
-    finally:
-        db.close()
+    Requests are only timed here; audit rows are written by the endpoint
+    handlers themselves, on the session they get from get_db.
+    """
+    return await timed_call(request, call_next)
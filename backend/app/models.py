@@ -1,4 +1,22 @@
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String, Text
+from datetime import UTC, datetime
+
+from sqlalchemy import (
+    DDL,
+    BigInteger,
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    PrimaryKeyConstraint,
+    String,
+    Text,
+    event,
+    literal_column,
+    text,
+)
 from sqlalchemy.sql import func
 
 from .database import Base
@@ -6,6 +24,8 @@ from .database import Base
 
 class User(Base):
     __tablename__ = "users"
+    # Fetch server defaults (created_at) with RETURNING instead of a refresh
+    __mapper_args__ = {"eager_defaults": "auto"}
 
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String(255), unique=True, index=True, nullable=False)
@@ -15,19 +35,103 @@ class User(Base):
 
 class Snippet(Base):
     __tablename__ = "snippets"
+    __mapper_args__ = {"eager_defaults": "auto"}
+    # Backs keyset pagination of a user's snippets, newest first, and the
+    # language filter of search. The GIN indexes serve title search on
+    # PostgreSQL; SQLite uses the snippets_fts table below instead.
+    __table_args__ = (
+        Index("ix_snippets_user_created_id", "user_id", "created_at", "id"),
+        Index("ix_snippets_user_language", "user_id", "language"),
+        Index(
+            "ix_snippets_title_tsv",
+            text("to_tsvector('simple'::regconfig, title)"),
+            postgresql_using="gin",
+        ).ddl_if(dialect="postgresql"),
+        Index(
+            "ix_snippets_title_trgm",
+            "title",
+            postgresql_using="gin",
+            postgresql_ops={"title": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255), nullable=False)
     language = Column(String(50), nullable=False)
-    code = Column(Text, nullable=False)
-    encrypted_code = Column(Text, nullable=False)
+    # Plaintext is only kept when SNIPPET_STORE_PLAINTEXT is enabled
+    code = Column(Text, nullable=True)
+    encrypted_code = Column(LargeBinary, nullable=False)
+    # Per-snippet data key, wrapped by the key-encryption key named by key_id
+    data_key = Column(LargeBinary, nullable=True)
+    key_id = Column(String(64), nullable=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Set client side as well so pagination cursors round-trip exactly
+    created_at = Column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(UTC),
+        server_default=func.now(),
+    )
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
 
+# Search must use the same expression as ix_snippets_title_tsv to hit it
+snippet_title_tsvector = func.to_tsvector(
+    literal_column("'simple'::regconfig"), Snippet.title
+)
+
+# Title search support that create_all cannot express as plain indexes
+event.listen(
+    Snippet.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+SNIPPET_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS snippets_fts "
+    "USING fts5(title, content='snippets', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS snippets_fts_insert AFTER INSERT ON snippets "
+    "BEGIN INSERT INTO snippets_fts(rowid, title) VALUES (new.id, new.title); END",
+    "CREATE TRIGGER IF NOT EXISTS snippets_fts_delete AFTER DELETE ON snippets "
+    "BEGIN INSERT INTO snippets_fts(snippets_fts, rowid, title) "
+    "VALUES ('delete', old.id, old.title); END",
+    "CREATE TRIGGER IF NOT EXISTS snippets_fts_update AFTER UPDATE OF title "
+    "ON snippets BEGIN INSERT INTO snippets_fts(snippets_fts, rowid, title) "
+    "VALUES ('delete', old.id, old.title); "
+    "INSERT INTO snippets_fts(rowid, title) VALUES (new.id, new.title); END",
+)
+for statement in SNIPPET_FTS_DDL:
+    event.listen(
+        Snippet.__table__,
+        "after_create",
+        DDL(statement).execute_if(dialect="sqlite"),
+    )
+event.listen(
+    Snippet.__table__,
+    "before_drop",
+    DDL("DROP TABLE IF EXISTS snippets_fts").execute_if(dialect="sqlite"),
+)
+
+
+class SnippetToken(Base):
+    """Blind index: keyed hash of an identifier -> snippets whose code has it"""
+
+    __tablename__ = "snippet_tokens"
+
+    token = Column(LargeBinary(16), primary_key=True)
+    snippet_id = Column(
+        Integer,
+        ForeignKey("snippets.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
+    )
+
+
 class ShareLink(Base):
     __tablename__ = "share_links"
+    __mapper_args__ = {"eager_defaults": "auto"}
+    # Lets the expiry sweeper find expired active links without a scan
+    __table_args__ = (
+        Index("ix_share_links_active_expires", "is_active", "expires_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     snippet_id = Column(Integer, ForeignKey("snippets.id"), nullable=False)
@@ -38,10 +142,50 @@ class ShareLink(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 
+class ShareLinkStats(Base):
+    """View counters per share link, flushed in batches by app.share_stats"""
+
+    __tablename__ = "share_link_stats"
+
+    share_link_id = Column(
+        Integer, ForeignKey("share_links.id", ondelete="CASCADE"), primary_key=True
+    )
+    views = Column(BigInteger, nullable=False, default=0)
+    # HyperLogLog registers of visitor addresses and the estimate they give
+    visitor_sketch = Column(LargeBinary, nullable=False)
+    unique_visitors = Column(Integer, nullable=False, default=0)
+    last_viewed_at = Column(DateTime(timezone=True), nullable=True)
+
+
+def _not_postgresql(ddl, target, bind, dialect=None, **kw) -> bool:
+    return dialect.name != "postgresql"
+
+
 class AuditLog(Base):
+    """Audit trail, range partitioned by month on PostgreSQL.
+
+    A partitioned table's keys must include the partition column, so there
+    it gets a unique (id, created_at) index instead of a primary key. The
+    monthly partitions are managed by app.audit_partitions.
+    """
+
     __tablename__ = "audit_logs"
+    __table_args__ = (
+        PrimaryKeyConstraint("id").ddl_if(callable_=_not_postgresql),
+        Index("ix_audit_logs_id_created", "id", "created_at", unique=True).ddl_if(
+            dialect="postgresql"
+        ),
+        Index("ix_audit_logs_user_created", "user_id", "created_at"),
+        Index(
+            "ix_audit_logs_resource_created",
+            "resource_type",
+            "resource_id",
+            "created_at",
+        ),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, autoincrement=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     action = Column(String(50), nullable=False)
     resource_type = Column(String(50), nullable=False)
@@ -49,4 +193,18 @@ class AuditLog(Base):
     details = Column(Text, nullable=True)
     ip_address = Column(String(45), nullable=True)
     user_agent = Column(Text, nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # The partition key, so it can never be NULL
+    created_at = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+
+
+# Rows outside every monthly partition land here instead of failing
+event.listen(
+    AuditLog.__table__,
+    "after_create",
+    DDL(
+        "CREATE TABLE IF NOT EXISTS audit_logs_default "
+        "PARTITION OF audit_logs DEFAULT"
+    ).execute_if(dialect="postgresql"),
+)
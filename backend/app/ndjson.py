@@ -0,0 +1,42 @@
+import orjson
+
+MEDIA_TYPE = "application/x-ndjson"
+
+
+async def iter_ndjson(chunks, max_line_bytes: int):
+    """Parse newline-delimited JSON from an async stream of byte chunks.
+
+    Yields (line_number, value) for each non-blank line. Raises ValueError for
+    malformed JSON or for a line longer than ``max_line_bytes``.
+    """
+    buffer = b""
+    line_number = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            value = _parse_line(line, line_number, max_line_bytes)
+            if value is not None:
+                yield line_number, value
+        if len(buffer) > max_line_bytes:
+            raise ValueError(f"Line {line_number + 1}: line is too long")
+    value = _parse_line(buffer, line_number + 1, max_line_bytes)
+    if value is not None:
+        yield line_number + 1, value
+
+
+def _parse_line(line: bytes, line_number: int, max_line_bytes: int):
+    if len(line) > max_line_bytes:
+        raise ValueError(f"Line {line_number}: line is too long")
+    if not line.strip():
+        return None
+    try:
+        return orjson.loads(line)
+    except orjson.JSONDecodeError:
+        raise ValueError(f"Line {line_number}: invalid JSON") from None
+
+
+def dumps_line(value) -> bytes:
+    """Serialise one NDJSON record, including its trailing newline"""
+    return orjson.dumps(value, option=orjson.OPT_APPEND_NEWLINE)
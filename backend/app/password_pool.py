@@ -0,0 +1,84 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import settings
+
+
+class PoolSaturatedError(Exception):
+    """Raised when the password pool cannot accept more work"""
+
+
+class PasswordWorkerPool:
+    """Bounded executor for bcrypt hashing and verification.
+
+    bcrypt releases the GIL, so a small thread pool runs hashes in parallel
+    while capping how many request threads can be tied up waiting for them.
+    Work beyond ``max_workers + max_pending`` is rejected immediately.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = settings.PASSWORD_POOL_WORKERS,
+        max_pending: int = settings.PASSWORD_POOL_MAX_PENDING,
+    ):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="password"
+        )
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def run(self, fn, *args):
+        """Run fn(*args) on the pool and wait for the result"""
+        self._admit()
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            self._release()
+
+    async def run_async(self, fn, *args):
+        """Run fn(*args) on the pool without blocking the event loop"""
+        self._admit()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        # Released when the work ends, not when the caller stops waiting: a
+        # cancelled request cannot stop a hash that is already running
+        future.add_done_callback(lambda _: self._release())
+        return await asyncio.wrap_future(future)
+
+    def _admit(self):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PoolSaturatedError("Password worker pool is saturated")
+        with self._lock:
+            self._in_flight += 1
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+            self.completed += 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = self._in_flight
+            return {
+                "workers": self.max_workers,
+                "in_flight": in_flight,
+                "queued": max(0, in_flight - self.max_workers),
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+
+# Global password pool shared by all request handlers
+password_pool = PasswordWorkerPool()
@@ -0,0 +1,208 @@
+import asyncio
+import cProfile
+import hashlib
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import re
+import time
+import uuid
+from datetime import UTC, datetime
+
+from fastapi import Request
+
+from . import metrics
+from .config import settings
+
+PROFILE_HEADER = "X-Debug-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+# Functions listed in the text report, by cumulative time
+REPORT_LIMIT = 60
+
+PROFILE_ID = re.compile(r"[0-9a-f]{32}")
+
+
+def sign_profile_request(secret: str, expires: int) -> str:
+    """X-Debug-Profile value that requests profiling until unix time ``expires``"""
+    signature = hmac.new(
+        secret.encode("utf-8"), str(expires).encode("utf-8"), hashlib.sha256
+    ).hexdigest()
+    return f"{expires}.{signature}"
+
+
+def valid_profile_header(value: str | None, secret: str, now: float = None) -> bool:
+    if not value or not secret:
+        return False
+    try:
+        expires = int(value.partition(".")[0])
+    except ValueError:
+        return False
+    if expires < (time.time() if now is None else now):
+        return False
+    return hmac.compare_digest(sign_profile_request(secret, expires), value)
+
+
+class ProfileStore:
+    """Bounded on-disk ring buffer of request profiles.
+
+    Each profile is a JSON record next to its raw cProfile dump, which loads
+    into pstats, snakeviz or flameprof. Once more than ``max_profiles`` are
+    stored the oldest are deleted.
+    """
+
+    def __init__(self, directory: str, max_profiles: int):
+        self.directory = directory
+        self.max_profiles = max_profiles
+
+    def save(self, record: dict, profiler: cProfile.Profile) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = uuid.uuid4().hex
+        # Names sort oldest first, which is the order they are evicted in
+        base = os.path.join(self.directory, f"{time.time_ns():020d}-{profile_id}")
+        profiler.dump_stats(f"{base}.prof")
+        with open(f"{base}.json", "w") as f:
+            json.dump({"id": profile_id, **record}, f)
+        self._prune()
+        return profile_id
+
+    def summaries(self) -> list[dict]:
+        """Summaries of the stored profiles, newest first"""
+        summaries = []
+        for name in reversed(self._names()):
+            record = self._read(name)
+            if record is not None:
+                record.pop("profile", None)
+                record["sql_count"] = len(record.pop("sql", []))
+                summaries.append(record)
+        return summaries
+
+    def load(self, profile_id: str) -> dict | None:
+        name = self._find(profile_id)
+        return self._read(name) if name else None
+
+    def stats_path(self, profile_id: str) -> str | None:
+        name = self._find(profile_id)
+        path = os.path.join(self.directory, f"{name}.prof") if name else None
+        return path if path and os.path.exists(path) else None
+
+    def _names(self) -> list[str]:
+        try:
+            files = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-5] for name in files if name.endswith(".json"))
+
+    def _find(self, profile_id: str) -> str | None:
+        if not PROFILE_ID.fullmatch(profile_id):
+            return None
+        for name in self._names():
+            if name.endswith(f"-{profile_id}"):
+                return name
+        return None
+
+    def _read(self, name: str) -> dict | None:
+        try:
+            with open(os.path.join(self.directory, f"{name}.json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _prune(self):
+        names = self._names()
+        for name in names[: max(0, len(names) - self.max_profiles)]:
+            for suffix in (".json", ".prof"):
+                try:
+                    os.remove(os.path.join(self.directory, name + suffix))
+                except FileNotFoundError:
+                    pass
+
+
+def profile_store() -> ProfileStore:
+    return ProfileStore(settings.PROFILING_DIR, settings.PROFILING_MAX_PROFILES)
+
+
+def profile_reason(request: Request) -> str | None:
+    """Why this request should be profiled, or None to leave it alone"""
+    if valid_profile_header(
+        request.headers.get(PROFILE_HEADER), settings.PROFILING_SECRET
+    ):
+        return "header"
+    if random.random() < settings.PROFILING_SAMPLE_RATE:
+        return "sampled"
+    return None
+
+
+def report(profiler: cProfile.Profile) -> str:
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(REPORT_LIMIT)
+    return stream.getvalue()
+
+
+# cProfile can only run one profiler per thread, and every request shares the
+# event loop thread, so at most one request is profiled at a time. Other
+# requests interleaving with it on the loop show up in its profile too.
+_active = False
+
+
+def wrap(call_next):
+    """Wrap the middleware's call_next so selected requests are profiled"""
+    if not settings.PROFILING_ENABLED:
+        return call_next
+
+    async def profiled_call_next(request: Request):
+        global _active
+        reason = None if _active else profile_reason(request)
+        if reason is None:
+            return await call_next(request)
+        _active = True
+        try:
+            return await _profile(request, call_next, reason)
+        finally:
+            _active = False
+
+    return profiled_call_next
+
+
+async def _profile(request: Request, call_next, reason: str):
+    stats = metrics.request_stats.get()
+    if stats is not None:
+        stats.statements = []
+    profiler = cProfile.Profile()
+    started_at = datetime.now(UTC)
+    started = time.perf_counter()
+    status_code = 500
+    profiler.enable()
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        profiler.disable()
+        duration = time.perf_counter() - started
+        # Statements only; parameters can hold user data
+        statements = stats.statements if stats is not None else []
+        record = {
+            "method": request.method,
+            "path": request.url.path,
+            "route": metrics.route_label(request.scope),
+            "status": status_code,
+            "reason": reason,
+            "started_at": started_at.isoformat(),
+            "duration_ms": round(duration * 1000, 3),
+            "sql": [
+                {"statement": statement, "duration_ms": round(seconds * 1000, 3)}
+                for statement, seconds in statements
+            ],
+            "profile": report(profiler),
+        }
+        try:
+            profile_id = await asyncio.to_thread(profile_store().save, record, profiler)
+        except OSError as e:
+            print(f"Could not store request profile: {e}")
+            profile_id = None
+    if profile_id:
+        response.headers[PROFILE_ID_HEADER] = profile_id
+    return response
@@ -0,0 +1,195 @@
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from fastapi import HTTPException, Request, status
+
+from .cache import get_async_redis
+from .config import settings
+
+# Token buckets for every key are refilled and checked in one atomic step.
+# A request is admitted only if every bucket has a token, and then takes one
+# from each, so a request rejected by one limit does not use up the others.
+# Redis TIME is the clock, so all workers agree on it.
+TOKEN_BUCKET_LUA = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local wait = 0
+local levels = {}
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2 - 1])
+    local rate = tonumber(ARGV[i * 2])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    if tokens < 1 then
+        wait = math.max(wait, (1 - tokens) / rate)
+    end
+    levels[i] = tokens
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2 - 1])
+    local rate = tonumber(ARGV[i * 2])
+    local tokens = levels[i]
+    if wait == 0 then
+        tokens = tokens - 1
+    end
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('PEXPIRE', key, math.ceil(capacity / rate * 1000))
+end
+return tostring(wait)
+"""
+
+# After a Redis error, limit in memory for this long before trying Redis again
+REDIS_RETRY_INTERVAL = 30.0
+
+
+@dataclass(frozen=True)
+class Limit:
+    """``capacity`` attempts per ``period`` seconds for one key"""
+
+    key: str
+    capacity: int
+    period: float
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.period
+
+
+class MemoryTokenBuckets:
+    """Per-process token buckets, used without Redis or while it is down"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, limits: list[Limit]) -> float:
+        """Take a token from every bucket, or return seconds until allowed"""
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            wait = 0.0
+            for limit in limits:
+                tokens, ts = self._buckets.get(limit.key, (limit.capacity, now))
+                tokens = min(limit.capacity, tokens + (now - ts) * limit.rate)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / limit.rate)
+                levels.append(tokens)
+            for limit, tokens in zip(limits, levels, strict=True):
+                self._buckets[limit.key] = (tokens if wait else tokens - 1, now)
+                self._buckets.move_to_end(limit.key)
+            # Least recently used buckets are dropped first; they are the
+            # ones most likely to have refilled anyway
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RateLimiter:
+    """Token bucket limiter shared between workers through Redis.
+
+    Falls back to per-process buckets when Redis is disabled or failing, so
+    an unavailable Redis never takes the protected endpoints down.
+    """
+
+    def __init__(self):
+        self.memory = MemoryTokenBuckets()
+        self._script = None
+        self._redis_retry_at = 0.0
+
+    async def hit(self, limits: list[Limit]) -> float:
+        """Count an attempt against every limit.
+
+        Returns 0 when the attempt is allowed, otherwise the seconds to wait.
+        """
+        if settings.RATE_LIMIT_REDIS and time.monotonic() >= self._redis_retry_at:
+            try:
+                return await self._redis_hit(limits)
+            except Exception as e:
+                print(f"Redis rate limiter error, limiting in memory: {e}")
+                self._redis_retry_at = time.monotonic() + REDIS_RETRY_INTERVAL
+        return self.memory.hit(limits)
+
+    async def _redis_hit(self, limits: list[Limit]) -> float:
+        if self._script is None:
+            client = get_async_redis()
+            if client is None:
+                raise RuntimeError("Redis client is not available")
+            self._script = client.register_script(TOKEN_BUCKET_LUA)
+        args = []
+        for limit in limits:
+            args.extend((limit.capacity, limit.rate))
+        wait = await self._script(
+            keys=[f"ratelimit:{limit.key}" for limit in limits], args=args
+        )
+        return float(wait)
+
+    def clear(self):
+        self.memory.clear()
+
+
+rate_limiter = RateLimiter()
+
+
+def client_ip(request: Request) -> str:
+    """The client address, taken from X-Forwarded-For when the peer is trusted.
+
+    Uvicorn only rewrites it for proxies listed in FORWARDED_ALLOW_IPS.
+    """
+    return request.client.host if request.client else "unknown"
+
+
+def hashed(value: str) -> str:
+    # Keys outlive requests in Redis, so they hold no emails or share tokens
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()[:32]
+
+
+async def enforce(*limits: Limit):
+    """Raise 429 with Retry-After once any of the limits is exhausted"""
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+    wait = await rate_limiter.hit(list(limits))
+    if wait > 0:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts, please retry later",
+            headers={"Retry-After": str(max(1, math.ceil(wait)))},
+        )
+
+
+async def limit_login(request: Request, email: str):
+    window = settings.RATE_LIMIT_WINDOW
+    await enforce(
+        Limit(
+            f"login:ip:{client_ip(request)}", settings.RATE_LIMIT_LOGIN_PER_IP, window
+        ),
+        Limit(
+            f"login:account:{hashed(email.strip().lower())}",
+            settings.RATE_LIMIT_LOGIN_PER_ACCOUNT,
+            window,
+        ),
+    )
+
+
+async def limit_share_password(request: Request, token: str):
+    window = settings.RATE_LIMIT_WINDOW
+    await enforce(
+        Limit(
+            f"shared:ip:{client_ip(request)}", settings.RATE_LIMIT_SHARED_PER_IP, window
+        ),
+        Limit(
+            f"shared:token:{hashed(token)}",
+            settings.RATE_LIMIT_SHARED_PER_TOKEN,
+            window,
+        ),
+    )
@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from pydantic import BaseModel, EmailStr, field_validator
+from pydantic import BaseModel, EmailStr, TypeAdapter, field_validator
 
 # User Schemas
 
@@ -70,6 +70,52 @@ class SnippetResponse(SnippetBase):
     class Config:
         from_attributes = True
 
+    @classmethod
+    def from_snippet(cls, snippet, code: str) -> "SnippetResponse":
+        """Build a response from a stored snippet and its decrypted code"""
+        return cls(
+            id=snippet.id,
+            title=snippet.title,
+            language=snippet.language,
+            code=code,
+            user_id=snippet.user_id,
+            created_at=snippet.created_at,
+            updated_at=snippet.updated_at,
+        )
+
+
+class SnippetListItem(BaseModel):
+    """Snippet in a list view; only the requested fields are set"""
+
+    id: int
+    title: str | None = None
+    language: str | None = None
+    code: str | None = None
+    user_id: int | None = None
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
+
+
+SNIPPET_LIST_FIELDS = tuple(SnippetListItem.model_fields)
+
+
+class SnippetSearchResult(BaseModel):
+    id: int
+    title: str
+    language: str
+    created_at: datetime
+    score: float
+
+
+# Built once: list endpoints validate plain dicts and dump JSON bytes in one
+# pass through pydantic-core instead of building a model per row
+snippet_list_adapter = TypeAdapter(list[SnippetListItem])
+snippet_search_adapter = TypeAdapter(list[SnippetSearchResult])
+
+
+class BulkImportResponse(BaseModel):
+    imported: int
+
 
 class ShareLinkCreate(BaseModel):
     # snippet_id: int
@@ -91,6 +137,18 @@ class ShareLinkResponse(BaseModel):
         from_attributes = True
 
 
+class ShareLinkStatsResponse(BaseModel):
+    id: int
+    token: str
+    expires_at: datetime | None
+    is_active: bool
+    created_at: datetime
+    views: int
+    # HyperLogLog estimate, within a few percent
+    unique_visitors: int
+    last_viewed_at: datetime | None
+
+
 class SharedSnippetResponse(BaseModel):
     title: str
     language: str
@@ -100,3 +158,16 @@ class SharedSnippetResponse(BaseModel):
 
 class ShareAccessRequest(BaseModel):
     password: str | None = None
+
+
+class AuditLogEntry(BaseModel):
+    id: int
+    user_id: int | None
+    action: str
+    resource_type: str
+    resource_id: int | None
+    details: str | None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,115 @@
+import re
+
+from sqlalchemy import (
+    and_,
+    column,
+    func,
+    literal,
+    literal_column,
+    or_,
+    select,
+    table,
+    text,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .models import snippet_title_tsvector
+
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+SIMPLE_CONFIG = literal_column("'simple'::regconfig")
+snippets_fts = table("snippets_fts", column("rowid"))
+
+
+def extract_identifiers(code: str, min_length: int, max_tokens: int) -> list[str]:
+    """Distinct lower-cased identifiers in code, in order of first use"""
+    identifiers = {}
+    for match in IDENTIFIER.finditer(code):
+        identifier = match.group().lower()
+        if len(identifier) >= min_length:
+            identifiers.setdefault(identifier, None)
+            if len(identifiers) >= max_tokens:
+                break
+    return list(identifiers)
+
+
+def fts5_query(q: str) -> str:
+    """Quote each word of q as an FTS5 prefix term; all words must match"""
+    return " ".join('"' + word.replace('"', '""') + '"*' for word in q.split())
+
+
+def _title_match(dialect: str, q: str):
+    """Return (condition, score, extra FROM target) for a title query"""
+    title = models.Snippet.title
+    if dialect == "postgresql":
+        # Word matches via the tsvector index, fuzzy and substring matches via
+        # the trigram index
+        tsquery = func.websearch_to_tsquery(SIMPLE_CONFIG, q)
+        condition = or_(
+            snippet_title_tsvector.bool_op("@@")(tsquery),
+            title.bool_op("%")(q),
+            title.icontains(q, autoescape=True),
+        )
+        score = func.greatest(
+            func.ts_rank(snippet_title_tsvector, tsquery), func.similarity(title, q)
+        )
+        return condition, score, None
+    if dialect == "sqlite":
+        condition = text("snippets_fts MATCH :fts_query").bindparams(
+            fts_query=fts5_query(q)
+        )
+        # bm25() is lower for better matches
+        score = -func.bm25(literal_column("snippets_fts"))
+        return condition, score, snippets_fts
+    return title.icontains(q, autoescape=True), literal(0.0), None
+
+
+async def search_snippets(
+    db: AsyncSession,
+    user_id: int,
+    q: str = None,
+    language: str = None,
+    code_token: bytes = None,
+    limit: int = 20,
+    offset: int = 0,
+):
+    """Search a user's snippets by title, best matches first.
+
+    ``code_token`` is a blind index token; only snippets whose code contains
+    the identifier it was computed from are returned. Returns the page of
+    rows (id, title, language, created_at, score) and whether more results
+    follow it.
+    """
+    columns = (
+        models.Snippet.id,
+        models.Snippet.title,
+        models.Snippet.language,
+        models.Snippet.created_at,
+    )
+    if q and q.strip():
+        condition, score, fts_table = _title_match(db.bind.dialect.name, q.strip())
+        query = select(*columns, score.label("score")).where(condition)
+        if fts_table is not None:
+            query = query.join(fts_table, fts_table.c.rowid == models.Snippet.id)
+        query = query.order_by(score.desc(), models.Snippet.id.desc())
+    else:
+        query = select(*columns, literal(0.0).label("score")).order_by(
+            models.Snippet.created_at.desc(), models.Snippet.id.desc()
+        )
+
+    query = query.where(models.Snippet.user_id == user_id)
+    if language:
+        query = query.where(models.Snippet.language == language)
+    if code_token is not None:
+        # An index probe on the token instead of decrypting every row
+        query = query.join(
+            models.SnippetToken,
+            and_(
+                models.SnippetToken.snippet_id == models.Snippet.id,
+                models.SnippetToken.token == code_token,
+            ),
+        )
+
+    # Fetch one extra row to know whether there is another page
+    rows = (await db.execute(query.limit(limit + 1).offset(offset))).all()
+    return rows[:limit], len(rows) > limit
@@ -0,0 +1,135 @@
+import asyncio
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .config import settings
+from .database import AsyncSessionLocal
+
+
+async def deactivate_expired_share_links(
+    db: AsyncSession, now: datetime, batch_size: int
+) -> int:
+    """Mark one batch of expired, still active share links inactive"""
+    link = models.ShareLink
+    expired = (
+        select(link.id)
+        .where(link.is_active, link.expires_at < now)
+        .limit(batch_size)
+        .scalar_subquery()
+    )
+    result = await db.execute(
+        update(link)
+        .where(link.id.in_(expired))
+        .values(is_active=False)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+async def delete_expired_share_links(
+    db: AsyncSession, cutoff: datetime, batch_size: int
+) -> int:
+    """Delete one batch of share links that expired before ``cutoff``"""
+    link = models.ShareLink
+    ids = (
+        (
+            await db.execute(
+                # Deactivated first by the sweep, so this also uses the index
+                select(link.id)
+                .where(~link.is_active, link.expires_at < cutoff)
+                .limit(batch_size)
+            )
+        )
+        .scalars()
+        .all()
+    )
+    if ids:
+        # Explicit rather than ON DELETE CASCADE, which SQLite does not enforce
+        await db.execute(
+            delete(models.ShareLinkStats).where(
+                models.ShareLinkStats.share_link_id.in_(ids)
+            )
+        )
+        await db.execute(delete(link).where(link.id.in_(ids)))
+    return len(ids)
+
+
+class ShareLinkSweeper:
+    """Deactivates expired share links, and later deletes them, in batches.
+
+    Every batch is its own short transaction, so the sweep never holds locks
+    on many rows. The read path already ignores expired links, so a sweep
+    that runs late only leaves rows around for longer.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        interval: float = settings.SHARE_SWEEP_INTERVAL,
+        batch_size: int = settings.SHARE_SWEEP_BATCH_SIZE,
+        retention_days: float = settings.SHARE_LINK_RETENTION_DAYS,
+    ):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.batch_size = batch_size
+        self.retention = timedelta(days=retention_days)
+        self._stop_event = None
+        self._task = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Start sweeping on the running event loop"""
+        if self.running:
+            return
+        self._stop_event = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="share-link-sweeper")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stop_event.set()
+        await self._task
+        self._task = None
+
+    async def sweep(self, now: datetime = None) -> tuple[int, int]:
+        """Run every batch that is due. Returns (deactivated, deleted)."""
+        now = now or datetime.now(UTC)
+        deactivated = await self._batches(deactivate_expired_share_links, now)
+        deleted = await self._batches(delete_expired_share_links, now - self.retention)
+        return deactivated, deleted
+
+    async def _batches(self, step, moment: datetime) -> int:
+        total = 0
+        while True:
+            async with self.session_factory() as db:
+                count = await step(db, moment, self.batch_size)
+                await db.commit()
+            total += count
+            if count < self.batch_size:
+                return total
+
+    async def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                deactivated, deleted = await self.sweep()
+                if deactivated or deleted:
+                    print(
+                        f"Share link sweep: {deactivated} deactivated, "
+                        f"{deleted} deleted"
+                    )
+            except Exception as e:
+                print(f"Share link sweep failed: {e}")
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), self.interval)
+            except TimeoutError:
+                pass
+
+
+# Global sweeper - started from the application lifespan
+share_link_sweeper = ShareLinkSweeper()
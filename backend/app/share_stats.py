@@ -0,0 +1,210 @@
+import asyncio
+import hashlib
+import math
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .config import settings
+from .database import AsyncSessionLocal
+
+
+class HyperLogLog:
+    """Fixed-size estimate of distinct values, mergeable by register maximum.
+
+    2**precision one-byte registers; the standard error is about
+    1.04 / sqrt(2**precision), so 1.6% at the default of 12.
+    """
+
+    def __init__(self, precision: int = 12, registers: bytes = None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers or self.size)
+        if len(self.registers) != self.size:
+            raise ValueError("Register count does not match the precision")
+
+    def add(self, value: bytes):
+        digest = hashlib.blake2b(value, digest_size=8).digest()
+        hashed = int.from_bytes(digest, "big")
+        index = hashed >> (64 - self.precision)
+        remaining = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - remaining.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size**2 / sum(2.0**-r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.size and zeros:
+            # Linear counting is more accurate while many registers are empty
+            estimate = self.size * math.log(self.size / zeros)
+        return round(estimate)
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
+
+
+@dataclass
+class ShareViews:
+    """Views of one share link since the last flush"""
+
+    count: int = 0
+    visitors: HyperLogLog = field(default_factory=HyperLogLog)
+    last_viewed_at: datetime | None = None
+
+    def add(self, visitor: str, viewed_at: datetime):
+        self.count += 1
+        self.visitors.add(visitor.encode("utf-8"))
+        self.last_viewed_at = viewed_at
+
+    def merge(self, other: "ShareViews"):
+        self.count += other.count
+        self.visitors.merge(other.visitors)
+        self.last_viewed_at = max(
+            filter(None, (self.last_viewed_at, other.last_viewed_at)), default=None
+        )
+
+
+async def apply_share_views(
+    db: AsyncSession, pending: dict[int, "ShareViews"], check_links: bool = True
+):
+    """Add pending views to share_link_stats, one row per share link.
+
+    Rows are locked while they are merged so flushes from several workers
+    add up. Views of share links deleted in the meantime are dropped, unless
+    ``check_links`` is False because the caller just resolved the links.
+    """
+    live = set(pending)
+    if check_links:
+        live = set(
+            (
+                await db.execute(
+                    select(models.ShareLink.id).where(models.ShareLink.id.in_(live))
+                )
+            ).scalars()
+        )
+    rows = {
+        row.share_link_id: row
+        for row in (
+            await db.execute(
+                select(models.ShareLinkStats)
+                .where(models.ShareLinkStats.share_link_id.in_(live))
+                # A fixed lock order keeps concurrent flushes from deadlocking
+                .order_by(models.ShareLinkStats.share_link_id)
+                .with_for_update()
+            )
+        ).scalars()
+    }
+    for share_link_id in sorted(live):
+        views = pending[share_link_id]
+        row = rows.get(share_link_id)
+        if row is None:
+            row = models.ShareLinkStats(
+                share_link_id=share_link_id, views=0, visitor_sketch=b""
+            )
+            db.add(row)
+        last_viewed_at = row.last_viewed_at
+        if last_viewed_at is not None and last_viewed_at.tzinfo is None:
+            # SQLite hands timestamps back without their zone
+            last_viewed_at = last_viewed_at.replace(tzinfo=UTC)
+        sketch = ShareViews(
+            visitors=HyperLogLog(registers=row.visitor_sketch or None),
+            last_viewed_at=last_viewed_at,
+        )
+        sketch.merge(views)
+        row.views += views.count
+        row.visitor_sketch = sketch.visitors.to_bytes()
+        row.unique_visitors = sketch.visitors.count()
+        row.last_viewed_at = sketch.last_viewed_at
+    await db.flush()
+
+
+class ShareStatsAggregator:
+    """Collects share link views in memory and writes them on an interval.
+
+    A hot link costs one row update per flush instead of one insert per
+    view. Views still in memory are lost if the process dies.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        flush_interval: float = settings.SHARE_STATS_FLUSH_INTERVAL,
+        max_pending: int = settings.SHARE_STATS_MAX_PENDING,
+    ):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._wake = None
+        self._stopping = False
+        self._task = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Start the background flusher on the running event loop"""
+        if self.running:
+            return
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run(), name="share-stats")
+
+    async def stop(self, timeout: float = 10.0):
+        """Stop the flusher and write what is still pending"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except TimeoutError:
+            print("Share stats flusher did not stop in time")
+        self._task = None
+        await self.flush()
+
+    def record(self, share_link_id: int, visitor: str, viewed_at: datetime = None):
+        views = self._pending.get(share_link_id)
+        if views is None:
+            views = self._pending[share_link_id] = ShareViews()
+        views.add(visitor, viewed_at or datetime.now(UTC))
+        if len(self._pending) >= self.max_pending:
+            # Too many distinct links waiting; flush early to bound memory
+            self._wake.set()
+
+    async def flush(self):
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            async with self.session_factory() as db:
+                await apply_share_views(db, pending)
+                await db.commit()
+        except Exception as e:
+            print(f"Share stats flush failed: {e}")
+            # Keep the views for the next attempt
+            for share_link_id, views in pending.items():
+                current = self._pending.setdefault(share_link_id, ShareViews())
+                current.merge(views)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+
+# Global aggregator - started from the application lifespan
+share_stats = ShareStatsAggregator()
@@ -0,0 +1,219 @@
+"""
+Load test for the API hot paths
+
+Usage:
+    python -m benchmarks.api [--database-url URL] [--requests N]
+        [--concurrency N] [--scenarios login,list_snippets,...]
+        [--output results.json] [--baseline baseline.json] [--threshold 0.2]
+
+Without --base-url the app is served in-process over ASGI, against a fresh
+SQLite file by default or any --database-url (e.g. a local Postgres). With
+--base-url the requests go to an already running server instead.
+
+Each scenario sends --requests requests from --concurrency concurrent
+clients and reports p50/p95/p99 latency and req/s. --output saves the
+results; --baseline compares against saved results and exits with status 1
+when a scenario's p95 or throughput regresses by more than --threshold.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+import httpx
+
+from .report import compare, format_table, summarize
+
+PASSWORD = "benchmark-pass-123"
+SCENARIOS = (
+    "login",
+    "create_snippet",
+    "list_snippets",
+    "get_snippet",
+    "create_share",
+    "access_shared",
+)
+
+
+@asynccontextmanager
+async def open_client(base_url: str | None):
+    """An HTTP client for a running server, or for the app served in-process"""
+    if base_url:
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+            yield client
+        return
+
+    # Imported late so DATABASE_URL is already set when the engines are built
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://benchmark", timeout=60
+        ) as client:
+            yield client
+
+
+async def setup(client: httpx.AsyncClient, seed: int) -> dict:
+    """Create a user with seed snippets and a share link to benchmark against"""
+    email = f"bench-{uuid.uuid4().hex[:12]}@example.com"
+    credentials = {"email": email, "password": PASSWORD}
+    response = await client.post("/auth/register", json=credentials)
+    response.raise_for_status()
+    response = await client.post("/auth/login", json=credentials)
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    snippet_ids = []
+    for i in range(seed):
+        response = await client.post("/snippets", json=snippet_body(i), headers=headers)
+        response.raise_for_status()
+        snippet_ids.append(response.json()["id"])
+
+    response = await client.post(
+        f"/snippets/{snippet_ids[0]}/share",
+        json={"expires_hours": 24},
+        headers=headers,
+    )
+    response.raise_for_status()
+    return {
+        "credentials": credentials,
+        "headers": headers,
+        "snippet_ids": snippet_ids,
+        "share_token": response.json()["token"],
+    }
+
+
+def snippet_body(i: int) -> dict:
+    return {
+        "title": f"Benchmark snippet {i}",
+        "language": "python",
+        "code": f"def handler_{i}(request):\n    return request.json()\n" * 10,
+    }
+
+
+def scenario_request(name: str, state: dict, i: int):
+    """The (method, url, kwargs) of request i of a scenario"""
+    headers = state["headers"]
+    ids = state["snippet_ids"]
+    if name == "login":
+        return "POST", "/auth/login", {"json": state["credentials"]}
+    if name == "create_snippet":
+        return "POST", "/snippets", {"json": snippet_body(i), "headers": headers}
+    if name == "list_snippets":
+        return "GET", "/snippets?limit=50", {"headers": headers}
+    if name == "get_snippet":
+        return "GET", f"/snippets/{ids[i % len(ids)]}", {"headers": headers}
+    if name == "create_share":
+        url = f"/snippets/{ids[i % len(ids)]}/share"
+        return "POST", url, {"json": {"expires_hours": 1}, "headers": headers}
+    if name == "access_shared":
+        return "GET", f"/shared/{state['share_token']}", {}
+    raise ValueError(f"Unknown scenario {name}")
+
+
+async def run_scenario(
+    client: httpx.AsyncClient, name: str, state: dict, requests: int, concurrency: int
+) -> dict:
+    latencies = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            method, url, kwargs = scenario_request(name, state, i)
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def run(args) -> dict:
+    async with open_client(args.base_url) as client:
+        state = await setup(client, args.seed)
+        results = {}
+        for name in args.scenarios:
+            # One untimed round warms caches, pools and connections
+            await run_scenario(client, name, state, args.concurrency, args.concurrency)
+            results[name] = await run_scenario(
+                client, name, state, args.requests, args.concurrency
+            )
+            print(f"  {name}: {results[name]['rps']:.1f} req/s", file=sys.stderr)
+        return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the API hot paths")
+    parser.add_argument("--base-url", help="Benchmark a running server instead")
+    parser.add_argument(
+        "--database-url", help="Database for the in-process app (default: SQLite)"
+    )
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=100, help="Snippets to create")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--baseline", help="Compare against saved results")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    args.scenarios = [name.strip() for name in args.scenarios.split(",")]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    if not args.base_url:
+        database_url = args.database_url or (
+            f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'benchmark.db')}"
+        )
+        os.environ["DATABASE_URL"] = database_url
+        # Every request comes from one client, which the login limit would stop
+        os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+        print(f"Benchmarking in-process against {database_url}", file=sys.stderr)
+
+    results = asyncio.run(run(args))
+    print(format_table(results))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "meta": {
+                        "target": args.base_url or "in-process",
+                        "requests": args.requests,
+                        "concurrency": args.concurrency,
+                        "timestamp": time.time(),
+                    },
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"Regressions beyond {args.threshold:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Latency summaries and baseline comparison for the API benchmark
+"""
+
+import math
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of already sorted values"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    """Summarise one scenario; latencies are in seconds"""
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "rps": len(values) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Describe every scenario that regressed by more than threshold (0.2 = 20%).
+
+    A scenario regresses when its p95 latency grows or its throughput drops by
+    more than the threshold, or when it fails requests the baseline did not.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (
+            1 + threshold
+        ):
+            regressions.append(
+                f"{name}: p95 {current['p95_ms']:.1f} ms vs {previous['p95_ms']:.1f} ms"
+            )
+        if current["rps"] < previous["rps"] * (1 - threshold):
+            regressions.append(
+                f"{name}: {current['rps']:.1f} req/s vs {previous['rps']:.1f} req/s"
+            )
+        if current["errors"] > previous["errors"]:
+            regressions.append(
+                f"{name}: {current['errors']} errors vs {previous['errors']}"
+            )
+    return regressions
+
+
+def format_table(results: dict) -> str:
+    lines = [
+        f"{'scenario':16} {'requests':>8} {'errors':>6} {'req/s':>8} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    ]
+    for name, r in results.items():
+        lines.append(
+            f"{name:16} {r['requests']:8d} {r['errors']:6d} {r['rps']:8.1f} "
+            f"{r['p50_ms']:8.2f} {r['p95_ms']:8.2f} {r['p99_ms']:8.2f}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,87 @@
+"""
+Serialization cost of snippet list responses per 1,000 snippets
+
+Usage:
+    python -m benchmarks.serialization [--rows N] [--code-lines N]
+
+Compares the paths a GET /snippets page can take from fetched rows to
+response bytes:
+
+* encoder: a model per row, then jsonable_encoder and json.dumps (FastAPI's
+  path with a custom response class such as ORJSONResponse)
+* models: a model per row, then FastAPI's TypeAdapter validation and
+  pydantic-core dump_json (FastAPI's default path)
+* adapter: plain dicts validated and dumped by one prebuilt TypeAdapter
+  (json_list_response)
+"""
+
+import argparse
+import json
+import timeit
+from datetime import UTC, datetime
+
+from fastapi.encoders import jsonable_encoder
+
+from app import schemas
+
+
+def make_rows(count: int, code_lines: int) -> list[dict]:
+    now = datetime.now(UTC)
+    return [
+        {
+            "id": i,
+            "title": f"Snippet {i}",
+            "language": "python",
+            "code": "print('hello, world')\n" * code_lines,
+            "user_id": 1,
+            "created_at": now,
+            "updated_at": None,
+        }
+        for i in range(count)
+    ]
+
+
+def serialize_encoder(rows):
+    items = [schemas.SnippetListItem(**row) for row in rows]
+    return json.dumps(jsonable_encoder(items)).encode()
+
+
+def serialize_models(rows):
+    adapter = schemas.snippet_list_adapter
+    items = [schemas.SnippetListItem(**row) for row in rows]
+    return adapter.dump_json(adapter.validate_python(items), exclude_unset=True)
+
+
+def serialize_adapter(rows):
+    adapter = schemas.snippet_list_adapter
+    return adapter.dump_json(adapter.validate_python(rows), exclude_unset=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--code-lines", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    rows = make_rows(args.rows, args.code_lines)
+    # Every path must produce the same document
+    expected = json.loads(serialize_adapter(rows))
+    results = {}
+    for name, fn in (
+        ("encoder", serialize_encoder),
+        ("models", serialize_models),
+        ("adapter", serialize_adapter),
+    ):
+        assert json.loads(fn(rows)) == expected, name
+        number = 10
+        best = min(
+            timeit.repeat(lambda fn=fn: fn(rows), number=number, repeat=args.repeat)
+        )
+        results[name] = best / number / args.rows * 1000 * 1000
+        print(f"{name:8} {results[name]:8.2f} ms per 1k snippets")
+    print(f"adapter is {results['encoder'] / results['adapter']:.1f}x the encoder path")
+
+
+if __name__ == "__main__":
+    main()
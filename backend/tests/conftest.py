@@ -1,41 +1,66 @@
 # isort: skip_file
 # fmt: off
+import asyncio
+from contextlib import asynccontextmanager
+import os
 import sys
 sys.path.insert(0, '/app')
 
+# Audit rows are written inline with the request's unit of work in tests
+os.environ.setdefault("AUDIT_ASYNC", "false")
+os.environ.setdefault("SHARE_STATS_ASYNC", "false")
+os.environ.setdefault("SHARE_SWEEP_ENABLED", "false")
+os.environ.setdefault("SHARE_CACHE_REDIS", "false")
+os.environ.setdefault("RATE_LIMIT_REDIS", "false")
+
 import pytest
-from sqlalchemy.pool import StaticPool
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
 from fastapi.testclient import TestClient
 
 
-from app.database import Base, get_db
+from app.database import Base, get_db, run_after_commit
+from app.encryption import get_encryption_service
 from app.main import app
 from tests.mocks import mock_encryption_service
 
 
+def enable_wal(dbapi_connection, connection_record):
+    # Lets the test session read while the API's async engine writes
+    dbapi_connection.execute("PRAGMA journal_mode=WAL")
 
 
-# Test database URL - use SQLite in-memory for tests
-TEST_DATABASE_URL = "sqlite:///:memory:"
+@pytest.fixture(scope="function")
+def database_path(tmp_path):
+    """A fresh SQLite file per test, shared by the sync and async engines"""
+    return tmp_path / "test.db"
 
-engine = create_engine(
-    TEST_DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    poolclass=StaticPool,
-)
 
-TestingSessionLocal = sessionmaker(
-    autocommit=False, autoflush=False, bind=engine)
+@pytest.fixture(scope="function")
+def app_engine(database_path):
+    """Async engine used by the API under test"""
+    # NullPool because TestClient may run requests on different event loops
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{database_path}", poolclass=NullPool
+    )
+    yield engine
+    asyncio.run(engine.dispose())
 
 
 @pytest.fixture(scope="function")
-def db_session():
+def db_session(database_path):
     """Create a fresh database for each test"""
+    engine = create_engine(
+        f"sqlite:///{database_path}", connect_args={"check_same_thread": False}
+    )
+    event.listen(engine, "connect", enable_wal)
     # Create the tables
     Base.metadata.create_all(bind=engine)
 
+    TestingSessionLocal = sessionmaker(
+        autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
     session = TestingSessionLocal()
     try:
         yield session
@@ -43,34 +68,56 @@ def db_session():
         session.close()
     # Drop all tables after test
     Base.metadata.drop_all(bind=engine)
+    engine.dispose()
 
 
 @pytest.fixture(scope="function")
-def client(db_session):
+def client(db_session, app_engine):
     """Create a test client that uses the override_get_db fixture"""
-    def override_get_db():
-        try:
-            yield db_session
-        finally:
-            pass
+    TestingAsyncSessionLocal = async_sessionmaker(
+        bind=app_engine, autoflush=False, expire_on_commit=False)
+
+    async def override_get_db():
+        # Mirror the request-scoped unit of work in app.database.get_db
+        async with TestingAsyncSessionLocal() as db:
+            try:
+                yield db
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+            await run_after_commit(db)
 
     def override_get_encryption():
         return mock_encryption_service
 
     app.dependency_overrides[get_db] = override_get_db
     # Mock the encryption service for tests
-    from app import crud
-    original_create_snippet = crud.create_snippet
-
-    def mock_create_snippet(db, snippet, user_id, encryption_service=None):
-        return original_create_snippet(db, snippet, user_id, mock_encryption_service)
-
-    crud.create_snippet = mock_create_snippet
+    app.dependency_overrides[get_encryption_service] = override_get_encryption
+    # Caches outlive the per-test database, so every test starts with them empty
+    from app import auth, crud, rate_limit
+    auth.clear_auth_caches()
+    crud.shared_snippet_cache.clear()
+    rate_limit.rate_limiter.clear()
 
     with TestClient(app) as test_client:
         yield test_client
     app.dependency_overrides.clear()
-    crud.create_snippet = original_create_snippet
+
+
+@pytest.fixture
+def opened_sessions(client):
+    """Record every database session the API opens"""
+    opened = []
+    open_session = asynccontextmanager(app.dependency_overrides[get_db])
+
+    async def counting_get_db():
+        async with open_session() as db:
+            opened.append(db)
+            yield db
+
+    app.dependency_overrides[get_db] = counting_get_db
+    return opened
 
 
 @pytest.fixture
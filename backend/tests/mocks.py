@@ -2,6 +2,8 @@
 Mock services for testing
 """
 
+from app.encryption import EncryptedData
+
 
 class MockEncryptionService:
     """Mock encryption service that doesn't actually encrypt for testing"""
@@ -9,18 +11,60 @@ class MockEncryptionService:
     def __init__(self):
         print("🔧 Using mock encryption service for testing")
 
-    def encrypt(self, data: str) -> str:
+    def encrypt(self, data: str) -> bytes:
         """Mock encryption - returns a predictable 'encrypted' version"""
         # For testing, we need this to be reversible
-        return f"mock_encrypted:{data}"
+        return f"mock_encrypted:{data}".encode()
 
-    def decrypt(self, encrypted_data: str) -> str:
+    def decrypt(self, encrypted_data: bytes | str) -> str:
         """Mock decryption - reverses the mock encryption"""
+        if isinstance(encrypted_data, bytes):
+            encrypted_data = encrypted_data.decode()
         if encrypted_data.startswith("mock_encrypted:"):
             return encrypted_data[15:]  # Remove the prefix
         # If it's not our mock format, return as-is (for already encrypted data)
         return encrypted_data
 
+    def encrypt_envelope(self, data: str) -> EncryptedData:
+        """Mock envelope encryption - a fixed fake data key"""
+        return EncryptedData(self.encrypt(data), b"mock_data_key", "mock")
+
+    def decrypt_envelope(self, encrypted_data, data_key=None, key_id=None) -> str:
+        """Mock envelope decryption - the data key is ignored"""
+        return self.decrypt(encrypted_data)
+
+    def encrypt_many(self, values: list[str]) -> list[EncryptedData]:
+        """Mock batch encryption"""
+        return [self.encrypt_envelope(value) for value in values]
+
+    def blind_tokens(self, values: list[str]) -> list[bytes]:
+        """Mock blind index tokens - readable but still bytes"""
+        return [f"mock_token:{value}".encode() for value in values]
+
+    def decrypt_many(self, items: list[EncryptedData]) -> list[str]:
+        """Mock batch decryption"""
+        return [self.decrypt_envelope(*item) for item in items]
+
 
 # Global mock encryption service
 mock_encryption_service = MockEncryptionService()
+
+
+class FakeAsyncRedis:
+    """Just enough of redis.asyncio.Redis for the Redis cache tiers"""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+    async def incr(self, key):
+        self.data[key] = int(self.data.get(key) or 0) + 1
+        return self.data[key]
@@ -1,3 +1,6 @@
+from app import compression
+
+
 def test_health_check(client):
     """Test health check endpoint"""
     response = client.get("/health")
@@ -60,3 +63,52 @@ def test_protected_endpoint_wth_auth(client, test_user):
     assert response.status_code == 200
     data = response.json()
     assert data["email"] == test_user["email"]
+
+
+def test_large_responses_are_compressed(client, test_user):
+    """Test code bodies are compressed with Brotli or gzip above the threshold"""
+    code = "print('compress me')\n" * 200
+    response = client.post(
+        "/snippets",
+        json={"title": "Big", "language": "python", "code": code},
+        headers=test_user["headers"],
+    )
+    snippet_url = f"/snippets/{response.json()['id']}"
+
+    response = client.get(
+        snippet_url, headers={**test_user["headers"], "Accept-Encoding": "gzip"}
+    )
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.json()["code"] == code
+
+    # Brotli is preferred when the optional package is installed
+    response = client.get(
+        snippet_url, headers={**test_user["headers"], "Accept-Encoding": "br, gzip"}
+    )
+    expected = "gzip" if compression.brotli is None else "br"
+    assert response.headers["content-encoding"] == expected
+    assert response.json()["code"] == code
+
+    # Small responses are left alone
+    response = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+
+def test_accept_encoding_parsing():
+    """Test q-values are read from the q parameter only and never raise"""
+    assert compression.accepts_encoding("gzip, br", "br")
+    assert compression.accepts_encoding("br;q=0.5", "br")
+    assert compression.accepts_encoding("br; level=1; q=1", "br")
+    assert compression.accepts_encoding("br;x=y", "br")
+    assert not compression.accepts_encoding("br;q=0", "br")
+    assert not compression.accepts_encoding("br;q=x", "br")
+    assert not compression.accepts_encoding("br;q=", "br")
+    assert not compression.accepts_encoding("gzip", "br")
+
+
+def test_malformed_accept_encoding_is_not_an_error(client):
+    """Test client-controlled Accept-Encoding values cannot cause a 500"""
+    for value in ("br;q=x", "br;q=1;x=y", "br;;q", "br;q=1e999"):
+        response = client.get("/", headers={"Accept-Encoding": value})
+        assert response.status_code == 200
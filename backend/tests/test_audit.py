@@ -0,0 +1,150 @@
+import asyncio
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import audit, crud, models
+from app.audit import AuditWriter, build_audit_entry
+from app.database import Base, run_after_commit
+
+
+async def make_session_factory(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'audit.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    return async_sessionmaker(bind=engine, expire_on_commit=False)
+
+
+def test_audit_writer_flushes_batches_on_stop(tmp_path):
+    """Test queued audit entries are written when the writer stops"""
+
+    async def scenario():
+        session_factory = await make_session_factory(tmp_path)
+        writer = AuditWriter(session_factory=session_factory, batch_size=10)
+        writer.start()
+
+        for i in range(25):
+            assert await writer.submit(build_audit_entry(None, "READ", "SNIPPET", i))
+
+        await writer.stop()
+
+        async with session_factory() as db:
+            count = await db.scalar(select(func.count()).select_from(models.AuditLog))
+        return writer, count
+
+    writer, count = asyncio.run(scenario())
+    assert count == 25
+    assert writer.written == 25
+    assert writer.pending() == 0
+
+
+def test_audit_writer_rejects_when_full(tmp_path):
+    """Test submit reports failure instead of blocking forever"""
+
+    async def scenario():
+        writer = AuditWriter(
+            session_factory=await make_session_factory(tmp_path),
+            max_queue_size=1,
+            enqueue_timeout=0.01,
+        )
+        # Create the queue without a flusher consuming it
+        writer._queue = asyncio.Queue(maxsize=1)
+
+        assert await writer.submit(build_audit_entry(None, "READ", "SNIPPET"))
+        assert not await writer.submit(build_audit_entry(None, "READ", "SNIPPET"))
+
+    asyncio.run(scenario())
+
+
+def test_audit_writer_retries_failed_batch_by_row(tmp_path):
+    """Test a bad row is dropped alone rather than with its whole batch"""
+
+    async def scenario():
+        session_factory = await make_session_factory(tmp_path)
+        writer = AuditWriter(session_factory=session_factory, batch_size=10)
+        writer.start()
+
+        for i in range(5):
+            assert await writer.submit(build_audit_entry(None, "READ", "SNIPPET", i))
+        # action is NOT NULL, so this row fails its batch
+        assert await writer.submit(build_audit_entry(None, None, "SNIPPET"))
+        await writer.stop()
+
+        async with session_factory() as db:
+            count = await db.scalar(select(func.count()).select_from(models.AuditLog))
+        return writer, count
+
+    writer, count = asyncio.run(scenario())
+    assert count == 5
+    assert writer.written == 5
+    assert writer.failed == 1
+
+
+def test_audit_entries_wait_for_commit(tmp_path, monkeypatch):
+    """Test entries reach the writer only after their transaction commits"""
+    submitted = []
+
+    async def scenario():
+        session_factory = await make_session_factory(tmp_path)
+        writer = AuditWriter(session_factory=session_factory, flush_interval=60)
+        submit_committed = writer.submit_committed
+
+        async def recording(entries):
+            submitted.extend(entries)
+            await submit_committed(entries)
+
+        monkeypatch.setattr(writer, "submit_committed", recording)
+        monkeypatch.setattr(audit, "audit_writer", writer)
+        writer.start()
+
+        async with session_factory() as db:
+            await crud.create_audit_log(db, None, "READ", "SNIPPET", 1)
+            await db.flush()
+            await db.commit()
+            # Handed over by the unit of work, after the commit
+            assert submitted == []
+            await run_after_commit(db)
+            assert [entry["resource_id"] for entry in submitted] == [1]
+
+        async with session_factory() as db:
+            await crud.create_audit_log(db, None, "READ", "SNIPPET", 2)
+            await db.rollback()
+            # The session starts a new transaction after the rollback
+            await db.commit()
+            await run_after_commit(db)
+        await writer.stop()
+
+        async with session_factory() as db:
+            return list(
+                (await db.execute(select(models.AuditLog.resource_id))).scalars()
+            )
+
+    assert asyncio.run(scenario()) == [1]
+    assert len(submitted) == 1
+
+
+def test_committed_entries_written_directly_when_full(tmp_path):
+    """Test entries that find the queue full are written by the caller"""
+
+    async def scenario():
+        session_factory = await make_session_factory(tmp_path)
+        writer = AuditWriter(
+            session_factory=session_factory, max_queue_size=1, enqueue_timeout=0.01
+        )
+        # A full queue and a flusher that never drains it
+        writer._queue = asyncio.Queue(maxsize=1)
+        writer._queue.put_nowait(build_audit_entry(None, "READ", "SNIPPET"))
+        writer._task = asyncio.get_running_loop().create_future()
+
+        await writer.submit_committed(
+            [build_audit_entry(None, "READ", "SNIPPET", i) for i in range(3)]
+        )
+        writer._task.cancel()
+
+        async with session_factory() as db:
+            count = await db.scalar(select(func.count()).select_from(models.AuditLog))
+        return writer, count
+
+    writer, count = asyncio.run(scenario())
+    assert count == 3
+    assert writer.written == 3
@@ -0,0 +1,133 @@
+import csv
+import io
+import json
+
+from app import auth
+from app.config import settings
+from app.main import csv_cell
+
+
+def make_user(client, email: str) -> dict:
+    credentials = {"email": email, "password": "Pass123!"}
+    client.post("/auth/register", json=credentials)
+    token = client.post("/auth/login", json=credentials).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def create_snippets(client, headers, count: int) -> list[int]:
+    return [
+        client.post(
+            "/snippets",
+            json={"title": f"S{i}", "code": "x = 1", "language": "python"},
+            headers=headers,
+        ).json()["id"]
+        for i in range(count)
+    ]
+
+
+def test_audit_pages_are_scoped_and_filtered(client, test_user):
+    """Test users page through their own audit entries newest first"""
+    other = make_user(client, "other@example.com")
+    create_snippets(client, other, 1)
+    ids = create_snippets(client, test_user["headers"], 3)
+
+    entries = []
+    cursor = None
+    while True:
+        params = {"limit": 2, "action": "CREATE"}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/audit", params=params, headers=test_user["headers"])
+        assert response.status_code == 200
+        entries += response.json()
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert [entry["resource_id"] for entry in entries] == ids[::-1]
+    user_ids = {entry["user_id"] for entry in entries}
+    assert len(user_ids) == 1
+
+    by_resource = client.get(
+        "/audit",
+        params={"resource_type": "SNIPPET", "resource_id": ids[0]},
+        headers=test_user["headers"],
+    ).json()
+    assert [entry["action"] for entry in by_resource] == ["CREATE"]
+
+    later = client.get(
+        "/audit",
+        params={"since": entries[0]["created_at"], "action": "CREATE"},
+        headers=test_user["headers"],
+    ).json()
+    assert [entry["resource_id"] for entry in later] == [ids[-1]]
+
+
+def test_audit_other_users_need_admin(client, test_user, monkeypatch):
+    """Test only admins can read other users' or everyone's entries"""
+    other = make_user(client, "other@example.com")
+    create_snippets(client, other, 1)
+
+    assert (
+        client.get(
+            "/audit", params={"all_users": True}, headers=test_user["headers"]
+        ).status_code
+        == 403
+    )
+
+    monkeypatch.setattr(settings, "ADMIN_EMAILS", test_user["email"])
+    everyone = client.get(
+        "/audit", params={"all_users": True}, headers=test_user["headers"]
+    ).json()
+    assert len({entry["user_id"] for entry in everyone}) == 2
+
+
+def test_audit_export_streams_ndjson_and_csv(client, test_user, monkeypatch):
+    """Test the export covers every matching entry across fetch batches"""
+    monkeypatch.setattr(settings, "EXPORT_BATCH_SIZE", 2)
+    ids = create_snippets(client, test_user["headers"], 5)
+
+    response = client.get(
+        "/audit/export", params={"action": "CREATE"}, headers=test_user["headers"]
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["resource_id"] for row in rows] == ids
+
+    response = client.get(
+        "/audit/export",
+        params={"action": "CREATE", "format": "csv"},
+        headers=test_user["headers"],
+    )
+    assert response.headers["content-type"].startswith("text/csv")
+    records = list(csv.DictReader(io.StringIO(response.text)))
+    assert [int(record["resource_id"]) for record in records] == ids
+    assert records[0]["action"] == "CREATE"
+
+    # An empty result still has the header row
+    response = client.get(
+        "/audit/export",
+        params={"action": "NONE", "format": "csv"},
+        headers=test_user["headers"],
+    )
+    assert (
+        response.text.strip()
+        == "id,user_id,action,resource_type,resource_id,details,ip_address,user_agent,created_at"
+    )
+
+
+def test_audit_export_uses_one_session(client, test_user, opened_sessions):
+    """Test auth and the streamed export share the request's session"""
+    auth.clear_auth_caches()
+    response = client.get("/audit/export", headers=test_user["headers"])
+    assert response.status_code == 200
+    assert len(opened_sessions) == 1
+
+
+def test_csv_cells_cannot_run_as_formulas():
+    """Test exported text a spreadsheet would evaluate is quoted"""
+    assert csv_cell("=HYPERLINK()") == "'=HYPERLINK()"
+    assert csv_cell("@SUM(A1)") == "'@SUM(A1)"
+    assert csv_cell("Accessed: x") == "Accessed: x"
+    assert csv_cell(None) is None
@@ -0,0 +1,125 @@
+import contextlib
+import gzip
+import json
+from datetime import UTC, datetime
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateTable
+
+from app import audit_partitions, models
+from app.audit_partitions import (
+    add_months,
+    archive_audit_log,
+    create_partition_sql,
+    ensure_audit_partitions,
+    month_start,
+    partition_name,
+    split_default_partition_sql,
+)
+
+
+def test_month_arithmetic():
+    """Test partition months roll over year boundaries"""
+    december = datetime(2025, 12, 1, tzinfo=UTC)
+    assert add_months(december, 1) == datetime(2026, 1, 1, tzinfo=UTC)
+    assert add_months(december, -12) == datetime(2024, 12, 1, tzinfo=UTC)
+    assert partition_name(december) == "audit_logs_p202512"
+
+
+def test_audit_log_is_partitioned_on_postgresql():
+    """Test the PostgreSQL table is range partitioned without a primary key"""
+    ddl = str(
+        CreateTable(models.AuditLog.__table__).compile(dialect=postgresql.dialect())
+    )
+    assert "PARTITION BY RANGE (created_at)" in ddl
+    assert "PRIMARY KEY" not in ddl
+    indexes = {index.name for index in models.AuditLog.__table__.indexes}
+    assert {"ix_audit_logs_user_created", "ix_audit_logs_resource_created"} <= indexes
+
+
+def test_partition_ddl():
+    """Test the PostgreSQL statements for a month and a default split"""
+    month = datetime(2026, 3, 1, tzinfo=UTC)
+    assert create_partition_sql(month) == (
+        "CREATE TABLE IF NOT EXISTS audit_logs_p202603 PARTITION OF audit_logs "
+        "FOR VALUES FROM ('2026-03-01T00:00:00+00:00') "
+        "TO ('2026-04-01T00:00:00+00:00')"
+    )
+    in_month = (
+        "created_at >= '2026-03-01T00:00:00+00:00' "
+        "AND created_at < '2026-04-01T00:00:00+00:00'"
+    )
+    assert split_default_partition_sql(month) == [
+        "ALTER TABLE audit_logs DETACH PARTITION audit_logs_default",
+        create_partition_sql(month),
+        f"INSERT INTO audit_logs_p202603 SELECT * FROM audit_logs_default "
+        f"WHERE {in_month}",
+        f"DELETE FROM audit_logs_default WHERE {in_month}",
+        "ALTER TABLE audit_logs ATTACH PARTITION audit_logs_default DEFAULT",
+    ]
+
+
+class RecordingConnection:
+    """Stands in for a PostgreSQL connection; fails statements naming a table"""
+
+    def __init__(self, failing: str):
+        self.failing = failing
+        self.statements = []
+
+    def begin_nested(self):
+        return contextlib.nullcontext()
+
+    def execute(self, statement):
+        sql = str(statement)
+        if self.failing in sql:
+            raise DBAPIError(sql, None, Exception("would violate default partition"))
+        self.statements.append(sql)
+
+
+def test_ensure_partitions_skips_blocked_month(monkeypatch):
+    """Test a month with rows in the default partition does not stop the rest"""
+    monkeypatch.setattr(audit_partitions, "is_partitioned", lambda conn: True)
+    monkeypatch.setattr(audit_partitions, "audit_partitions", lambda conn: [])
+    current = month_start(datetime.now(UTC))
+    conn = RecordingConnection(failing=partition_name(current))
+
+    created = ensure_audit_partitions(conn, months_ahead=2)
+
+    assert created == [partition_name(add_months(current, n)) for n in (1, 2)]
+    assert conn.statements == [
+        create_partition_sql(add_months(current, n)) for n in (1, 2)
+    ]
+
+
+def test_archive_audit_log(db_session, tmp_path):
+    """Test months past retention are written to gzipped NDJSON and removed"""
+    output_dir = tmp_path / "archive"
+    for month in (8, 8, 9, 10):
+        db_session.add(
+            models.AuditLog(
+                action="LOGIN",
+                resource_type="USER",
+                resource_id=month,
+                created_at=datetime(2026, month, 15, tzinfo=UTC),
+            )
+        )
+    db_session.commit()
+
+    archived = archive_audit_log(
+        db_session.get_bind(),
+        str(output_dir),
+        retain_months=1,
+        now=datetime(2026, 10, 17, tzinfo=UTC),
+    )
+
+    # September is the one full month retained before the current one
+    assert archived == [(str(output_dir / "audit_logs_2026-08.ndjson.gz"), 2)]
+    with gzip.open(archived[0][0]) as f:
+        rows = [json.loads(line) for line in f]
+    assert [row["resource_id"] for row in rows] == [8, 8]
+    assert rows[0]["action"] == "LOGIN"
+    remaining = db_session.execute(select(models.AuditLog.resource_id)).scalars()
+    assert sorted(remaining) == [9, 10]
+    assert [p.name for p in output_dir.iterdir()] == ["audit_logs_2026-08.ndjson.gz"]
@@ -1,6 +1,14 @@
+import asyncio
+import threading
+
 import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app import auth
+from app import auth, models
+from app.cache import AsyncRedisCache
+from app.password_pool import PasswordWorkerPool, PoolSaturatedError, password_pool
+from tests.mocks import FakeAsyncRedis
 
 
 def test_password_hashing():
@@ -36,16 +44,157 @@ def test_create_access_token():
     assert len(token) > 0
 
 
-def test_authenticate_user(db_session, test_user):
+def test_authenticate_user(app_engine, test_user):
     """Test user authentication"""
-    user = auth.authenticate_user(db_session, test_user["email"], test_user["password"])
+
+    async def authenticate(email, password):
+        async with AsyncSession(app_engine) as db:
+            return await auth.authenticate_user(db, email, password)
+
+    user = asyncio.run(authenticate(test_user["email"], test_user["password"]))
     assert user is not None
     assert user.email == test_user["email"]
 
     # Test wrong password
-    user = auth.authenticate_user(db_session, test_user["email"], "wrongpassword")
+    user = asyncio.run(authenticate(test_user["email"], "wrongpassword"))
     assert user is False
 
     # Test non-existent user
-    user = auth.authenticate_user(db_session, "nonexistent@example.com", "anypassword")
+    user = asyncio.run(authenticate("nonexistent@example.com", "anypassword"))
     assert user is False
+
+
+def test_password_pool_rejects_when_saturated():
+    """Test the password pool fails fast instead of queueing without bound"""
+    pool = PasswordWorkerPool(max_workers=1, max_pending=0)
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocking():
+        started.set()
+        release.wait(5)
+        return "done"
+
+    worker = threading.Thread(target=lambda: pool.run(blocking))
+    worker.start()
+    started.wait(5)
+    try:
+        assert pool.stats()["in_flight"] == 1
+        with pytest.raises(PoolSaturatedError):
+            pool.run(blocking)
+        assert pool.stats()["rejected"] == 1
+    finally:
+        release.set()
+        worker.join(5)
+
+    assert pool.run(lambda: "ok") == "ok"
+    assert pool.stats()["in_flight"] == 0
+
+
+def test_password_pool_slot_outlives_cancelled_caller():
+    """Test cancelling the awaiting request does not free a running slot"""
+    pool = PasswordWorkerPool(max_workers=1, max_pending=0)
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocking():
+        started.set()
+        release.wait(5)
+        return "done"
+
+    async def scenario():
+        task = asyncio.create_task(pool.run_async(blocking))
+        await asyncio.to_thread(started.wait, 5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # The hash is still running, so the pool is still full
+        with pytest.raises(PoolSaturatedError):
+            await pool.run_async(blocking)
+        release.set()
+        while pool.stats()["in_flight"]:
+            await asyncio.sleep(0.01)
+        assert await pool.run_async(lambda: "ok") == "ok"
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        release.set()
+
+
+def test_login_returns_503_when_password_pool_saturated(client, test_user, monkeypatch):
+    """Test login is rejected quickly when bcrypt capacity is exhausted"""
+
+    async def saturated(fn, *args):
+        raise PoolSaturatedError()
+
+    monkeypatch.setattr(password_pool, "run_async", saturated)
+
+    response = client.post(
+        "/auth/login",
+        json={"email": test_user["email"], "password": test_user["password"]},
+    )
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+
+
+def test_current_user_is_cached(client, test_user, db_session, app_engine):
+    """Test repeated requests skip the users lookup until the user changes"""
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = app_engine.sync_engine
+    client.get("/users/me", headers=test_user["headers"])
+    event.listen(engine, "before_cursor_execute", on_execute)
+    try:
+        response = client.get("/users/me", headers=test_user["headers"])
+    finally:
+        event.remove(engine, "before_cursor_execute", on_execute)
+    assert response.status_code == 200
+    assert not any("FROM users" in s for s in statements)
+
+    # Changing the user invalidates the cached principal
+    user = db_session.query(models.User).filter_by(email=test_user["email"]).one()
+    user.email = "changed@example.com"
+    db_session.commit()
+
+    response = client.get("/users/me", headers=test_user["headers"])
+    assert response.json()["email"] == "changed@example.com"
+
+
+def test_current_user_shared_through_async_redis(
+    client, test_user, app_engine, monkeypatch
+):
+    """Test another worker's cached principal is read with the async client"""
+    redis = FakeAsyncRedis()
+    monkeypatch.setattr(
+        auth, "redis_user_cache", AsyncRedisCache(redis, "auth:user", 60)
+    )
+    client.get("/users/me", headers=test_user["headers"])
+    assert len(redis.data) == 1
+
+    # A fresh worker has nothing in memory but still skips the database
+    auth.user_cache.clear()
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = app_engine.sync_engine
+    event.listen(engine, "before_cursor_execute", on_execute)
+    try:
+        response = client.get("/users/me", headers=test_user["headers"])
+    finally:
+        event.remove(engine, "before_cursor_execute", on_execute)
+    assert response.json()["email"] == test_user["email"]
+    assert not any("FROM users" in s for s in statements)
+
+    # Invalidation from ORM events is scheduled on the running loop
+    async def invalidate():
+        auth.invalidate_user(response.json()["id"])
+        await asyncio.gather(*auth._pending_invalidations)
+
+    asyncio.run(invalidate())
+    assert redis.data == {}
@@ -0,0 +1,29 @@
+from benchmarks.report import compare, percentile, summarize
+
+
+def test_percentiles_and_summary():
+    """Test nearest-rank percentiles and throughput in the summary"""
+    latencies = [i / 1000 for i in range(1, 101)]
+    assert percentile(sorted(latencies), 50) == 0.05
+    assert percentile(sorted(latencies), 99) == 0.099
+    assert percentile([], 95) == 0.0
+
+    summary = summarize(latencies, errors=2, elapsed=2.0)
+    assert summary["requests"] == 100
+    assert summary["rps"] == 50.0
+    assert summary["p95_ms"] == 95.0
+
+
+def test_compare_flags_regressions_beyond_threshold():
+    """Test the baseline comparison only fails on real regressions"""
+    baseline = {"get_snippet": {"p95_ms": 10.0, "rps": 500.0, "errors": 0}}
+    steady = {"get_snippet": {"p95_ms": 11.5, "rps": 450.0, "errors": 0}}
+    assert compare(steady, baseline, threshold=0.2) == []
+
+    slower = {"get_snippet": {"p95_ms": 13.0, "rps": 350.0, "errors": 1}}
+    regressions = compare(slower, baseline, threshold=0.2)
+    assert len(regressions) == 3
+    assert regressions[0].startswith("get_snippet: p95")
+
+    # Scenarios missing from the baseline are not compared
+    assert compare({"login": slower["get_snippet"]}, baseline, threshold=0.2) == []
@@ -0,0 +1,43 @@
+import time
+
+from app.cache import TTLCache
+
+
+def test_ttl_cache_expiry():
+    """Test entries are dropped once their TTL has passed"""
+    cache = TTLCache(ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=0.01)
+
+    assert cache.get("a") == 1
+    time.sleep(0.02)
+    assert cache.get("b") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_ttl_cache_lru_eviction():
+    """Test the least recently used entry is evicted first"""
+    cache = TTLCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_ttl_cache_byte_budget():
+    """Test entries are evicted to stay under the memory budget"""
+    cache = TTLCache(max_bytes=10, sizeof=len)
+    cache.set("a", "12345")
+    cache.set("b", "12345")
+    cache.set("c", "123")
+    cache.set("huge", "x" * 11)
+
+    assert cache.get("a") is None
+    assert cache.get("b") == "12345"
+    assert cache.get("huge") is None
+    assert cache.stats()["bytes"] == 8
@@ -0,0 +1,51 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from app.database import PoolMonitor, monitored_pool, pool_options, to_async_url
+
+
+def test_to_async_url():
+    """Test database URLs are mapped onto the async drivers"""
+    assert to_async_url("postgresql://u:p@db:5432/vault") == (
+        "postgresql+asyncpg://u:p@db:5432/vault"
+    )
+    assert to_async_url("sqlite:///vault.db") == "sqlite+aiosqlite:///vault.db"
+
+
+def test_pool_options_skip_in_memory_sqlite():
+    """Test the single-connection SQLite memory pool is left alone"""
+    monitor = PoolMonitor()
+    assert pool_options("sqlite:///:memory:", QueuePool, monitor) == {}
+    options = pool_options("postgresql://u:p@db/vault", QueuePool, monitor)
+    assert issubclass(options["poolclass"], QueuePool)
+    assert options["pool_pre_ping"] is True
+
+
+def test_pool_monitor_reports_checkouts_and_timeouts(tmp_path):
+    """Test pool usage and checkout timeouts are counted"""
+    monitor = PoolMonitor()
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=monitored_pool(QueuePool, monitor),
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+
+    held = engine.connect()
+    stats = monitor.stats(engine.pool)
+    assert stats["checkouts"] == 1
+    assert stats["checked_out"] == 1
+    assert stats["overflow"] == 0
+
+    with pytest.raises(PoolTimeoutError):
+        engine.connect()
+    stats = monitor.stats(engine.pool)
+    assert stats["timeouts"] == 1
+    assert stats["wait_max_ms"] >= 50
+
+    held.close()
+    assert monitor.stats(engine.pool)["checked_out"] == 0
+    engine.dispose()
@@ -1,4 +1,23 @@
-from app.encryption import EncryptionService
+import base64
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.encryption import FORMAT_AES_GCM, FORMAT_DATA_KEY, EncryptionService
+from app.manage import (
+    add_envelope_key_columns,
+    migrate_legacy_ciphertext,
+    rotate_data_keys,
+)
+
+NEW_KEY = "n" * 32
+
+
+def legacy_encrypt(encryption_service, text):
+    """Produce ciphertext the way the service did before the binary format"""
+    token = encryption_service.fernet.encrypt(text.encode())
+    return base64.urlsafe_b64encode(token).decode()
 
 
 def test_encryption_service():
@@ -39,3 +58,198 @@ def test_encryption_consistency():
     # But both should decrypt to the same text
     assert encryption_service.decrypt(encrypted1) == text
     assert encryption_service.decrypt(encrypted2) == text
+
+
+def test_encryption_binary_envelope():
+    """Test new ciphertext is compact binary with a version header"""
+    encryption_service = EncryptionService()
+    text = "x" * 1000
+
+    encrypted = encryption_service.encrypt(text)
+
+    assert isinstance(encrypted, bytes)
+    assert encrypted[0] == FORMAT_AES_GCM
+    assert len(encrypted) == 1 + 12 + len(text) + 16
+    assert not encryption_service.is_legacy(encrypted)
+
+
+def test_decrypt_legacy_format():
+    """Test rows written in the old double-base64 Fernet format still decrypt"""
+    encryption_service = EncryptionService()
+    legacy = legacy_encrypt(encryption_service, "old secret")
+
+    assert encryption_service.is_legacy(legacy)
+    assert encryption_service.decrypt(legacy) == "old secret"
+    assert encryption_service.decrypt(legacy.encode()) == "old secret"
+
+
+def test_migrate_legacy_ciphertext(db_session):
+    """Test the migration command rewrites legacy rows into the new format"""
+    encryption_service = EncryptionService()
+    user = models.User(email="migrate@example.com", hashed_password="x")
+    db_session.add(user)
+    db_session.flush()
+    legacy = models.Snippet(
+        title="Legacy",
+        language="python",
+        code="print('legacy')",
+        encrypted_code=legacy_encrypt(encryption_service, "print('legacy')").encode(),
+        user_id=user.id,
+    )
+    current = models.Snippet(
+        title="Current",
+        language="python",
+        code="print('current')",
+        encrypted_code=encryption_service.encrypt("print('current')"),
+        user_id=user.id,
+    )
+    db_session.add_all([legacy, current])
+    db_session.commit()
+
+    migrated = migrate_legacy_ciphertext(
+        session_factory=lambda: db_session, service=encryption_service, batch_size=1
+    )
+
+    assert migrated == 1
+    legacy, current = (db_session.get(models.Snippet, s.id) for s in (legacy, current))
+    assert legacy.data_key is not None
+    for snippet in (legacy, current):
+        assert not encryption_service.is_legacy(snippet.encrypted_code)
+        decrypted = encryption_service.decrypt_envelope(
+            snippet.encrypted_code, snippet.data_key, snippet.key_id
+        )
+        assert decrypted == snippet.code
+
+
+def test_migrate_database_without_envelope_columns(tmp_path):
+    """Test a database created before envelope encryption can be migrated"""
+    encryption_service = EncryptionService()
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        # The snippets table as it was before data keys existed
+        conn.execute(
+            text(
+                "CREATE TABLE snippets (id INTEGER PRIMARY KEY, "
+                "title VARCHAR(255) NOT NULL, language VARCHAR(50) NOT NULL, "
+                "code TEXT NOT NULL, encrypted_code TEXT NOT NULL, "
+                "user_id INTEGER NOT NULL, created_at DATETIME, updated_at DATETIME)"
+            )
+        )
+        conn.execute(
+            text(
+                "INSERT INTO snippets (title, language, code, encrypted_code, "
+                "user_id) VALUES ('Old', 'python', 'x = 1', :ciphertext, 1)"
+            ),
+            {"ciphertext": legacy_encrypt(encryption_service, "x = 1")},
+        )
+
+    assert add_envelope_key_columns(engine) == ["data_key", "key_id"]
+    assert add_envelope_key_columns(engine) == []
+    columns = {c["name"] for c in inspect(engine).get_columns("snippets")}
+    assert {"data_key", "key_id"} <= columns
+    indexes = {i["name"] for i in inspect(engine).get_indexes("snippets")}
+    assert "ix_snippets_key_id" in indexes
+
+    session_factory = sessionmaker(bind=engine)
+    migrated = migrate_legacy_ciphertext(
+        session_factory=session_factory, service=encryption_service
+    )
+    assert migrated == 1
+    with session_factory() as db:
+        snippet = db.get(models.Snippet, 1)
+        assert snippet.data_key is not None
+        assert (
+            encryption_service.decrypt_envelope(
+                snippet.encrypted_code, snippet.data_key, snippet.key_id
+            )
+            == "x = 1"
+        )
+
+
+def test_envelope_encryption_with_keyring():
+    """Test per-record data keys are wrapped by the active key and rewrapped"""
+    old_service = EncryptionService()
+    encrypted = old_service.encrypt_envelope("enveloped")
+
+    assert encrypted.key_id == "default"
+    assert encrypted.encrypted_code[0] == FORMAT_DATA_KEY
+    assert old_service.decrypt_envelope(*encrypted) == "enveloped"
+
+    new_service = EncryptionService(keyring={"k2": NEW_KEY})
+    assert new_service.active_key_id == "k2"
+    # Old data keys stay readable after the active key changes
+    assert new_service.decrypt_envelope(*encrypted) == "enveloped"
+
+    data_key, key_id = new_service.rewrap_data_key(encrypted.data_key, "default")
+    assert key_id == "k2"
+    assert data_key != encrypted.data_key
+    assert (
+        new_service.decrypt_envelope(encrypted.encrypted_code, data_key, key_id)
+        == "enveloped"
+    )
+
+
+def test_blind_tokens_are_keyed_and_stable_across_rotation():
+    """Test blind index tokens hide identifiers and survive key rotation"""
+    service = EncryptionService()
+    tokens = service.blind_tokens(["parse_config", "main"])
+
+    assert len(tokens) == 2
+    assert tokens[0] != tokens[1]
+    assert b"parse_config" not in tokens[0]
+    assert service.blind_tokens(["parse_config"]) == tokens[:1]
+    assert (
+        EncryptionService(keyring={"k2": NEW_KEY}).blind_tokens(["parse_config"])
+        == tokens[:1]
+    )
+
+
+def test_rotate_data_keys(db_session):
+    """Test rotation rewraps data keys without rewriting the ciphertext"""
+    old_service = EncryptionService()
+    user = models.User(email="rotate@example.com", hashed_password="x")
+    db_session.add(user)
+    db_session.flush()
+    snippets = []
+    for i in range(3):
+        encrypted = old_service.encrypt_envelope(f"print({i})")
+        snippets.append(
+            models.Snippet(
+                title=f"Rotate {i}",
+                language="python",
+                user_id=user.id,
+                **encrypted._asdict(),
+            )
+        )
+    # A snippet from before envelope encryption, with no data key
+    snippets.append(
+        models.Snippet(
+            title="Service key",
+            language="python",
+            encrypted_code=old_service.encrypt("print(3)"),
+            user_id=user.id,
+        )
+    )
+    db_session.add_all(snippets)
+    db_session.commit()
+    ciphertexts = [s.encrypted_code for s in snippets[:3]]
+
+    new_service = EncryptionService(keyring={"k2": NEW_KEY})
+    rotated = rotate_data_keys(
+        session_factory=lambda: db_session, service=new_service, batch_size=2
+    )
+
+    assert rotated == 4
+    snippets = [db_session.get(models.Snippet, s.id) for s in snippets]
+    for i, snippet in enumerate(snippets):
+        assert snippet.key_id == "k2"
+        decrypted = new_service.decrypt_envelope(
+            snippet.encrypted_code, snippet.data_key, snippet.key_id
+        )
+        assert decrypted == f"print({i})"
+    assert [s.encrypted_code for s in snippets[:3]] == ciphertexts
+
+    # Nothing left to do on a second run
+    assert (
+        rotate_data_keys(session_factory=lambda: db_session, service=new_service) == 0
+    )
@@ -0,0 +1,102 @@
+from sqlalchemy import text
+
+from app import metrics
+from app.config import settings
+
+
+def sample(text: str, name: str, **labels) -> float:
+    """Value of one sample in a Prometheus text exposition"""
+    for line in text.splitlines():
+        if not line.startswith(name + "{") and not line.startswith(name + " "):
+            continue
+        if all(f'{key}="{value}"' in line for key, value in labels.items()):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_metrics_record_routes_queries_and_timings(client):
+    """Test /metrics reports latency per route template and DB work per request"""
+    route = "/snippets/{snippet_id}"
+    before = client.get("/metrics").text
+    client.post(
+        "/auth/register", json={"email": "metrics@example.com", "password": "Pass123!"}
+    )
+    login = client.post(
+        "/auth/login", json={"email": "metrics@example.com", "password": "Pass123!"}
+    )
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    created = client.post(
+        "/snippets",
+        json={"title": "T", "code": "print(1)", "language": "python"},
+        headers=headers,
+    ).json()
+    client.get(f"/snippets/{created['id']}", headers=headers)
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+
+    count = "http_request_duration_seconds_count"
+    assert (
+        sample(text, count, route=route, method="GET", status="200")
+        - sample(before, count, route=route, method="GET", status="200")
+        == 1
+    )
+    # Ids are folded into the template rather than becoming labels
+    assert f'/snippets/{created["id"]}"' not in text
+    queries = "db_queries_per_request_sum"
+    assert sample(text, queries, route=route) > sample(before, queries, route=route)
+    assert sample(text, "db_query_duration_seconds_count", operation="SELECT") > 0
+    for operation in ("hash", "verify"):
+        assert (
+            sample(text, "password_hash_duration_seconds_count", operation=operation)
+            > 0
+        )
+    for operation in ("encrypt", "decrypt"):
+        assert sample(text, "crypto_duration_seconds_count", operation=operation) > 0
+    assert 'cache_hit_ratio{cache="user"}' in text
+    assert "http_requests_in_flight" in text
+
+
+def test_metrics_token(client, monkeypatch):
+    """Test the metrics endpoint requires the configured bearer token"""
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "scrape-secret")
+
+    assert client.get("/metrics").status_code == 401
+    response = client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert response.status_code == 200
+
+
+def test_queries_outside_requests(db_session):
+    """Test SQL run outside a request is still counted but not attributed"""
+    counter = metrics.DB_QUERIES.labels("SELECT")
+    before = counter._value.get()
+
+    db_session.execute(text("SELECT 1"))
+
+    assert counter._value.get() == before + 1
+    assert metrics.request_stats.get() is None
+    assert metrics.route_label({}) == "unmatched"
+
+
+def test_failed_statement_clears_timer(db_session):
+    """Test a statement that raises leaves no start time behind"""
+    with db_session.get_bind().connect() as conn:
+        try:
+            conn.execute(text("SELECT * FROM no_such_table"))
+        except Exception:
+            pass
+        assert not conn.info.get("query_started")
+
+
+def test_multiprocess_metrics_include_caches(client, tmp_path, monkeypatch):
+    """Test cache and pool metrics survive the multiprocess registry"""
+    # The collector reads every *.db file there, so not the test databases
+    multiproc_dir = tmp_path / "prometheus"
+    multiproc_dir.mkdir()
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(multiproc_dir))
+    body, _ = metrics.render()
+    body = body.decode()
+    assert "cache_hit_ratio" in body
+    assert "db_pool_timeouts" in body
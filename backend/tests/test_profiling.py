@@ -0,0 +1,89 @@
+import time
+
+import pytest
+
+from app import profiling
+from app.config import settings
+
+
+@pytest.fixture
+def profiled(monkeypatch, tmp_path, test_user):
+    """Enable profiling for signed requests and make the test user an admin"""
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(settings, "PROFILING_SECRET", "profile-secret")
+    monkeypatch.setattr(settings, "PROFILING_DIR", str(tmp_path / "profiles"))
+    monkeypatch.setattr(settings, "ADMIN_EMAILS", test_user["email"])
+    return test_user
+
+
+def signed_header(secret="profile-secret", expires=None):
+    expires = int(time.time()) + 60 if expires is None else expires
+    return {profiling.PROFILE_HEADER: profiling.sign_profile_request(secret, expires)}
+
+
+def test_signed_header_captures_profile(client, profiled):
+    """Test a signed debug header stores a profile with its SQL statements"""
+    headers = profiled["headers"]
+    created = client.post(
+        "/snippets",
+        json={"title": "T", "code": "print(1)", "language": "python"},
+        headers=headers,
+    ).json()
+
+    response = client.get(
+        f"/snippets/{created['id']}", headers={**headers, **signed_header()}
+    )
+    assert response.status_code == 200
+    profile_id = response.headers[profiling.PROFILE_ID_HEADER]
+
+    profiles = client.get("/admin/profiles", headers=headers).json()
+    assert [p["id"] for p in profiles] == [profile_id]
+    assert profiles[0]["route"] == "/snippets/{snippet_id}"
+    assert profiles[0]["reason"] == "header"
+
+    profile = client.get(f"/admin/profiles/{profile_id}", headers=headers).json()
+    assert any("FROM snippets" in q["statement"] for q in profile["sql"])
+    assert "cumulative" in profile["profile"]
+
+    stats = client.get(f"/admin/profiles/{profile_id}/pstats", headers=headers)
+    assert stats.status_code == 200
+    assert stats.content
+
+
+def test_unsigned_requests_not_profiled(client, profiled):
+    """Test forged or expired headers do not trigger profiling"""
+    headers = profiled["headers"]
+    for bad in (
+        signed_header(secret="wrong"),
+        signed_header(expires=int(time.time()) - 1),
+        {profiling.PROFILE_HEADER: "garbage"},
+    ):
+        response = client.get("/snippets", headers={**headers, **bad})
+        assert profiling.PROFILE_ID_HEADER not in response.headers
+
+    assert client.get("/admin/profiles", headers=headers).json() == []
+
+
+def test_sampling_and_ring_buffer(client, profiled, monkeypatch):
+    """Test sampled requests are profiled and only the newest are kept"""
+    monkeypatch.setattr(settings, "PROFILING_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(settings, "PROFILING_MAX_PROFILES", 2)
+    ids = [
+        client.get("/snippets", headers=profiled["headers"]).headers[
+            profiling.PROFILE_ID_HEADER
+        ]
+        for _ in range(3)
+    ]
+
+    monkeypatch.setattr(settings, "PROFILING_SAMPLE_RATE", 0.0)
+    profiles = client.get("/admin/profiles", headers=profiled["headers"]).json()
+    assert [p["id"] for p in profiles] == ids[:0:-1]
+    assert all(p["reason"] == "sampled" for p in profiles)
+
+
+def test_profiles_require_admin(client, test_user, monkeypatch):
+    """Test the profile endpoints are limited to ADMIN_EMAILS"""
+    monkeypatch.setattr(settings, "ADMIN_EMAILS", "someone-else@example.com")
+
+    response = client.get("/admin/profiles", headers=test_user["headers"])
+    assert response.status_code == 403
@@ -0,0 +1,102 @@
+import asyncio
+
+from app import auth, rate_limit
+from app.config import settings
+from app.rate_limit import Limit, MemoryTokenBuckets
+
+
+def count_password_checks(monkeypatch) -> list:
+    calls = []
+    verify = auth.verify_password_async
+
+    async def counted(plain, hashed):
+        calls.append(plain)
+        return await verify(plain, hashed)
+
+    monkeypatch.setattr(auth, "verify_password_async", counted)
+    return calls
+
+
+def test_login_limited_per_account_before_bcrypt(client, test_user, monkeypatch):
+    """Test failed logins beyond the account limit get 429 without hashing"""
+    monkeypatch.setattr(settings, "RATE_LIMIT_LOGIN_PER_ACCOUNT", 3)
+    rate_limit.rate_limiter.clear()
+    calls = count_password_checks(monkeypatch)
+    attempt = {"email": test_user["email"], "password": "wrong-password"}
+
+    statuses = [client.post("/auth/login", json=attempt).status_code for _ in range(3)]
+    assert statuses == [401, 401, 401]
+
+    response = client.post("/auth/login", json=attempt)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert len(calls) == 3
+
+    # Other accounts from the same client are still allowed
+    other = {"email": "other@example.com", "password": "wrong-password"}
+    assert client.post("/auth/login", json=other).status_code == 401
+
+
+def test_login_limited_per_ip(client, monkeypatch):
+    """Test one client cannot spread attempts across many accounts"""
+    monkeypatch.setattr(settings, "RATE_LIMIT_LOGIN_PER_IP", 2)
+    for i in range(2):
+        attempt = {"email": f"user{i}@example.com", "password": "wrong-password"}
+        assert client.post("/auth/login", json=attempt).status_code == 401
+
+    attempt = {"email": "user9@example.com", "password": "wrong-password"}
+    assert client.post("/auth/login", json=attempt).status_code == 429
+
+
+def test_share_password_attempts_limited(client, test_user, monkeypatch):
+    """Test password guesses against a share link are throttled per token"""
+    monkeypatch.setattr(settings, "RATE_LIMIT_SHARED_PER_TOKEN", 2)
+    snippet = client.post(
+        "/snippets",
+        json={"title": "T", "code": "print(1)", "language": "python"},
+        headers=test_user["headers"],
+    ).json()
+    token = client.post(
+        f"/snippets/{snippet['id']}/share",
+        json={"password": "SharePass123!"},
+        headers=test_user["headers"],
+    ).json()["token"]
+    calls = count_password_checks(monkeypatch)
+
+    guess = {"password": "wrong"}
+    for _ in range(2):
+        assert client.request("GET", f"/shared/{token}", json=guess).status_code == 401
+    response = client.request("GET", f"/shared/{token}", json=guess)
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+    assert len(calls) == 2
+
+
+def test_memory_buckets_refill(monkeypatch):
+    """Test buckets refill over time and reject without taking other tokens"""
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    buckets = MemoryTokenBuckets()
+    tight = Limit("tight", 1, 10)
+    loose = Limit("loose", 5, 10)
+
+    assert buckets.hit([tight, loose]) == 0
+    assert buckets.hit([tight, loose]) == 10
+    now[0] += 5
+    assert buckets.hit([loose]) == 0
+    assert buckets.hit([tight]) == 5
+    now[0] += 5
+    assert buckets.hit([tight]) == 0
+    # loose lost only the two admitted attempts, then refilled to capacity
+    assert [buckets.hit([loose]) for _ in range(5)] == [0] * 5
+
+
+def test_redis_errors_fall_back_to_memory(monkeypatch):
+    """Test an unavailable Redis limits in memory instead of failing requests"""
+    monkeypatch.setattr(settings, "RATE_LIMIT_REDIS", True)
+    monkeypatch.setattr(rate_limit, "get_async_redis", lambda: None)
+    limiter = rate_limit.RateLimiter()
+    limit = Limit("key", 1, 60)
+
+    assert asyncio.run(limiter.hit([limit])) == 0
+    assert asyncio.run(limiter.hit([limit])) > 0
@@ -0,0 +1,181 @@
+import json
+
+from sqlalchemy import text
+
+from app import models
+from app.config import settings
+from app.manage import build_blind_index, create_search_index
+from app.search import extract_identifiers, fts5_query
+from tests.mocks import mock_encryption_service
+
+
+def create(client, headers, title, language="python"):
+    response = client.post(
+        "/snippets",
+        json={"title": title, "language": language, "code": "pass"},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def test_fts5_query_quotes_words():
+    """Test user input cannot inject FTS5 query syntax"""
+    assert fts5_query('quick "sort') == '"quick"* """sort"*'
+
+
+def test_extract_identifiers():
+    """Test identifiers are lower-cased, deduplicated and capped"""
+    code = "def parseConfig(p):\n    return PARSECONFIG(p) + x1 + load_all"
+    assert extract_identifiers(code, 3, 10) == [
+        "def",
+        "parseconfig",
+        "return",
+        "load_all",
+    ]
+    assert extract_identifiers(code, 3, 2) == ["def", "parseconfig"]
+
+
+def test_search_snippets(client, test_user):
+    """Test title search is ranked, filtered by language and paginated"""
+    headers = test_user["headers"]
+    create(client, headers, "Quick sort in place")
+    create(client, headers, "Merge sort")
+    create(client, headers, "Quick sort", language="javascript")
+    create(client, headers, "Binary search")
+
+    response = client.get("/snippets/search?q=sort", headers=headers)
+    assert response.status_code == 200
+    assert {item["title"] for item in response.json()} == {
+        "Quick sort in place",
+        "Merge sort",
+        "Quick sort",
+    }
+
+    # Every word must match, prefixes included
+    response = client.get("/snippets/search?q=qui%20sor", headers=headers)
+    assert {item["title"] for item in response.json()} == {
+        "Quick sort in place",
+        "Quick sort",
+    }
+
+    response = client.get(
+        "/snippets/search?q=sort&language=javascript", headers=headers
+    )
+    assert [item["title"] for item in response.json()] == ["Quick sort"]
+
+    response = client.get("/snippets/search?q=sort&limit=2", headers=headers)
+    assert len(response.json()) == 2
+    assert response.headers["X-Next-Offset"] == "2"
+    response = client.get("/snippets/search?q=sort&limit=2&offset=2", headers=headers)
+    assert len(response.json()) == 1
+    assert "X-Next-Offset" not in response.headers
+
+    assert client.get("/snippets/search", headers=headers).status_code == 400
+
+
+def test_search_is_scoped_and_follows_deletes(client, test_user):
+    """Test other users' snippets and deleted snippets are not found"""
+    snippet_id = create(client, test_user["headers"], "Private parser")
+
+    other = {"email": "other@example.com", "password": "otherpass123"}
+    client.post("/auth/register", json=other)
+    token = client.post("/auth/login", json=other).json()["access_token"]
+    other_headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("/snippets/search?q=parser", headers=other_headers)
+    assert response.json() == []
+
+    client.delete(f"/snippets/{snippet_id}", headers=test_user["headers"])
+    response = client.get("/snippets/search?q=parser", headers=test_user["headers"])
+    assert response.json() == []
+
+
+def test_create_search_index_rebuilds_existing_rows(client, test_user, db_session):
+    """Test the maintenance command indexes snippets created before search"""
+    create(client, test_user["headers"], "Legacy tokenizer")
+    bind = db_session.get_bind()
+    with bind.begin() as conn:
+        conn.execute(text("DROP TABLE snippets_fts"))
+        for trigger in ("insert", "delete", "update"):
+            conn.execute(text(f"DROP TRIGGER snippets_fts_{trigger}"))
+
+    assert create_search_index(bind)
+
+    response = client.get("/snippets/search?q=tokenizer", headers=test_user["headers"])
+    assert [item["title"] for item in response.json()] == ["Legacy tokenizer"]
+
+
+def test_search_by_code_token(client, test_user, db_session, monkeypatch):
+    """Test code_token finds snippets through the blind index only"""
+    headers = test_user["headers"]
+    response = client.get("/snippets/search?code_token=parse_config", headers=headers)
+    assert response.status_code == 400
+
+    monkeypatch.setattr(settings, "SNIPPET_BLIND_INDEX", True)
+    config_id = client.post(
+        "/snippets",
+        json={
+            "title": "Config",
+            "language": "python",
+            "code": "def parse_config(path):\n    return load(path)",
+        },
+        headers=headers,
+    ).json()["id"]
+    client.post(
+        "/snippets",
+        json={"title": "Other", "language": "python", "code": "print('hi')"},
+        headers=headers,
+    )
+
+    response = client.get("/snippets/search?code_token=Parse_Config", headers=headers)
+    assert [item["id"] for item in response.json()] == [config_id]
+    response = client.get("/snippets/search?code_token=load&q=other", headers=headers)
+    assert response.json() == []
+
+    # Only keyed tokens are stored, and they go away with the snippet
+    tokens = db_session.query(models.SnippetToken).filter_by(snippet_id=config_id)
+    assert b"mock_token:parse_config" in {row.token for row in tokens}
+    client.delete(f"/snippets/{config_id}", headers=headers)
+    assert (
+        db_session.query(models.SnippetToken).filter_by(snippet_id=config_id).count()
+        == 0
+    )
+
+
+def test_bulk_import_indexes_each_snippet(client, test_user, monkeypatch):
+    """Test imported snippets get the tokens of their own code"""
+    monkeypatch.setattr(settings, "SNIPPET_BLIND_INDEX", True)
+    monkeypatch.setattr(settings, "BULK_BATCH_SIZE", 3)
+    headers = test_user["headers"]
+    names = [f"handler_{i}" for i in range(5)]
+    lines = [
+        json.dumps({"title": name, "language": "python", "code": f"def {name}(): ..."})
+        for name in names
+    ]
+    response = client.post(
+        "/snippets/bulk",
+        content="\n".join(lines),
+        headers={**headers, "Content-Type": "application/x-ndjson"},
+    )
+    assert response.json() == {"imported": 5}
+
+    for name in names:
+        response = client.get(f"/snippets/search?code_token={name}", headers=headers)
+        assert [item["title"] for item in response.json()] == [name]
+
+
+def test_build_blind_index(client, test_user, db_session):
+    """Test the backfill indexes snippets created before the blind index"""
+    snippet_id = create(client, test_user["headers"], "Old snippet")
+    assert db_session.query(models.SnippetToken).count() == 0
+
+    assert (
+        build_blind_index(
+            session_factory=lambda: db_session, service=mock_encryption_service
+        )
+        == 1
+    )
+    # The mock code is "pass", which is the only identifier
+    assert [row.snippet_id for row in db_session.query(models.SnippetToken)] == [
+        snippet_id
+    ]
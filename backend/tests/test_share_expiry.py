@@ -0,0 +1,84 @@
+import asyncio
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app import models
+from app.share_expiry import ShareLinkSweeper
+
+
+def share_links(client, headers, count: int) -> list[str]:
+    snippet_id = client.post(
+        "/snippets",
+        json={"title": "Shared", "code": "print(1)", "language": "python"},
+        headers=headers,
+    ).json()["id"]
+    return [
+        client.post(f"/snippets/{snippet_id}/share", json={}, headers=headers).json()[
+            "token"
+        ]
+        for _ in range(count)
+    ]
+
+
+def expire(db_session, tokens: list[str], ago: timedelta):
+    db_session.query(models.ShareLink).filter(
+        models.ShareLink.token.in_(tokens)
+    ).update({"expires_at": datetime.now(UTC) - ago}, synchronize_session=False)
+    db_session.commit()
+
+
+def test_expired_share_link_is_not_written_on_read(
+    client, test_user, db_session, app_engine
+):
+    """Test an expired link is a 404 and reading it changes nothing"""
+    [token] = share_links(client, test_user["headers"], 1)
+    expire(db_session, [token], timedelta(minutes=1))
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = app_engine.sync_engine
+    event.listen(engine, "before_cursor_execute", on_execute)
+    try:
+        response = client.get(f"/shared/{token}")
+    finally:
+        event.remove(engine, "before_cursor_execute", on_execute)
+
+    assert response.status_code == 404
+    assert not any("UPDATE share_links" in s for s in statements)
+    link = db_session.query(models.ShareLink).filter_by(token=token).one()
+    db_session.refresh(link)
+    assert link.is_active
+
+
+def test_sweeper_deactivates_then_deletes(client, test_user, db_session, app_engine):
+    """Test the sweep works in batches and removes links past retention"""
+    tokens = share_links(client, test_user["headers"], 6)
+    recent, old, live = tokens[:3], tokens[3:5], tokens[5]
+    expire(db_session, recent, timedelta(hours=1))
+    expire(db_session, old, timedelta(days=40))
+    # Views of a deleted link go with it
+    assert client.get(f"/shared/{live}").status_code == 200
+    old_link = db_session.query(models.ShareLink).filter_by(token=old[0]).one()
+    db_session.add(
+        models.ShareLinkStats(share_link_id=old_link.id, views=1, visitor_sketch=b"")
+    )
+    db_session.commit()
+
+    sweeper = ShareLinkSweeper(
+        session_factory=async_sessionmaker(app_engine), batch_size=2, retention_days=30
+    )
+    assert asyncio.run(sweeper.sweep()) == (5, 2)
+    assert asyncio.run(sweeper.sweep()) == (0, 0)
+
+    db_session.expire_all()
+    links = {link.token: link for link in db_session.query(models.ShareLink)}
+    assert set(links) == {*recent, live}
+    assert not any(links[token].is_active for token in recent)
+    assert links[live].is_active
+    stats = db_session.query(models.ShareLinkStats).all()
+    assert [row.share_link_id for row in stats] == [links[live].id]
+    assert client.get(f"/shared/{live}").status_code == 200
@@ -0,0 +1,88 @@
+import asyncio
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app import models
+from app.share_stats import HyperLogLog, ShareStatsAggregator
+
+
+def share_snippet(client, headers) -> tuple[int, str]:
+    snippet_id = client.post(
+        "/snippets",
+        json={"title": "Shared", "code": "print(1)", "language": "python"},
+        headers=headers,
+    ).json()["id"]
+    token = client.post(
+        f"/snippets/{snippet_id}/share", json={}, headers=headers
+    ).json()["token"]
+    return snippet_id, token
+
+
+def test_hyperloglog_estimates_and_merges():
+    """Test the estimate is close and merging sketches counts the union"""
+    first, second, both = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    for i in range(20000):
+        value = f"10.0.{i // 256}.{i % 256}".encode()
+        (first if i % 2 else second).add(value)
+        both.add(value)
+        both.add(value)
+
+    assert abs(both.count() - 20000) < 20000 * 0.05
+    first.merge(second)
+    assert first.to_bytes() == both.to_bytes()
+    assert HyperLogLog(registers=both.to_bytes()).count() == both.count()
+    assert HyperLogLog().count() == 0
+
+
+def test_share_stats_endpoint(client, test_user):
+    """Test views of a share link are counted and reported to the owner only"""
+    snippet_id, token = share_snippet(client, test_user["headers"])
+    for _ in range(3):
+        assert client.get(f"/shared/{token}").status_code == 200
+
+    response = client.get(
+        f"/snippets/{snippet_id}/share/stats", headers=test_user["headers"]
+    )
+    assert response.status_code == 200
+    [stats] = response.json()
+    assert stats["token"] == token
+    assert stats["views"] == 3
+    assert stats["unique_visitors"] == 1
+    assert stats["last_viewed_at"] is not None
+
+    credentials = {"email": "other@example.com", "password": "Pass123!"}
+    client.post("/auth/register", json=credentials)
+    other = client.post("/auth/login", json=credentials).json()["access_token"]
+    response = client.get(
+        f"/snippets/{snippet_id}/share/stats",
+        headers={"Authorization": f"Bearer {other}"},
+    )
+    assert response.status_code == 404
+
+
+def test_aggregator_flushes_one_row_per_link(client, test_user, db_session, app_engine):
+    """Test many views become one stats row, merged across flushes"""
+    _, token = share_snippet(client, test_user["headers"])
+    link = db_session.query(models.ShareLink).filter_by(token=token).one()
+    aggregator = ShareStatsAggregator(
+        session_factory=async_sessionmaker(app_engine, expire_on_commit=False),
+        flush_interval=60,
+    )
+
+    async def run():
+        aggregator.start()
+        for i in range(100):
+            aggregator.record(link.id, f"192.0.2.{i % 10}")
+        await aggregator.flush()
+        aggregator.record(link.id, "198.51.100.1")
+        # A link deleted before the flush is skipped
+        aggregator.record(link.id + 1000, "192.0.2.1")
+        await aggregator.stop()
+
+    asyncio.run(run())
+
+    db_session.expire_all()
+    [stats] = db_session.query(models.ShareLinkStats).all()
+    assert stats.share_link_id == link.id
+    assert stats.views == 101
+    assert stats.unique_visitors == 11
@@ -1,3 +1,15 @@
+import json
+
+from sqlalchemy import event
+
+from app import auth, crud, models
+from app.cache import RedisGenerations, TTLCache
+from app.config import settings
+from app.crud import shared_snippet_cache
+from app.manage import purge_plaintext
+from tests.mocks import FakeAsyncRedis, mock_encryption_service
+
+
 def test_create_snippet(client, test_user):
     """Test creating a new snippet"""
     snippet_data = {
@@ -152,3 +164,415 @@ def test_access_shared_snippet(client, test_user):
     assert data["title"] == snippet_data["title"]
     assert data["code"] == snippet_data["code"]
     assert "shared_at" in data
+
+
+def test_create_snippet_commits_once(client, test_user, app_engine):
+    """Test a write request is a single transaction without refresh queries"""
+    commits = []
+    statements = []
+
+    def on_commit(conn):
+        commits.append(conn)
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = app_engine.sync_engine
+    event.listen(engine, "commit", on_commit)
+    event.listen(engine, "before_cursor_execute", on_execute)
+    try:
+        response = client.post(
+            "/snippets",
+            json={"title": "UoW", "language": "python", "code": "pass"},
+            headers=test_user["headers"],
+        )
+    finally:
+        event.remove(engine, "commit", on_commit)
+        event.remove(engine, "before_cursor_execute", on_execute)
+
+    assert response.status_code == 200
+    assert response.json()["created_at"]
+    assert len(commits) == 1
+    inserts = [s for s in statements if s.startswith("INSERT INTO snippets")]
+    assert len(inserts) == 1
+    assert "RETURNING" in inserts[0]
+    assert not any("FROM snippets" in s for s in statements)
+
+
+def test_shared_snippet_invalidated_in_other_workers(client, test_user, monkeypatch):
+    """Test deleting a snippet in one worker stops others serving it from cache"""
+    monkeypatch.setattr(
+        crud, "share_generations", RedisGenerations(FakeAsyncRedis(), "share:gen")
+    )
+    snippet_id = client.post(
+        "/snippets",
+        json={"title": "Shared", "language": "python", "code": "print(1)"},
+        headers=test_user["headers"],
+    ).json()["id"]
+    token = client.post(
+        f"/snippets/{snippet_id}/share", json={}, headers=test_user["headers"]
+    ).json()["token"]
+    # This worker caches the link
+    assert client.get(f"/shared/{token}").status_code == 200
+    this_worker = crud.shared_snippet_cache
+    assert this_worker.get(token) is not None
+
+    # Another worker, with its own cache, handles the delete
+    monkeypatch.setattr(crud, "shared_snippet_cache", TTLCache(max_entries=10))
+    response = client.delete(f"/snippets/{snippet_id}", headers=test_user["headers"])
+    assert response.status_code == 200
+
+    monkeypatch.setattr(crud, "shared_snippet_cache", this_worker)
+    assert this_worker.get(token) is not None
+    assert client.get(f"/shared/{token}").status_code == 404
+    assert this_worker.get(token) is None
+
+
+def test_get_snippets_pagination(client, test_user):
+    """Test paging through snippets with the keyset cursor"""
+    for i in range(5):
+        client.post(
+            "/snippets",
+            json={"title": f"Snippet {i}", "language": "python", "code": "pass"},
+            headers=test_user["headers"],
+        )
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/snippets", params=params, headers=test_user["headers"])
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page) <= 2
+        seen.extend(item["id"] for item in page)
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    # Newest first, every snippet exactly once
+    assert len(seen) == 5
+    assert seen == sorted(seen, reverse=True)
+
+
+def test_get_snippets_unpaged_returns_everything(client, test_user):
+    """Test a request without limit or cursor is not cut to a page"""
+    lines = [
+        json.dumps({"title": f"Many {i}", "language": "python", "code": "pass"})
+        for i in range(60)
+    ]
+    client.post(
+        "/snippets/bulk",
+        content="\n".join(lines),
+        headers={**test_user["headers"], "Content-Type": "application/x-ndjson"},
+    )
+
+    response = client.get("/snippets", headers=test_user["headers"])
+    assert response.status_code == 200
+    assert len(response.json()) == 60
+    assert "X-Next-Cursor" not in response.headers
+
+    response = client.get(
+        "/snippets", params={"limit": 50}, headers=test_user["headers"]
+    )
+    assert len(response.json()) == 50
+    cursor = response.headers["X-Next-Cursor"]
+    response = client.get(
+        "/snippets", params={"cursor": cursor}, headers=test_user["headers"]
+    )
+    assert len(response.json()) == 10
+
+
+def test_get_snippets_field_projection(client, test_user):
+    """Test list views can omit the code body"""
+    client.post(
+        "/snippets",
+        json={"title": "Projected", "language": "python", "code": "print(1)"},
+        headers=test_user["headers"],
+    )
+
+    response = client.get(
+        "/snippets", params={"fields": "title,language"}, headers=test_user["headers"]
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert set(data[0]) == {"id", "title", "language"}
+
+    response = client.get(
+        "/snippets", params={"fields": "title,secret"}, headers=test_user["headers"]
+    )
+    assert response.status_code == 400
+
+    response = client.get(
+        "/snippets", params={"cursor": "not-a-cursor"}, headers=test_user["headers"]
+    )
+    assert response.status_code == 400
+
+
+def test_shared_snippet_single_query(client, test_user, app_engine):
+    """Test an uncached share link is resolved with one joined SELECT"""
+    create_response = client.post(
+        "/snippets",
+        json={"title": "Joined", "language": "python", "code": "print('one')"},
+        headers=test_user["headers"],
+    )
+    snippet_id = create_response.json()["id"]
+    share_response = client.post(
+        f"/snippets/{snippet_id}/share",
+        json={"expires_hours": 1, "password": "sharepass"},
+        headers=test_user["headers"],
+    )
+    token = share_response.json()["token"]
+    shared_snippet_cache.clear()
+
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = app_engine.sync_engine
+    event.listen(engine, "before_cursor_execute", on_execute)
+    try:
+        response = client.request(
+            "GET", f"/shared/{token}", json={"password": "sharepass"}
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", on_execute)
+    assert response.status_code == 200
+    assert response.json()["code"] == "print('one')"
+    # The view counter is written inline in tests and not part of the lookup
+    lookups = [s for s in statements if "share_link_stats" not in s]
+    selects = [s for s in lookups if s.lstrip().startswith("SELECT")]
+    assert len(selects) == 1
+    assert "JOIN snippets" in selects[0]
+
+
+def test_shared_snippet_cache(client, test_user, db_session, app_engine):
+    """Test hot share links are served from cache until the snippet is deleted"""
+    create_response = client.post(
+        "/snippets",
+        json={"title": "Cached", "language": "python", "code": "print('hot')"},
+        headers=test_user["headers"],
+    )
+    snippet_id = create_response.json()["id"]
+    share_response = client.post(
+        f"/snippets/{snippet_id}/share",
+        json={"expires_hours": 1, "password": "sharepass"},
+        headers=test_user["headers"],
+    )
+    token = share_response.json()["token"]
+
+    # Prime the cache, then make sure the next hit does not query the database
+    response = client.request("GET", f"/shared/{token}", json={"password": "sharepass"})
+    assert response.status_code == 200
+
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = app_engine.sync_engine
+    event.listen(engine, "before_cursor_execute", on_execute)
+    try:
+        response = client.request(
+            "GET", f"/shared/{token}", json={"password": "sharepass"}
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", on_execute)
+    assert response.status_code == 200
+    assert response.json()["code"] == "print('hot')"
+    # Only the view counter is read, since it is written inline in tests
+    lookups = [s for s in statements if "share_link_stats" not in s]
+    assert not any(s.startswith("SELECT") for s in lookups)
+    assert shared_snippet_cache.stats()["hits"] >= 1
+
+    # The cached password hash is still enforced
+    response = client.request("GET", f"/shared/{token}", json={"password": "wrong"})
+    assert response.status_code == 401
+
+    # Deleting the snippet drops its cached share entries; the link rows are
+    # removed first so only a stale cache entry could still serve the token
+    db_session.query(models.ShareLink).delete()
+    db_session.commit()
+    client.delete(f"/snippets/{snippet_id}", headers=test_user["headers"])
+    response = client.request("GET", f"/shared/{token}", json={"password": "sharepass"})
+    assert response.status_code == 404
+
+
+def test_snippet_plaintext_not_stored(client, test_user, db_session):
+    """Test only ciphertext is persisted and reads are served by decrypting it"""
+    create_response = client.post(
+        "/snippets",
+        json={"title": "Secret", "language": "python", "code": "print('secret')"},
+        headers=test_user["headers"],
+    )
+    snippet_id = create_response.json()["id"]
+    assert create_response.json()["code"] == "print('secret')"
+
+    stored = db_session.get(models.Snippet, snippet_id)
+    assert stored.code is None
+    assert stored.encrypted_code
+
+    response = client.get(f"/snippets/{snippet_id}", headers=test_user["headers"])
+    assert response.json()["code"] == "print('secret')"
+
+    response = client.get("/snippets", headers=test_user["headers"])
+    assert response.json()[0]["code"] == "print('secret')"
+
+
+def test_purge_plaintext(db_session):
+    """Test the purge command only nulls plaintext that matches the ciphertext"""
+    user = models.User(email="purge@example.com", hashed_password="x")
+    db_session.add(user)
+    db_session.flush()
+    good = models.Snippet(
+        title="Good",
+        language="python",
+        code="print(1)",
+        encrypted_code=mock_encryption_service.encrypt("print(1)"),
+        user_id=user.id,
+    )
+    bad = models.Snippet(
+        title="Bad",
+        language="python",
+        code="print(2)",
+        encrypted_code=mock_encryption_service.encrypt("something else"),
+        user_id=user.id,
+    )
+    db_session.add_all([good, bad])
+    db_session.commit()
+
+    purged, skipped = purge_plaintext(
+        session_factory=lambda: db_session, service=mock_encryption_service
+    )
+
+    assert purged == 1
+    assert skipped == [bad.id]
+    assert db_session.get(models.Snippet, good.id).code is None
+    assert db_session.get(models.Snippet, bad.id).code == "print(2)"
+
+
+def test_bulk_import_and_export(client, test_user, db_session, monkeypatch):
+    """Test NDJSON import in batches and a streamed export of the same data"""
+    monkeypatch.setattr(settings, "BULK_BATCH_SIZE", 2)
+    lines = [
+        json.dumps({"title": f"Bulk {i}", "language": "python", "code": f"x = {i}"})
+        for i in range(5)
+    ]
+    response = client.post(
+        "/snippets/bulk",
+        content="\n".join(lines) + "\n\n",
+        headers={**test_user["headers"], "Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    assert response.json() == {"imported": 5}
+
+    audits = db_session.query(models.AuditLog).filter_by(action="BULK_CREATE").all()
+    assert len(audits) == 1
+    assert audits[0].details == "Imported 5 snippets"
+
+    response = client.get("/snippets/export", headers=test_user["headers"])
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert [item["title"] for item in exported] == [f"Bulk {i}" for i in range(5)]
+    assert [item["code"] for item in exported] == [f"x = {i}" for i in range(5)]
+
+
+def test_export_uses_one_session(client, test_user, opened_sessions):
+    """Test auth and the streamed export share the request's session"""
+    auth.clear_auth_caches()
+    response = client.get("/snippets/export", headers=test_user["headers"])
+    assert response.status_code == 200
+    assert len(opened_sessions) == 1
+
+
+def test_bulk_import_rejects_invalid_line(client, test_user, db_session):
+    """Test a bad line fails the whole import without inserting anything"""
+    body = (
+        json.dumps({"title": "Fine", "language": "python", "code": "pass"})
+        + "\n"
+        + json.dumps({"title": "Missing code", "language": "python"})
+    )
+    response = client.post("/snippets/bulk", content=body, headers=test_user["headers"])
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("Line 2: code")
+    assert db_session.query(models.Snippet).count() == 0
+
+    response = client.post(
+        "/snippets/bulk", content="{not json", headers=test_user["headers"]
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Line 1: invalid JSON"
+
+
+def test_conditional_get_skips_decryption(client, test_user, monkeypatch):
+    """Test If-None-Match returns 304 without decrypting snippet code"""
+    headers = test_user["headers"]
+    snippet_id = client.post(
+        "/snippets",
+        json={"title": "Polled", "language": "python", "code": "print(1)"},
+        headers=headers,
+    ).json()["id"]
+
+    response = client.get(f"/snippets/{snippet_id}", headers=headers)
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"] == "private, no-cache"
+    list_response = client.get("/snippets", headers=headers)
+    list_etag = list_response.headers["ETag"]
+
+    def fail(items):
+        raise AssertionError("decrypted on a conditional request")
+
+    monkeypatch.setattr(mock_encryption_service, "decrypt_many", fail)
+    response = client.get(
+        f"/snippets/{snippet_id}", headers={**headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    response = client.get(
+        "/snippets", headers={**headers, "If-None-Match": f'"other", W/{list_etag}'}
+    )
+    assert response.status_code == 304
+    monkeypatch.undo()
+
+    # A new snippet changes the list representation
+    client.post(
+        "/snippets",
+        json={"title": "New", "language": "python", "code": "print(2)"},
+        headers=headers,
+    )
+    response = client.get("/snippets", headers={**headers, "If-None-Match": list_etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != list_etag
+
+
+def test_conditional_get_shared_requires_password(client, test_user):
+    """Test a matching ETag does not bypass the share password"""
+    snippet_id = client.post(
+        "/snippets",
+        json={"title": "Shared", "language": "python", "code": "print(3)"},
+        headers=test_user["headers"],
+    ).json()["id"]
+    token = client.post(
+        f"/snippets/{snippet_id}/share",
+        json={"expires_hours": 1, "password": "sharepass"},
+        headers=test_user["headers"],
+    ).json()["token"]
+
+    response = client.request("GET", f"/shared/{token}", json={"password": "sharepass"})
+    etag = response.headers["ETag"]
+
+    response = client.request(
+        "GET", f"/shared/{token}", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 401
+    response = client.request(
+        "GET",
+        f"/shared/{token}",
+        json={"password": "sharepass"},
+        headers={"If-None-Match": etag},
+    )
+    assert response.status_code == 304